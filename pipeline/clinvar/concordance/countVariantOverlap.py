@@ -4,129 +4,105 @@ countVariantOverlap: count how often the same variant is reported by
 different submittors, and how concordant those submitters are or are not.
 """
 import argparse
-import csv
-import re
-
-class submitterPair:
-
-    def __init__(self):
-        self.totalVariants = 0
-        self.conflictingVariants = 0
-
-class variantData:
-
-    def __init__(self, id, submitter, clinicalSignificance, row):
-        self.id = id
-        self.submitters = list()
-        self.pathogenicSubmissions = list()
-        self.nonPathogenicSubmissions = list()
-        self.rows = list()
-        self.newSubmission(submitter, clinicalSignificance, row)
-
-    def isPathogenic(self, clinicalSignificance):
-        if re.search(r'(?i)Pathogenic', clinicalSignificance):
-            return True
-        else:
-            return False
-
-    def newSubmission(self, submitter, clinicalSignificance, row):
-        self.submitters.append(submitter)
-        self.rows.append(row)
-        if self.isPathogenic(clinicalSignificance):
-            self.pathogenicSubmissions.append(submitter)
-        else:
-            self.nonPathogenicSubmissions.append(submitter)
-
-    def hasDiscordantSubmissions(self):
-        if len(self.pathogenicSubmissions) != len(self.submitters) and \
-           len(self.nonPathogenicSubmissions) != len(self.submitters):
-            return True
-        else:
-            return False
-
-    def report(self, verbose=False):
-        if self.hasDiscordantSubmissions() or verbose:
-            print self.id, "DISCORDANT", 
-            print "pathogenic submissions:", self.pathogenicSubmissions,
-            print "nonpathogenic submission", self.nonPathogenicSubmissions
-    
-def headerLineToColumnIndex(contents):
-    """Given a line of header information, return a dictionary indicating
-    which column is in which position"""
-    columnIndex = dict()
-    for ii in range(0, len(contents)):
-        columnIndex[contents[ii]] = ii
-    return columnIndex
-
-def addNewSubmitter(submitterCounts, submitter):
-    """Add a new entry in this dict of dicts for this new submitter"""
-    if len(submitterCounts) == 0:
-        # Here is the case where the first submitter is being entered
-        submitterCounts[submitter] = dict()
-        submitterCounts[submitter][submitter] = list()
-    else:
-        submitterCounts[submitter] = dict()
-        submitterCounts[submitter][submitter] = list()
-        for existingSubmitter in submitterCounts.keys():
-            submitterCounts[existingSubmitter][submitter] = list()
-            submitterCounts[submitter][existingSubmitter] = list()
-    return submitterCounts
-
-def updateCounts(currentCounts, submitterA, submitterB, row):
-    """Update the number of counts for variants assessed (possibly differently)
-    by two different submitters"""
-    currentCounts[submitterA][submitterB].append(row)
-    currentCounts[submitterB][submitterA].append(row)
-    return currentCounts
-
-def conflictingAssessment(assessmentA, assessmentB):
-    """Return True if one assessment is pathogenic or likely pathogenic, and 
-    the other is either uncertain or benign or likely benign"""
-
-    if assessmentA == "Benign" or assessmentA == "Likely benign" or assessmentA == "Uncertain significance":
-        if assessmentB == "Pathogenic" or assessmentB == "Likely Pathogenic":
-            return True
-    if assessmentA == "Pathogenic" or assessmentA == "Likely pathogenic":
-        if assessmentB == "Benign" or assessmentB == "Likely benign" or assessmentB == "Uncertain significance":
-            return True
-    return False
-
-def printTotalCounts(variantsBySubmitter, submitters, sharedVariants, columnIndex):
+import itertools
+import operator
+import numpy as np
+import pandas as pd
+
+BENIGN = ["Benign", "Likely benign", "Uncertain significance"]
+PATHOGENIC = ["Pathogenic", "Likely pathogenic", "Likely Pathogenic"]
+
+def readSubmissions(inputFile):
+    """Read one row per submission, with trailing whitespace removed from
+    the submitter and clinical significance"""
+    submissions = pd.read_csv(inputFile, sep="\t", dtype=str,
+                              keep_default_na=False)
+    for column in ["Submitter", "ClinicalSignificance"]:
+        submissions[column] = submissions[column].str.rstrip()
+    return submissions
+
+def submitterCounts(submissions, submitters):
+    """Return, for each (variant, submitter), the number of submissions and
+    the number of benign and of pathogenic submissions"""
+    submissions = submissions.assign(
+        submitter=pd.Categorical(submissions.Submitter, categories=submitters).codes,
+        benign=submissions.ClinicalSignificance.isin(BENIGN).astype(np.int64),
+        pathogenic=submissions.ClinicalSignificance.isin(PATHOGENIC).astype(np.int64))
+    counts = submissions.groupby(["HGVS", "submitter"])[["benign", "pathogenic"]].sum()
+    counts["total"] = submissions.groupby(["HGVS", "submitter"]).size()
+    return counts.reset_index()
+
+def pairedCounts(counts, nSubmitters):
+    """Return the submitter x submitter matrices of shared and of conflicting
+    pairs of submissions, with the (variant, submitter A, submitter B) pairs
+    they come from.  Summing the products of the counts of two submitters
+    over the variants they share is the product of the variant x submitter
+    count matrices, accumulated here over the pairs that are not zero"""
+    pairs = counts.merge(counts, on="HGVS", suffixes=("A", "B"))
+    cell = (pairs.submitterA * nSubmitters + pairs.submitterB).values
+    size = nSubmitters * nSubmitters
+    shared = np.bincount(cell, weights=pairs.totalA * pairs.totalB, minlength=size)
+    conflicting = np.bincount(cell, weights=pairs.benignA * pairs.pathogenicB
+                              + pairs.pathogenicA * pairs.benignB, minlength=size)
+    shared = shared.reshape(nSubmitters, nSubmitters).astype(np.int64)
+    conflicting = conflicting.reshape(nSubmitters, nSubmitters).astype(np.int64)
+    # a submission is not shared with itself, while each pair of submissions
+    # by the same submitter counts once in either order
+    shared[np.diag_indices(nSubmitters)] -= counts.groupby("submitter").total.sum().reindex(
+        range(nSubmitters), fill_value=0).values
+    return shared, conflicting, pairs
+
+def printTotalCounts(submissions, submitters, pairs):
     """Output the total number of variants per submitter"""
     print "\nSubmitter\tSubmissions\tShared Submissions"
-    for submitterA in submitters:
-        sharedSubmissionsThisSubmitter = dict()
-        for submitterB in submitters:
-            if submitterB != submitterA:
-                for submission in sharedVariants[submitterA][submitterB]:
-                    variantName = submission[columnIndex["HGVS"]]
-                    sharedSubmissionsThisSubmitter[variantName] = 1
-        totalSharedSubmissions = len(sharedSubmissionsThisSubmitter.keys())
-        print "%s\t%d\t%d" % (submitterA, variantsBySubmitter[submitterA],
-                              totalSharedSubmissions)
+    nSubmissions = submissions.Submitter.value_counts()
+    others = pairs[pairs.submitterA != pairs.submitterB]
+    nShared = others.drop_duplicates(["HGVS", "submitterA"]).submitterA.value_counts()
+    for ii, submitterA in enumerate(submitters):
+        print "%s\t%d\t%d" % (submitterA, nSubmissions[submitterA],
+                              nShared.get(ii, 0))
 
 
-def printJointCounts(sharedVariants, conflictingVariants, submitters):
+def printJointCounts(shared, conflicting, submitters):
     """Output a matrix of joint counts by submitter A and submitter B"""
     print "\nShared Variants by Submitters: Total (Discordant)"
     for submitter in submitters:
         print "\t%s" % (submitter.split()[0]),
     print
-    for submitterA in submitters:
+    for ii, submitterA in enumerate(submitters):
         print submitterA.split()[0],
-        for submitterB in submitters:
-            print "\t%d (%d)" % (len(sharedVariants[submitterA][submitterB]),
-                                 len(conflictingVariants[submitterA][submitterB])),
+        for jj in range(len(submitters)):
+            print "\t%d (%d)" % (shared[ii, jj], conflicting[ii, jj]),
         print
 
-def printDiscordantVariants(variants):
+def printDiscordantVariants(submissions):
     """Output a summary of all conflicting variants, with the labs that 
     submitted them and their assessment"""
     print "\nAll discordant variants\n";
-    for variant in sorted(variants.keys()):
-        variants[variant].report()
-
-
+    pathogenic = submissions.ClinicalSignificance.str.contains("(?i)Pathogenic")
+    byVariant = pathogenic.groupby(submissions.HGVS)
+    discordant = (byVariant.transform("any").astype(bool) & ~byVariant.transform("all").astype(bool)).values
+    variants = submissions.HGVS.values[discordant]
+    # a stable sort keeps each variant's submissions in file order
+    order = np.argsort(variants, kind="mergesort")
+    rows = zip(variants[order], submissions.Submitter.values[discordant][order],
+               pathogenic.values[discordant][order])
+    for variant, variantRows in itertools.groupby(rows, key=operator.itemgetter(0)):
+        variantRows = list(variantRows)
+        print variant, "DISCORDANT", 
+        print "pathogenic submissions:", [submitter for (_, submitter, isPathogenic) in variantRows if isPathogenic],
+        print "nonpathogenic submission", [submitter for (_, submitter, isPathogenic) in variantRows if not isPathogenic]
+
+def printConflictingSubmissions(submissions):
+    """Output each pair of conflicting submissions of a variant"""
+    pairs = submissions.reset_index().merge(submissions.reset_index(), on="HGVS", suffixes=("", "Prev"))
+    pairs = pairs[(pairs["index"] > pairs["indexPrev"]) &
+                  ((pairs.ClinicalSignificance.isin(BENIGN) & pairs.ClinicalSignificancePrev.isin(PATHOGENIC)) |
+                   (pairs.ClinicalSignificance.isin(PATHOGENIC) & pairs.ClinicalSignificancePrev.isin(BENIGN)))]
+    for row in pairs.sort_values(["index", "indexPrev"]).itertuples():
+        print("%s: conflicting assessments of %s (%s) and %s (%s)"
+              % (row.HGVS, row.ClinicalSignificance, row.Submitter,
+                 row.ClinicalSignificancePrev, row.SubmitterPrev))
 
 
 def main():
@@ -135,58 +111,15 @@ def main():
     parser.add_argument("-d", "--debug", default=False)
     args = parser.parse_args()
 
-    variantsBySubmitter = dict()
-    variants = dict()
-    sharedVariants = dict()
-    confictingVariantsBySubmitter = dict()
-
-    reader = csv.reader(open(args.inputFile), delimiter='\t')
-    columnIndex = headerLineToColumnIndex(reader.next())
-    for row in reader:
-        variant = row[columnIndex["HGVS"]]
-        submitter = row[columnIndex["Submitter"]]
-        submitter = re.sub("(\s)*$", "", submitter)  # remove any trailing whitespace
-        clinicalSignificance = row[columnIndex["ClinicalSignificance"]]
-        clinicalSignificance = re.sub("(\s)*$", "", clinicalSignificance)  
-        #
-        # If this is a new submitter, give this submitter a slot in the
-        # count data.
-        if not variantsBySubmitter.has_key(submitter):
-            sharedVariants = addNewSubmitter(sharedVariants, submitter)
-            confictingVariantsBySubmitter = addNewSubmitter(confictingVariantsBySubmitter,
-                                                            submitter)
-            variantsBySubmitter[submitter] = 0
-        variantsBySubmitter[submitter] += 1
-        #
-        # If this variant hasn't been seen before, record seeing it for 
-        # the first time.  Else, it's been submitted by another lab,
-        # and then update the counts for sharedVariants and for
-        # confictingVariantsBySubmitter if appropriate.
-        if not variants.has_key(variant):
-            variants[variant] = variantData(variant, submitter, clinicalSignificance, row)
-        else:
-            for previousRow in variants[variant].rows:
-                prevSubmitter = previousRow[columnIndex["Submitter"]]
-                prevSubmitter = re.sub("(\s)*$", "", prevSubmitter) 
-                prevSignificance = previousRow[columnIndex["ClinicalSignificance"]]
-                prevSignificance = re.sub("(\s)*$", "", prevSignificance)  
-                sharedVariants = updateCounts(sharedVariants, submitter, 
-                                              prevSubmitter, row)
-                if conflictingAssessment(clinicalSignificance, 
-                                         prevSignificance):
-                    confictingVariantsBySubmitter = updateCounts(confictingVariantsBySubmitter,
-                                                                 submitter, prevSubmitter, row)
-                    if args.debug:
-                        print("%s: conflicting assessments of %s (%s) and %s (%s)" 
-                              % (variant, clinicalSignificance, submitter, prevSignificance,
-                                 prevSubmitter))
-            variants[variant].newSubmission(submitter, clinicalSignificance, row)
-
-    submitters = sorted(variantsBySubmitter.keys())
-    printDiscordantVariants(variants)
-    printTotalCounts(variantsBySubmitter, submitters, sharedVariants, 
-                     columnIndex)
-    printJointCounts(sharedVariants, confictingVariantsBySubmitter, submitters)
+    submissions = readSubmissions(args.inputFile)
+    submitters = sorted(submissions.Submitter.unique())
+    counts = submitterCounts(submissions, submitters)
+    shared, conflicting, pairs = pairedCounts(counts, len(submitters))
+    if args.debug:
+        printConflictingSubmissions(submissions)
+    printDiscordantVariants(submissions)
+    printTotalCounts(submissions, submitters, pairs)
+    printJointCounts(shared, conflicting, submitters)
 
 
 if __name__ == "__main__":
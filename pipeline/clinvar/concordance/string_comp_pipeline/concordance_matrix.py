@@ -7,8 +7,10 @@ this script compares the concordance of variant submitters by comparing variants
 import operator
 import sys
 import argparse
+import itertools
 import string_comp
 import transpose_variant as tv
+import numpy as np
 import pandas as pd
 
 
@@ -27,98 +29,83 @@ def main():
     analysis_by_string_genomic_coor()
 
 def analysis_by_string_genomic_coor():
-    all_dict = {}
+    df = pd.read_csv(IN_FILE, sep="\t", dtype=str)
+    submissions = separate_submitters(df, True)
 
     print "number of equivalent variant within one submitter (discordant submissions)"
-    for submitter in SUBMITTERS:
-        this_dict = separate_submitter(submitter, True)
-        all_dict[submitter] = this_dict
+    by_id = submissions.groupby(["submitter", "id"], sort=False).pathogenic
+    repeats = pd.DataFrame({"n_submissions": by_id.size(),
+                            "discordant": by_id.any() & ~by_id.all()})
+    by_submitter = repeats.groupby(level="submitter")
+    n_repeat_ids = by_submitter.n_submissions.sum() - by_submitter.size()
+    n_discordance = by_submitter.discordant.sum()
+    for i, submitter in enumerate(SUBMITTERS):
+        print "{0}: {1} ({2})".format(submitter, n_repeat_ids.get(i, 0),
+                                      int(n_discordance.get(i, 0)))
+
+    (ids, reported, pathogenic) = significance_matrix(submissions)
 
     print "\nnumber of unique variants from each submitter:"
-    for key, value in all_dict.iteritems():
-        print key, len(value)
+    for submitter, n_variants in zip(SUBMITTERS, reported.sum(axis=0)):
+        print submitter, n_variants
 
     print "\nsubmitter1 and submitter2: common variants (discordant variants)"
-    calculate_concordance(all_dict)
-
-def calculate_concordance(all_dict):
-    compared_pairs = []
-    for submitter in all_dict.keys():
-        rest_submitter_list = all_dict.keys()
-        rest_submitter_list.remove(submitter)
-        for rest_submitter in rest_submitter_list:
-            if sorted([submitter, rest_submitter]) in compared_pairs:
-                continue
-            compare_two_dict(submitter, rest_submitter, all_dict)
-            compared_pairs.append(sorted([submitter, rest_submitter]))
-    
-def compare_two_dict(submitter1, submitter2, all_dict):
-    df = pd.read_csv(IN_FILE, sep="\t", dtype=str)
-    d1 = all_dict[submitter1]
-    d2 = all_dict[submitter2]
-    common = set(d1.keys()) & set(d2.keys())
-    disagreement = set()
-    discordant = set()
-    for key in common:
-        if d1[key] != d2[key]:
-            disagreement.add(key)
-        if is_discordant(d1[key], d2[key]):
-            discordant.add(key)
-    print "{0} and {1}: {2} ({3})".format(submitter1, submitter2,
-                                          len(common), len(discordant))
-    if len(discordant) != 0 and args.verbose:
-        print "-------------details----------------------"
-        for each_id in discordant:
-            rows_with_id = df[df.uniq_id == each_id]
-            print "id: ", each_id
-            for index, row in rows_with_id.iterrows():
-                print ",".join([row.HGVS, row.Submitter, row.ClinicalSignificance, str(row.VariantID)])
-        print "------------------------------------------"
-
-def is_discordant(term1, term2):
-    """assess concordinance based on invitae poster criteria"""
-    # if (term1 not in CLINSIGS) or (term2 not in CLINSIGS):
-    #     raise Exception("bad clincical description input")
-   
-    if "PATHO" in (term1.upper() + term2.upper()):
-        if ("PATHO" in term1.upper()) and ("PATHO" in term2.upper()):
-            return False
-        else:
-            return True
-    else:
-        return False
+    calculate_concordance(df, ids, reported, pathogenic)
 
-def separate_submitter(submitter_abbrev, string_level):
-    """save variant id from one submitter in one dictionary
+def significance_matrix(submissions):
+    """pivots the submissions to variant x submitter matrices of whether the
+    submitter reported the variant, and whether its last submission of the
+    variant is pathogenic
     !!! if one submitter has multiple submission of the same variant,
     only the last submision is recorded
     """
-    df = pd.read_csv(IN_FILE, sep="\t", dtype=str)
-    submitter_dict = {}
-    repeat_id = {}
-    n_repeat_ids = 0
-    for index, row in df.iterrows():
-        if string_level:
-            this_id = row.uniq_id
-        else:
-            this_id = row.VariantID
-        if submitter_abbrev in row.Submitter:
-            if this_id not in repeat_id:
-                repeat_id[this_id] = [row.ClinicalSignificance]
-            else:
-                repeat_id[this_id].append(row.ClinicalSignificance)
-                n_repeat_ids += 1
-            submitter_dict[this_id] = row.ClinicalSignificance
-
-    n_discordance = 0
-    for each_id, pathos in repeat_id.iteritems():
-        if len(pathos) > 1:
-            if not tv.decide_concordance(set(pathos)):
-                n_discordance += 1
-
-    print "{0}: {1} ({2})".format(submitter_abbrev, n_repeat_ids, n_discordance)
-
-    return submitter_dict
+    latest = submissions.drop_duplicates(["submitter", "id"], keep="last")
+    (rows, ids) = pd.factorize(latest.id)
+    columns = latest.submitter.values
+    reported = np.zeros((len(ids), len(SUBMITTERS)), dtype=bool)
+    pathogenic = np.zeros((len(ids), len(SUBMITTERS)), dtype=bool)
+    reported[rows, columns] = True
+    pathogenic[rows, columns] = latest.pathogenic.values
+    return (ids, reported, pathogenic)
+
+def calculate_concordance(df, ids, reported, pathogenic):
+    # two submitters are discordant on a variant if exactly one of them calls it pathogenic
+    n_reported = reported.astype(np.int64)
+    n_pathogenic = (reported & pathogenic).astype(np.int64)
+    n_other = (reported & ~pathogenic).astype(np.int64)
+    common = n_reported.T.dot(n_reported)
+    discordant = n_pathogenic.T.dot(n_other) + n_other.T.dot(n_pathogenic)
+
+    if args.verbose:
+        # variant x submitter x submitter
+        discordance = (reported[:, :, None] & reported[:, None, :] &
+                       (pathogenic[:, :, None] != pathogenic[:, None, :]))
+        rows_by_id = df.groupby("uniq_id").indices
+
+    for i, j in itertools.combinations(range(len(SUBMITTERS)), 2):
+        print "{0} and {1}: {2} ({3})".format(SUBMITTERS[i], SUBMITTERS[j],
+                                              common[i, j], discordant[i, j])
+        if discordant[i, j] != 0 and args.verbose:
+            print "-------------details----------------------"
+            for each_id in ids[discordance[:, i, j]]:
+                print "id: ", each_id
+                for index, row in df.iloc[rows_by_id.get(each_id, [])].iterrows():
+                    print ",".join([row.HGVS, row.Submitter, row.ClinicalSignificance, str(row.VariantID)])
+            print "------------------------------------------"
+
+def separate_submitters(df, string_level):
+    """returns one row per submission of one of SUBMITTERS, in file order,
+    with the submitter's index, the variant id and whether it is pathogenic"""
+    submitted = tv.submitter_matrix(df.Submitter)
+    (rows, submitters) = np.nonzero(submitted.values)
+    if string_level:
+        ids = df.uniq_id
+    else:
+        ids = df.VariantID
+    return pd.DataFrame({"submitter": submitters,
+                         "id": ids.values[rows],
+                         "pathogenic": tv.is_pathogenic(df.ClinicalSignificance).values[rows]},
+                        columns=["submitter", "id", "pathogenic"])
 
 if __name__=="__main__":
     main()
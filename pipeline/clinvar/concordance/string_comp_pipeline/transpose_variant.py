@@ -23,65 +23,70 @@ def main():
 
 def transpose():
     df = pd.read_csv(IN_FILE, sep="\t")
-    uniq_id_dict = {}
-
-    for index, row in df.iterrows():
-        this_submission = "|".join(
-                [row.ClinicalSignificance, row.DateLastUpdated, row.DateCreated, row.SCV])
-        if row.uniq_id not in uniq_id_dict.keys():
-            uniq_id_dict[row.uniq_id] = {"HGVS": set([row.HGVS]),
-                                         "Invitae": [],
-                                         "GeneDx": [],
-                                         "Ambry": [],
-                                         "Emory": [],
-                                         "Children": [],
-                                         "SCRP": [],
-                                         "Counsyl": []}
-            for submitter_abrev in SUBMITTERS:
-                if submitter_abrev.upper() in row.Submitter.upper():
-                    uniq_id_dict[row.uniq_id][submitter_abrev].append(this_submission)
-        else:
-            uniq_id_dict[row.uniq_id]["HGVS"].add(row.HGVS)
-            for submitter_abrev in SUBMITTERS:
-                if submitter_abrev.upper() in row.Submitter.upper():
-                    uniq_id_dict[row.uniq_id][submitter_abrev].append(this_submission)
-
+    submissions = df.ClinicalSignificance.str.cat(
+            [df.DateLastUpdated, df.DateCreated, df.SCV], sep="|")
 
-    # transform the format to fit pandas.dataframe
-    row_list = []
-    for uniq_id, value in uniq_id_dict.iteritems():
-        this_dict = {"uniq_id": uniq_id}
-        this_dict["HGVS"] = "|".join(list(value["HGVS"]))
-        for submitter_abrev in SUBMITTERS:
-            this_dict[submitter_abrev] = ",".join(value[submitter_abrev])
-        row_list.append(this_dict)
+    # one row per uniq_id, in order of first appearance
+    transposed_df = pd.DataFrame({"HGVS": join_groups(df.HGVS, df.uniq_id, "|", distinct=True)})
+    submitted = submitter_matrix(df.Submitter, case=False)
+    for submitter_abrev in SUBMITTERS:
+        rows = submitted[submitter_abrev]
+        transposed_df[submitter_abrev] = join_groups(submissions[rows], df.uniq_id[rows], ",")
 
-    transposed_df = pd.DataFrame(row_list)
-    transposed_df = transposed_df[COLUMNS]
-    transposed_df.to_csv(OUT_FILE, sep="\t", dtype=str, index=False)
+    transposed_df.index.name = "uniq_id"
+    transposed_df = transposed_df.reset_index()[COLUMNS]
+    transposed_df.to_csv(OUT_FILE, sep="\t", index=False)
 
 def add_concordance():
     df = pd.read_csv(OUT_FILE, sep="\t", dtype=str)
-    n_submitters = []
-    n_submissions = []
-    concordance = []
-    for index, row in df.iterrows():
-        n_submission = 0
-        n_submitter = 0
-        reported_results = set()
-        for submitter in SUBMITTERS:
-            if not pd.isnull(row[submitter]):
-                n_submitter += 1
-                for report in row[submitter].split(","):
-                    reported_results.add(report.split("|")[0])
-                n_submission += len(row[submitter].split(","))
-        n_submitters.append(n_submitter)
-        n_submissions.append(n_submission)
-        concordance.append(decide_concordance(reported_results))
-    df["num_submitters"] = pd.DataFrame(n_submitters)
-    df['concordance'] = pd.DataFrame(concordance)
-    df.to_csv(OUT_FILE+".add_concordance", sep="\t", index=False, dtype=str)
-
+    submitted = df[SUBMITTERS]
+    df["num_submitters"] = submitted.notnull().sum(axis=1)
+
+    # the clinical significance of every report, the text before the first "|"
+    # of each comma separated submission, indexed by row, submitter and report
+    significance = submitted.stack().str.extractall(r"(?:^|,)([^|,]*)")[0]
+    pathogenic = is_pathogenic(significance)
+    row = significance.index.get_level_values(0)
+    any_pathogenic = pathogenic.groupby(row).any().reindex(df.index, fill_value=False)
+    any_other = (~pathogenic).groupby(row).any().reindex(df.index, fill_value=False)
+    df['concordance'] = ~(any_pathogenic & any_other)
+    df.to_csv(OUT_FILE+".add_concordance", sep="\t", index=False)
+
+def join_groups(values, keys, sep, distinct=False):
+    """returns a Series indexed by key, in order of first appearance, of the
+    values of each key joined by sep in order, or as a set if distinct"""
+    (codes, uniques) = pd.factorize(keys)
+    order = np.argsort(codes, kind="mergesort")
+    values = values.values[order]
+    sizes = np.bincount(codes, minlength=len(uniques))
+    ends = np.cumsum(sizes)
+    starts = ends - sizes
+    joined = []
+    for start, end in zip(starts, ends):
+        group = values[start:end]
+        joined.append(sep.join(set(group) if distinct else group))
+    return pd.Series(joined, index=uniques)
+
+def submitter_matrix(submitters, case=True):
+    """returns a boolean DataFrame with a column per SUBMITTERS abbreviation,
+    True where the abbreviation is part of the Submitter"""
+    return pd.DataFrame(dict((submitter_abrev, for_distinct(submitters, lambda names: names.str.contains(
+                                  submitter_abrev, case=case, regex=False, na=False)))
+                             for submitter_abrev in SUBMITTERS),
+                        columns=SUBMITTERS)
+
+def is_pathogenic(significance):
+    """True for the clinical significances that count as pathogenic in is_discordant"""
+    return for_distinct(significance,
+                        lambda terms: terms.str.upper().str.contains("PATHO", regex=False, na=False))
+
+def for_distinct(values, test):
+    """applies test, returning booleans for a Series, to the distinct values
+    only; missing values are False"""
+    (codes, uniques) = pd.factorize(values)
+    # missing values have code -1, the False appended last
+    results = np.append(test(pd.Series(uniques)).values.astype(bool), False)
+    return pd.Series(results[codes], index=values.index)
 
 def decide_concordance(patho_set):
     if len(patho_set) == 1:
@@ -1,10 +1,11 @@
 #!/usr/bin/env python
 import argparse
 import os
-import vcf
 import logging
 import csv
 import urllib
+import sites_vcf
+from variant_table import EncodedRows, format_cell
 from variant_merging import (
      add_columns_to_enigma_data,
      associate_chr_pos_ref_alt_with_enigma_item,
@@ -24,28 +25,20 @@ from variant_merging import (
      FIELD_DICT,
      ENIGMA_FILE,
      GENOME1K_FIELDS,
-     LOVD_FIELDS
+     LOVD_FIELDS,
+     OUTPUT_BUFFER_SIZE
      )
 
 
 def write_reports_tsv(filename, columns, ready_files_dir):
-    reports_output = open(filename, "w")
-
     reports_files = [ready_files_dir + r for r in get_reports_files(ready_files_dir)]
 
     reports = aggregate_reports(reports_files, columns)
 
+    reports_output = open(filename, "w", OUTPUT_BUFFER_SIZE)
     reports_output.write("\t".join(columns)+"\n")
 
-    for report in reports:
-        if len(report) != len(columns):
-            raise Exception("mismatching number of columns in head and row")
-        for ii in range(len(report)):
-            if type(report[ii]) == list:
-                comma_delimited_string = ",".join(str(xx) for xx in report[ii])
-                report[ii] = comma_delimited_string
-            elif type(report[ii]) == int:
-                report[ii] = str(report[ii])
+    for report in reports.formatted_rows(format_cell):
         reports_output.write("\t".join(report)+"\n")
 
     reports_output.close()
@@ -55,13 +48,13 @@ def write_reports_tsv(filename, columns, ready_files_dir):
 
 
 def aggregate_reports(reports_files, columns):
-    # Gathers all reports from an input directory, normalizes them, and combines them into a single list.
-    reports = []
+    # Gathers all reports from an input directory, normalizes them, and combines them into a single table.
+    # The reports are kept as dictionary codes, so repeated submitters and significances are stored once.
+    reports = EncodedRows(columns)
 
     for file in reports_files:
-        file_reports = normalize_reports(file, columns)
+        reports.extend(iter_normalized_reports(file, columns))
         print "finished normalizing %s" % (file)
-        reports = reports + file_reports
 
     return reports
 
@@ -76,6 +69,11 @@ def get_reports_files(input_directory):
 
 
 def normalize_reports(file, columns):
+    return list(iter_normalized_reports(file, columns))
+
+
+def iter_normalized_reports(file, columns):
+    # Yields the reports of a file one at a time, so they can be encoded without holding the whole file.
     filename, file_extension = os.path.splitext(file)
     if file_extension == ".vcf":
         reports = normalize_vcf_reports(file, columns, filename, file_extension)
@@ -86,20 +84,18 @@ def normalize_reports(file, columns):
     for report in reports:
         if len(report) != len(columns):
             report += [DEFAULT_CONTENTS] * len(FIELD_DICT[source])
-    for report in reports:
         if len(report) != len(columns):
             raise Exception("mismatching number of columns in head and row")
-    return reports
+        yield report
 
 
 def normalize_vcf_reports(file, columns, filename, file_extension):
-    reports = []
     if "clinvar" in filename.lower():
         # Descriptions and Summary Evidence in clinvar contain spaces -- cause strict whitespace failure
         strict_whitespace = False
     else:
         strict_whitespace = True
-    reader = vcf.Reader(open(file, "r"), strict_whitespace=strict_whitespace)
+    reader = sites_vcf.Reader(open(file, "r"), strict_whitespace=strict_whitespace)
     count = 0
     source_suffix = ".vcf"
     source = os.path.basename(file)[:-len(source_suffix)]
@@ -119,12 +115,10 @@ def normalize_vcf_reports(file, columns, filename, file_extension):
                     report[column_index] = record.INFO[value]
             except KeyError:
                 raise Exception("WARNING: Key error with report: %s \n\nError on value: %s \n\n Error in record.INFO: %s \n\nNeeds attn." % (report, value, record.INFO))
-        reports.append(report)
-    return reports
+        yield report
 
 
 def normalize_enigma_tsv_reports(file, columns, filename, file_extension):
-    reports = []
     enigma_file = open(file, 'r')
     line_num = 0
     enigma_column_indexes = {}
@@ -139,6 +133,5 @@ def normalize_enigma_tsv_reports(file, columns, filename, file_extension):
             report = ['-'] * len(columns)
             for key, value in enigma_column_indexes.iteritems():
                 report[columns.index(value)] = items[key]
-            reports.append(report)
+            yield report
     enigma_file.close()
-    return reports
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+"""
+Benchmarks variant_merging.py on synthetic inputs at multiples of the
+current number of reports per source.
+
+For each scale, an input directory is generated with an ENIGMA TSV and the
+seven source VCFs under the names variant_merging.py reads. Their headers
+and INFO values are taken from the files in test_files, and the variants
+are drawn from the hg38 BRCA1 and BRCA2 reference regions. About half of the
+reports of a source are drawn from a pool shared by all sources. This gives
+overlaps between sources and repeats within a source. A quarter of the
+variants are single-unit insertions or deletions placed at random
+offsets in homopolymer and dinucleotide runs, so the same variant is
+reported in several representations that variant_equal has to merge.
+Deletions from ClinVar are written with "-" as ALT, as ClinVar writes
+them.
+
+variant_merging.py is then run on each input directory in a separate
+process, so peak memory is measured per run. Its merge_profile.json is
+collected into one JSON report, with the throughput of every stage added.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# aggregate_reports imports names from variant_merging, so it is imported first
+import aggregate_reports
+import reference_regions
+import variant_merging
+
+VERSION = 1
+
+# approximate number of reports per source in a current release, the 1x scale
+BASE_COUNTS = {"ENIGMA": 3500,
+               "ClinVar": 12000,
+               "LOVD": 5000,
+               "exLOVD": 1500,
+               "BIC": 4000,
+               "ExAC": 4500,
+               "ESP": 2500,
+               "1000_Genomes": 1200}
+
+# the input file of each source and the test file its header and INFO values come from
+SOURCE_FILES = {"ClinVar": (variant_merging.CLINVAR_FILE, "ClinVar.vcf"),
+                "LOVD": (variant_merging.LOVD_FILE, "LOVD.vcf"),
+                "exLOVD": (variant_merging.EX_LOVD_FILE, "exLOVD.vcf"),
+                "BIC": (variant_merging.BIC_FILE, "BIC.vcf"),
+                "ExAC": (variant_merging.EXAC_FILE, "ExAC_AF.vcf"),
+                "ESP": (variant_merging.ESP_FILE, "ESP.vcf"),
+                "1000_Genomes": (variant_merging.GENOME1K_FILE, "1000_Genomes.vcf")}
+
+# files written in the order reports were generated instead of by position
+UNSORTED_SOURCES = ["ClinVar"]
+
+TEST_FILES = os.path.join(os.path.dirname(os.path.realpath(__file__)), "test_files")
+
+BX_ID_PATTERN = re.compile(r"(^|;)BX_ID=[^;]*")
+
+REPEAT_PATTERNS = [re.compile(r"([ACGT])\1{3,}"), re.compile(r"([ACGT]{2})\1{2,}")]
+
+INDEL_FRACTION = 0.25
+SHARED_FRACTION = 0.5
+
+
+def options(parser):
+    parser.add_argument("-r", "--reference", help="reference data directory",
+                        default="/home/brca/pipeline-data/pipeline-resources/")
+    parser.add_argument("-s", "--scales", type=int, nargs="+", default=[1, 10, 100],
+                        help="multiples of the current number of reports to benchmark")
+    parser.add_argument("-w", "--work_dir",
+                        help="directory for the generated inputs and merge outputs, "
+                             "a temporary directory that is removed afterwards by default")
+    parser.add_argument("-o", "--output", default="merge_benchmark.json",
+                        help="JSON report of the profiled runs")
+    parser.add_argument("--streaming", default=False, action="store_true",
+                        help="run variant_merging.py with --streaming")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="--jobs for variant_merging.py")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--generate_only", default=False, action="store_true",
+                        help="only generate the inputs of each scale into the work directory")
+
+
+class RegionSampler(object):
+    """draws random variants in VCF representation from one reference region"""
+
+    def __init__(self, chrom, start, sequence, rng):
+        self.chrom = chrom
+        self.start = start
+        self.sequence = str(sequence)
+        self.rng = rng
+        # (index of the first base, repeat unit, number of units) of each run
+        self.runs = [(match.start(), match.group(1), len(match.group(0)) // len(match.group(1)))
+                     for pattern in REPEAT_PATTERNS for match in pattern.finditer(self.sequence)
+                     if match.start() > 0 and len(set(match.group(1))) == len(match.group(1))]
+
+    def position(self, index):
+        # 1-based genomic position of the base at index
+        return self.start + index + 1
+
+    def snv(self):
+        index = self.rng.randrange(1, len(self.sequence) - 1)
+        ref = self.sequence[index]
+        alt = self.rng.choice([base for base in "ACGT" if base != ref])
+        return (self.chrom, self.position(index), ref, alt)
+
+    def repeat_indel(self):
+        """inserts or deletes one unit of a repeat run, at any unit boundary
+        of the run, giving equivalent variants at different positions"""
+        (run_index, unit, units) = self.rng.choice(self.runs)
+        index = run_index + self.rng.randrange(units) * len(unit)
+        anchor = self.sequence[index - 1]
+        if self.rng.random() < 0.5:
+            return (self.chrom, self.position(index - 1), anchor + self.sequence[index:index + len(unit)], anchor)
+        return (self.chrom, self.position(index - 1), anchor, anchor + unit)
+
+    def variant(self):
+        if self.runs and self.rng.random() < INDEL_FRACTION:
+            return self.repeat_indel()
+        return self.snv()
+
+
+def samplers(reference_dir, rng):
+    regions = reference_regions.load(reference_dir)
+    return [RegionSampler(chrom, regions.start(chrom, "hg38"), regions.sequence(chrom, "hg38"), rng)
+            for chrom in ["13", "17"]]
+
+
+def draw_variants(region_samplers, shared, count, rng):
+    variants = []
+    for i in xrange(count):
+        if shared and rng.random() < SHARED_FRACTION:
+            variants.append(rng.choice(shared))
+        else:
+            variants.append(rng.choice(region_samplers).variant())
+    return variants
+
+
+def read_template(file_name):
+    """returns the header lines and the INFO column of each record of a test
+    file, without the BX_ID the pipeline adds"""
+    header = []
+    infos = []
+    with open(os.path.join(TEST_FILES, file_name), "r") as f:
+        for line in f:
+            if line.startswith("#"):
+                header.append(line)
+            elif line.strip():
+                info = BX_ID_PATTERN.sub("", line.rstrip("\n").split("\t")[7]).lstrip(";")
+                infos.append(info or ".")
+    return header, infos
+
+
+def dash_deletion(variant):
+    # ClinVar style, the deleted bases at their own position and no anchor base
+    (chrom, pos, ref, alt) = variant
+    if len(alt) == 1 and len(ref) > 1:
+        return (chrom, pos + 1, ref[1:], "-")
+    return variant
+
+
+def write_vcf(path, template, variants, rng, sort):
+    (header, infos) = read_template(template)
+    if sort:
+        variants = sorted(variants, key=lambda variant: (int(variant[0]), variant[1]))
+    with open(path, "w") as f:
+        f.writelines(header)
+        for (chrom, pos, ref, alt) in variants:
+            f.write("\t".join([chrom, str(pos), ".", ref, alt, ".", "PASS", rng.choice(infos)]) + "\n")
+
+
+def write_enigma(path, variants, rng):
+    with open(os.path.join(TEST_FILES, variant_merging.ENIGMA_FILE), "r") as f:
+        header = f.readline()
+        rows = [line.rstrip("\r\n").split("\t") for line in f if line.strip()]
+    columns = header.rstrip("\r\n").split("\t")
+    coordinate_column = columns.index("Genomic_Coordinate")
+    bx_id_column = columns.index("BX_ID")
+    with open(path, "w") as f:
+        f.write(header)
+        for bx_id, (chrom, pos, ref, alt) in enumerate(variants, 1):
+            row = list(rng.choice(rows))
+            row[coordinate_column] = "chr%s:%d:%s>%s" % (chrom, pos, ref, alt)
+            row[bx_id_column] = str(bx_id)
+            f.write("\t".join(row) + "\n")
+
+
+def generate_inputs(input_dir, reference_dir, scale, seed=0):
+    """writes the ENIGMA TSV and source VCFs for a scale into input_dir,
+    returns the number of reports of each source"""
+    rng = random.Random(seed)
+    region_samplers = samplers(reference_dir, rng)
+    counts = dict((source, int(count * scale)) for source, count in BASE_COUNTS.iteritems())
+    shared = draw_variants(region_samplers, None, sum(counts.values()) // 4, rng)
+
+    write_enigma(os.path.join(input_dir, variant_merging.ENIGMA_FILE),
+                 draw_variants(region_samplers, shared, counts["ENIGMA"], rng), rng)
+    for source, (file_name, template) in sorted(SOURCE_FILES.iteritems()):
+        variants = draw_variants(region_samplers, shared, counts[source], rng)
+        if source == "ClinVar":
+            variants = [dash_deletion(variant) for variant in variants]
+        write_vcf(os.path.join(input_dir, file_name), template, variants, rng,
+                  source not in UNSORTED_SOURCES)
+    return counts
+
+
+def run_merge(input_dir, output_dir, artifacts_dir, reference_dir, streaming=False, jobs=1):
+    """runs variant_merging.py in its own process and returns its merge profile"""
+    command = [sys.executable, "variant_merging.py",
+               "-i", os.path.join(input_dir, ""),
+               "-o", os.path.join(output_dir, ""),
+               "-a", os.path.join(artifacts_dir, ""),
+               "-r", os.path.join(reference_dir, ""),
+               "-j", str(jobs)]
+    if streaming:
+        command.append("--streaming")
+    # 1000g_preprocess.sh is run relative to the working directory
+    with open(os.path.join(artifacts_dir, "variant_merging.out"), "w") as log:
+        subprocess.check_call(command, cwd=os.path.dirname(os.path.realpath(__file__)),
+                              stdout=log, stderr=subprocess.STDOUT)
+    with open(os.path.join(artifacts_dir, "merge_profile.json"), "r") as f:
+        return json.load(f)
+
+
+def add_throughput(profile):
+    for stage in profile["stages"]:
+        records = stage["records_in"] if stage["records_in"] is not None else stage["records_out"]
+        if records is not None and stage["wall_seconds"] > 0:
+            stage["records_per_second"] = round(records / stage["wall_seconds"], 1)
+        else:
+            stage["records_per_second"] = None
+    return profile
+
+
+def print_run(run):
+    print "\nscale %dx, %d reports: %.1fs wall, %.1fs cpu, %d kB peak RSS" % (
+        run["scale"], sum(run["input_records"].values()),
+        run["wall_seconds"], run["cpu_seconds"], run["peak_rss_kb"])
+    print "%-26s %-14s %10s %12s %14s" % ("stage", "source", "wall (s)", "peak kB", "records/s")
+    for stage in run["stages"]:
+        print "%-26s %-14s %10.2f %12s %14s" % (
+            stage["stage"], stage["source"] or "", stage["wall_seconds"],
+            stage["peak_rss_kb"] if stage["peak_rss_kb"] is not None else "-",
+            stage["records_per_second"] if stage["records_per_second"] is not None else "-")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    options(parser)
+    args = parser.parse_args()
+    if args.generate_only and not args.work_dir:
+        parser.error("--generate_only needs a --work_dir to keep the inputs in")
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="merge_benchmark")
+    runs = []
+    try:
+        for scale in args.scales:
+            scale_dir = os.path.join(work_dir, "%dx" % scale)
+            dirs = dict((name, os.path.join(scale_dir, name)) for name in ["input", "output", "artifacts"])
+            for path in dirs.values():
+                if not os.path.isdir(path):
+                    os.makedirs(path)
+            print "generating %dx inputs in %s" % (scale, dirs["input"])
+            counts = generate_inputs(dirs["input"], args.reference, scale, args.seed)
+            if args.generate_only:
+                continue
+
+            print "merging %dx inputs" % scale
+            profile = add_throughput(run_merge(dirs["input"], dirs["output"], dirs["artifacts"],
+                                               args.reference, args.streaming, args.jobs))
+            profile.update({"scale": scale,
+                            "streaming": args.streaming,
+                            "jobs": args.jobs,
+                            "input_records": counts})
+            runs.append(profile)
+            print_run(profile)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir)
+
+    if not args.generate_only:
+        with open(args.output, "w") as f:
+            json.dump({"version": VERSION, "seed": args.seed, "runs": runs}, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Times variant_equivalence.edits_equal against the previous approach of
+building both edited sequences, for references of increasing length. The
+windowed comparison should cost the same per call whatever the reference
+length.
+"""
+import argparse
+import random
+import timeit
+
+from variant_equivalence import edits_equal
+
+
+def options(parser):
+    parser.add_argument("-n", "--number", type=int, default=10000,
+                        help="number of comparisons timed per reference length")
+    parser.add_argument("-l", "--lengths", type=int, nargs="+",
+                        default=[10000, 100000, 1000000],
+                        help="reference lengths to benchmark")
+
+
+def full_copy_edits_equal(seq, pos1, ref_len1, alt1, pos2, ref_len2, alt2):
+    edited_v1 = seq[0:pos1] + alt1 + seq[pos1 + ref_len1:]
+    edited_v2 = seq[0:pos2] + alt2 + seq[pos2 + ref_len2:]
+    return edited_v1 == edited_v2
+
+
+def make_comparisons(seq, n):
+    # pairs of single base deletions a few bases apart, as in nearby reports
+    comparisons = []
+    for i in range(n):
+        pos1 = random.randint(1, len(seq) - 20)
+        pos2 = pos1 + random.randint(0, 10)
+        comparisons.append((seq, pos1, 2, seq[pos1], pos2, 2, seq[pos2]))
+    return comparisons
+
+
+def time_per_call(function, comparisons):
+    def run():
+        for comparison in comparisons:
+            function(*comparison)
+    return timeit.timeit(run, number=1) / len(comparisons)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    options(parser)
+    args = parser.parse_args()
+
+    random.seed(0)
+    print "%12s %18s %18s" % ("ref length", "full copy (us)", "windowed (us)")
+    for length in args.lengths:
+        seq = "".join(random.choice("ACGT") for i in xrange(length))
+        comparisons = make_comparisons(seq, args.number)
+        full = time_per_call(full_copy_edits_equal, comparisons)
+        windowed = time_per_call(edits_equal, comparisons)
+        print "%12d %18.2f %18.2f" % (length, full * 1e6, windowed * 1e6)
+
+
+if __name__ == "__main__":
+    main()
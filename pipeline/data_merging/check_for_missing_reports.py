@@ -8,7 +8,8 @@ import logging
 from os import listdir
 from os.path import isfile, join, abspath
 from aggregate_reports import get_reports_files
-import vcf
+import report_provenance
+import sites_vcf
 
 
 ARGS = None
@@ -22,6 +23,8 @@ def main():
     parser.add_argument("-r", "--ready_input_dir",
                         help="file directory with all procesed files with bx_ids used to compile built.tsv")
     parser.add_argument('-a', "--artifacts_dir", help='Artifacts directory with pipeline artifact files.')
+    parser.add_argument("-p", "--provenance",
+                        help="provenance.bin written by variant_merging.py, to also find reports lost in the merge")
     parser.add_argument("-v", "--verbose", action="count", default=True, help="determines logging")
 
     ARGS = parser.parse_args()
@@ -36,6 +39,10 @@ def main():
 
     logging.debug("Reports absent from release: %s", missing_reports)
 
+    if ARGS.provenance:
+        unmerged_reports = find_unmerged_reports(report_provenance.read(ARGS.provenance), bx_ids)
+        logging.debug("Reports absent from merged variants: %s", unmerged_reports)
+
 
 def get_bx_ids():
     # Get all bx_ids present in source files organized by source
@@ -51,16 +58,16 @@ def get_bx_ids():
             tsv_file = csv.DictReader(open(file_path, "r"), delimiter='\t')
             for report in tsv_file:
                 ids = map(int, report['BX_ID'].split(','))
-                bx_ids[source] = bx_ids[source] + ids
+                bx_ids[source].extend(ids)
         else:
             suffix = '.vcf'
             source = file[:(len(file)-len(suffix))]
             bx_ids[source] = []
-            vcf_reader = vcf.Reader(open(file_path, 'r'), strict_whitespace=True)
+            vcf_reader = sites_vcf.Reader(open(file_path, 'r'), strict_whitespace=True)
             try:
                 for record in vcf_reader:
                     ids = map(int, record.INFO['BX_ID'])
-                    bx_ids[source] = bx_ids[source] + ids
+                    bx_ids[source].extend(ids)
             except ValueError as e:
                 print e
 
@@ -73,6 +80,8 @@ def find_matches_per_source(bx_ids):
     column_prefix = "BX_ID_"
     bx_id_columns = [f for f in built.fieldnames if column_prefix in f]
     matches_per_source = {}
+    # sets of the ids of each source, so a report is looked up without scanning them all
+    source_ids = dict((source, set(ids)) for source, ids in bx_ids.iteritems())
     for variant in built:
         for column in bx_id_columns:
             source = column[len(column_prefix):]
@@ -93,7 +102,7 @@ def find_matches_per_source(bx_ids):
                 else:
                     source_bx_ids = map(int, source_bx_ids.split(','))
                     for source_bx_id in source_bx_ids:
-                        if source_bx_id in bx_ids[source]:
+                        if source_bx_id in source_ids[source]:
                             matches_per_source[source].append(source_bx_id)
                         else:
                             logging.warning("Report(s) %s found on variant %s, but report does not exist from source %s", source_bx_ids, variant, source)
@@ -109,6 +118,14 @@ def find_missing_reports(matches_per_source, bx_ids):
     return missing_reports
 
 
+def find_unmerged_reports(provenance, bx_ids):
+    # reports of each source that back none of the merged variants
+    unmerged_reports = {}
+    for source in provenance.sources:
+        unmerged_reports[source] = provenance.orphaned(source, bx_ids.get(source, []))
+    return unmerged_reports
+
+
 def get_set_of_ids(ids):
     id_set = set(ids)
     assert len(ids) == len(set(id_set))
@@ -0,0 +1,70 @@
+"""
+On-disk cache of canonical variant keys, so that finding equivalent variants
+only has to look at variant representations not seen in a previous run.
+
+The cache file is named after the version of the canonical keys, the
+reference build and a digest of the reference sequences, so a changed key
+function or reference never reuses stale keys.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import random
+import tempfile
+
+from variant_equivalence import CANONICAL_KEY_VERSION
+
+
+class EquivalenceCache(object):
+
+    def __init__(self, cache_dir, version, reference_sequences):
+        digest = hashlib.sha1()
+        for sequence in reference_sequences:
+            digest.update(sequence)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.path = os.path.join(cache_dir, "equivalence_k%d_%s_%s.pkl" %
+                                 (CANONICAL_KEY_VERSION, version, digest.hexdigest()))
+        self.keys = {}
+        self.hits = 0
+        self.misses = 0
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                self.keys = pickle.load(f)
+        logging.info("Loaded %d cached variant keys from %s", len(self.keys), self.path)
+
+    def key(self, v, compute_key):
+        """returns the cached key for (chr, pos, ref, alt), computing and
+        storing it with compute_key if it hasn't been seen before"""
+        v = _normalize(v)
+        if v in self.keys:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.keys[v] = compute_key(v)
+        return self.keys[v]
+
+    def spot_check(self, compute_key, sample_size):
+        """recomputes the keys of up to sample_size cached variants, returns
+        those whose cached key is wrong"""
+        sample = random.sample(self.keys.keys(), min(sample_size, len(self.keys)))
+        mismatches = [v for v in sample if compute_key(v) != self.keys[v]]
+        for v in mismatches:
+            logging.warning("Cached key for %s is %s, expected %s", v, self.keys[v], compute_key(v))
+        return mismatches
+
+    def clear(self):
+        self.keys = {}
+
+    def save(self):
+        # write to a temporary file first so an interrupted run can't leave a truncated cache
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path))
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(self.keys, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(temp_path, self.path)
+
+
+def _normalize(v):
+    chr, pos, ref, alt = v
+    return (str(chr), int(pos), ref, alt)
@@ -0,0 +1,203 @@
+"""
+Lifts VCF records from hg19 to hg38 in-process, instead of running CrossMap
+over a whole-genome chain file and reference for a few hundred kb.
+
+Only the chain blocks overlapping the BRCA1 and BRCA2 regions of the source
+build are loaded, into an index of blocks sorted by start per chromosome, and
+reference alleles of the target build are taken from the packed reference
+regions. Records are lifted the way CrossMap 0.2.6 lifts them, so the output
+is the same for records inside the regions: a record must overlap exactly one
+block, its REF is replaced by the target reference at the lifted position,
+and it is rejected if that REF equals its ALT. Records outside the regions,
+or lifted outside them, are rejected too. Rejected records are written to a
+separate file, <output>.unmap by default, as CrossMap does.
+"""
+import argparse
+import bisect
+import datetime
+import gzip
+import sys
+
+import reference_regions
+
+
+class Liftover(object):
+
+    def __init__(self, chain_path, reference, source_build="hg19", target_build="hg38"):
+        """reference is a ReferenceRegions, whose source_build regions
+        restrict the blocks loaded from chain_path"""
+        self.chain_path = chain_path
+        self.reference = reference
+        self.target_build = target_build
+        regions = {}
+        for (chrom, build), (start, offset, length) in reference.regions.items():
+            if build == source_build:
+                regions[chrom] = (start, start + length)
+        self.index = {}
+        for chrom, blocks in _read_chain(chain_path, regions).items():
+            blocks.sort()
+            self.index[chrom] = ([block[0] for block in blocks], blocks,
+                                 max(block[1] - block[0] for block in blocks))
+
+    def find(self, chrom, start, end):
+        """returns the blocks overlapping the 0-based half-open [start, end) of chrom"""
+        if chrom not in self.index:
+            return []
+        (starts, blocks, max_length) = self.index[chrom]
+        found = []
+        i = bisect.bisect_left(starts, end) - 1
+        # no block starting max_length or more before start can reach it
+        while i >= 0 and starts[i] > start - max_length:
+            if blocks[i][1] > start:
+                found.append(blocks[i])
+            i -= 1
+        found.reverse()
+        return found
+
+    def lift(self, chrom, pos, ref):
+        """returns the target chromosome, position and reference allele of the
+        allele ref at the 1-based pos of chrom, None if it can't be lifted"""
+        start = int(pos) - 1
+        end = start + len(ref)
+        blocks = self.find(_bare(chrom), start, end)
+        if len(blocks) != 1:
+            return None
+        (source_start, source_end, target_chrom, target_start, target_end, target_strand) = blocks[0]
+        # like CrossMap, the part of the allele outside the block is dropped
+        real_start = max(start, source_start)
+        size = min(end, source_end) - real_start
+        if target_strand == "+":
+            lifted_start = target_start + real_start - source_start
+        else:
+            lifted_start = target_end - (real_start - source_start) - size
+        lifted_ref = self._bases(target_chrom, lifted_start, lifted_start + size)
+        if lifted_ref is None:
+            return None
+        if not chrom.startswith("chr"):
+            target_chrom = _bare(target_chrom)
+        return (target_chrom, lifted_start + 1, lifted_ref)
+
+    def lift_fields(self, fields):
+        """returns the VCF fields of a record lifted to the target build,
+        None if the record can't be lifted"""
+        lifted = self.lift(fields[0], fields[1], fields[3])
+        if lifted is None or lifted[2] == fields[4]:
+            return None
+        return [lifted[0], str(lifted[1]), fields[2], lifted[2]] + list(fields[4:])
+
+    def lift_vcf(self, lines, out, unmapped):
+        """lifts the VCF lines to out, writing those that can't be lifted to
+        unmapped. returns the number of records and of unmapped records"""
+        total = 0
+        failed = 0
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("##"):
+                out.write(line + "\n")
+                unmapped.write(line + "\n")
+                continue
+            # CrossMap splits on any whitespace and writes tabs
+            fields = line.split(None, 7)
+            if fields[0].startswith("#"):
+                out.write("##liftOverProgram=liftover.py\n")
+                out.write("##liftOverFile=%s\n" % self.chain_path)
+                out.write("##new_reference_genome=%s\n" % self.target_build)
+                out.write("##liftOverTime=%s\n" % datetime.date.today().strftime("%B%d,%Y"))
+                out.write(line + "\n")
+                unmapped.write(line + "\n")
+                continue
+            total += 1
+            lifted = self.lift_fields(fields)
+            if lifted is None:
+                unmapped.write(line + "\n")
+                failed += 1
+            else:
+                out.write("\t".join(lifted) + "\n")
+        return (total, failed)
+
+    def _bases(self, chrom, start, end):
+        region = self.reference.regions.get((_bare(chrom), self.target_build))
+        if region is None:
+            return None
+        (region_start, offset, length) = region
+        if start < region_start or end > region_start + length:
+            return None
+        sequence = self.reference.sequence(_bare(chrom), self.target_build)
+        return str(sequence[start - region_start:end - region_start])
+
+
+def _bare(chrom):
+    return chrom[3:] if chrom.startswith("chr") else chrom
+
+
+def _read_chain(chain_path, regions):
+    """returns {chromosome: [(source start, source end, target chromosome,
+    target start, target end, target strand)]} of the aligned blocks of
+    chain_path overlapping regions, {chromosome: (start, end)}, with target
+    coordinates on the + strand"""
+    blocks = {}
+    opener = gzip.open if chain_path.endswith(".gz") else open
+    with opener(chain_path, "rb") as f:
+        keep = False
+        for line in f:
+            if line.startswith("chain"):
+                fields = line.split()
+                # chain score source-chrom size strand start end target-chrom size strand start end id
+                chrom = _bare(fields[2])
+                source_from = int(fields[5])
+                region = regions.get(chrom)
+                keep = region is not None and source_from < region[1] and int(fields[6]) > region[0]
+                if keep:
+                    if fields[4] != "+":
+                        raise Exception("Source strand in a chain file must be +: %s" % line)
+                    (target_chrom, target_size, target_strand) = (fields[7], int(fields[8]), fields[9])
+                    target_from = int(fields[10])
+                continue
+            # the block lines of chains outside the regions aren't even split
+            if not keep or line.startswith("#"):
+                continue
+            fields = line.split()
+            if not fields:
+                continue
+            size = int(fields[0])
+            if source_from < region[1] and source_from + size > region[0]:
+                if target_strand == "+":
+                    target = (target_from, target_from + size)
+                else:
+                    target = (target_size - (target_from + size), target_size - target_from)
+                blocks.setdefault(chrom, []).append((source_from, source_from + size, target_chrom,
+                                                     target[0], target[1], target_strand))
+            if len(fields) == 3:
+                source_from += size + int(fields[1])
+                target_from += size + int(fields[2])
+    return blocks
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Lift a VCF file of BRCA1 and BRCA2 variants from hg19 to hg38.")
+    parser.add_argument("-c", "--chain", required=True,
+                        help="hg19 to hg38 chain file, optionally gzipped")
+    parser.add_argument("-r", "--reference", required=True,
+                        help="directory with the brca*_hg*.txt reference sequences")
+    parser.add_argument("-i", "--input", type=argparse.FileType("r"), default=sys.stdin,
+                        help="hg19 VCF file, standard input by default")
+    parser.add_argument("-o", "--output", required=True,
+                        help="hg38 VCF file")
+    parser.add_argument("-u", "--unmapped",
+                        help="file of the records that could not be lifted, <output>.unmap by default")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    liftover = Liftover(args.chain, reference_regions.load(args.reference))
+    with open(args.output, "w") as out, open(args.unmapped or args.output + ".unmap", "w") as unmapped:
+        (total, failed) = liftover.lift_vcf(args.input, out, unmapped)
+    print >>sys.stderr, "Total entries: %d" % total
+    print >>sys.stderr, "Failed to map: %d" % failed
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Checkpoints of the variant table between the stages of variant_merging.py, so
+a run that fails in a late stage can be resumed from the last finished stage
+instead of from preprocessing.
+
+A checkpoint file starts with a header line holding the format version, the
+stage that wrote it and the SHA-1 of the payload. The payload is marshalled
+and holds the stage's state, the column names and the genomic coordinate of
+every row. Each column is stored as its value dictionary and the raw bytes
+of its array of codes, so loading a checkpoint does not parse any values.
+"""
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+from array import array
+
+from variant_table import ValueDictionary, VariantTable
+
+VERSION = 1
+
+MAGIC = "BRCA_MERGE_CHECKPOINT"
+
+# the layout of marshalled values and code arrays depends on the interpreter and machine
+FORMAT = "marshal%d-%s-i%d" % (marshal.version, sys.byteorder, array('i').itemsize)
+
+
+class Checkpoint(object):
+    """the variant table after a stage, with the state the following stages need"""
+
+    def __init__(self, stage, variants, state):
+        self.stage = stage
+        self.variants = variants
+        self.columns = variants.columns
+        self.state = state
+
+
+def path(checkpoint_dir, stage):
+    return os.path.join(checkpoint_dir, "checkpoint_%s.bin" % stage)
+
+
+def save(checkpoint_dir, stage, variants, state):
+    """writes the variant table and state, a dict of marshallable values, as
+    the checkpoint of stage. returns the path of the checkpoint"""
+    variants.compact()
+    payload = marshal.dumps((state,
+                             variants.columns,
+                             variants.default,
+                             variants.row_keys,
+                             [dictionary.values for dictionary in variants.dictionaries],
+                             [codes.tostring() for codes in variants.codes]))
+    if not os.path.exists(checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+    checkpoint_path = path(checkpoint_dir, stage)
+    # write to a temporary file first so an interrupted run can't leave a truncated checkpoint
+    fd, temp_path = tempfile.mkstemp(dir=checkpoint_dir)
+    with os.fdopen(fd, "wb") as f:
+        f.write("%s %d %s %s %s\n" % (MAGIC, VERSION, FORMAT, stage, hashlib.sha1(payload).hexdigest()))
+        f.write(payload)
+    os.rename(temp_path, checkpoint_path)
+    return checkpoint_path
+
+
+def load(checkpoint_dir, stage):
+    """reads the checkpoint of stage, raising an Exception if it is missing,
+    was written by another version or machine, or is corrupted"""
+    checkpoint_path = path(checkpoint_dir, stage)
+    if not os.path.exists(checkpoint_path):
+        raise Exception("ERROR: no checkpoint of stage %s in %s" % (stage, checkpoint_dir))
+    with open(checkpoint_path, "rb") as f:
+        header = f.readline().split()
+        payload = f.read()
+    if len(header) != 5 or header[0] != MAGIC:
+        raise Exception("ERROR: %s is not a merge checkpoint" % checkpoint_path)
+    (magic, version, checkpoint_format, checkpoint_stage, digest) = header
+    if int(version) != VERSION or checkpoint_format != FORMAT:
+        raise Exception("ERROR: checkpoint %s has format %s %s, expected %d %s" %
+                        (checkpoint_path, version, checkpoint_format, VERSION, FORMAT))
+    if checkpoint_stage != stage:
+        raise Exception("ERROR: checkpoint %s is of stage %s, expected %s" % (checkpoint_path, checkpoint_stage, stage))
+    if hashlib.sha1(payload).hexdigest() != digest:
+        raise Exception("ERROR: checksum mismatch in checkpoint %s" % checkpoint_path)
+
+    (state, columns, default, row_keys, column_values, column_codes) = marshal.loads(payload)
+    dictionaries = [ValueDictionary.from_values(values) for values in column_values]
+    codes = [array('i', raw) for raw in column_codes]
+    return Checkpoint(stage, VariantTable.from_columns(columns, default, row_keys, dictionaries, codes), state)
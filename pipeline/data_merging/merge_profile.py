@@ -0,0 +1,162 @@
+"""
+Wall time, CPU time, peak memory and record counts for each stage of
+variant_merging.py, written to merge_profile.json in the artifacts directory
+so runs of the pipeline can be compared with each other.
+
+A stage's peak RSS is the most memory the process held while the stage ran,
+not the peak of the whole run so far. On Linux the process's peak is read and
+reset through /proc/self/clear_refs whenever a stage starts or ends, and
+each open stage keeps the largest peak it saw. Elsewhere the peak can't be
+reset, so a stage only gets one if it raised the process's peak, and None
+otherwise.
+"""
+import json
+import os
+import resource
+import time
+
+VERSION = 2
+
+# Stages being measured in this process, outermost first
+_measuring = []
+# peak RSS of this process over every sample, which resetting loses
+_run_peak_kb = 0
+
+
+class Stage(object):
+    """measures the code run inside a with block. records_in and records_out
+    are set by the code being measured. CPU time includes child processes
+    waited for during the stage, such as a finished worker pool, and so does
+    peak RSS if one of them used more than any child before it."""
+
+    def __init__(self, name, source=None):
+        self.name = name
+        self.source = source
+        self.records_in = None
+        self.records_out = None
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self.peak_rss_kb = None
+
+    def __enter__(self):
+        self._start_wall = time.time()
+        self._start_cpu = _cpu_seconds()
+        _sample_peak()
+        self._peak_kb = 0
+        self._start_peak_kb = _own_peak_kb()
+        self._start_children_peak_kb = _children_peak_kb()
+        _measuring.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wall_seconds = time.time() - self._start_wall
+        self.cpu_seconds = _cpu_seconds() - self._start_cpu
+        resettable = _sample_peak()
+        _measuring.remove(self)
+        if resettable or self._peak_kb > self._start_peak_kb:
+            self.peak_rss_kb = self._peak_kb
+        children_peak_kb = _children_peak_kb()
+        if children_peak_kb > self._start_children_peak_kb:
+            self.peak_rss_kb = max(self.peak_rss_kb, children_peak_kb)
+        return False
+
+    def to_dict(self):
+        return {"stage": self.name,
+                "source": self.source,
+                "wall_seconds": round(self.wall_seconds, 3),
+                "cpu_seconds": round(self.cpu_seconds, 3),
+                "peak_rss_kb": self.peak_rss_kb,
+                "records_in": self.records_in,
+                "records_out": self.records_out}
+
+
+class MergeProfile(object):
+
+    def __init__(self):
+        self.started = time.time()
+        self.stages = []
+        self.open_stages = []
+
+    def stage(self, name, source=None):
+        """returns a Stage to use in a with block, recorded in this profile"""
+        stage = _ProfiledStage(self, name, source)
+        self.stages.append(stage)
+        return stage
+
+    def add(self, stage):
+        """records a stage that was measured elsewhere, e.g. in a worker process"""
+        self.stages.append(stage)
+
+    def count_records(self, records_in=None, records_out=None):
+        """sets the record counts of the innermost stage being measured"""
+        if not self.open_stages:
+            return
+        stage = self.open_stages[-1]
+        if records_in is not None:
+            stage.records_in = records_in
+        if records_out is not None:
+            stage.records_out = records_out
+
+    def write(self, path):
+        profile = {"version": VERSION,
+                   "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                   "wall_seconds": round(time.time() - self.started, 3),
+                   "cpu_seconds": round(_cpu_seconds(), 3),
+                   "peak_rss_kb": max(_run_peak_kb, _own_peak_kb(), _children_peak_kb()),
+                   "stages": [stage.to_dict() for stage in self.stages if stage.wall_seconds is not None]}
+        with open(path, "w") as f:
+            json.dump(profile, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+class _ProfiledStage(Stage):
+
+    def __init__(self, profile, name, source):
+        super(_ProfiledStage, self).__init__(name, source)
+        self.profile = profile
+
+    def __enter__(self):
+        self.profile.open_stages.append(self)
+        return super(_ProfiledStage, self).__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profile.open_stages.remove(self)
+        return super(_ProfiledStage, self).__exit__(exc_type, exc_value, traceback)
+
+
+def _cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _sample_peak():
+    """gives the process's peak RSS since the last sample to every stage being
+    measured, then resets it. returns False if it couldn't be reset"""
+    global _run_peak_kb
+    peak = _own_peak_kb()
+    _run_peak_kb = max(_run_peak_kb, peak)
+    for stage in _measuring:
+        stage._peak_kb = max(stage._peak_kb, peak)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            # lowers the peak RSS, which ru_maxrss reports, to the current RSS
+            f.write("5")
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def _own_peak_kb():
+    return _kb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def _children_peak_kb():
+    return _kb(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def _kb(maxrss):
+    # ru_maxrss is in kilobytes on Linux but in bytes on macOS
+    if os.uname()[0] == "Darwin":
+        return maxrss // 1024
+    return maxrss
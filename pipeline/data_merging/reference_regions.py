@@ -0,0 +1,186 @@
+"""
+Reference sequence of the BRCA1 and BRCA2 regions, packed into one file that
+is memory-mapped read-only, so every process using it shares one page-cached
+copy instead of holding the text files as strings of its own.
+
+The packed file is written once to a cache directory, the system's temporary
+directory by default, under the SHA-1 of its content, so processes loading
+the same text files map the same file and changed text files get a new one.
+Nothing is written to the reference directory. If the cache directory can't
+be written, the regions are packed into an anonymous mapping instead, which
+only processes forked after loading share.
+
+The packed file starts with a header listing each region's build,
+chromosome, start offset and where its bases are in the file. Bases are
+stored uppercased, one byte each, so a region is a zero-copy buffer over the
+mapping that slices into plain strings. Python 3 has no such buffer, so
+there a region is copied out of the mapping into a string. Reference alleles
+of a whole file can be checked against the mapping at once with NumPy.
+"""
+import errno
+import hashlib
+import mmap
+import numpy as np
+import os
+import stat
+import struct
+import tempfile
+
+try:
+    buffer
+except NameError:
+    buffer = None
+
+# gene, chromosome, build and the genomic position just before the first base of each slice
+REGIONS = [("brca1", "17", "hg38", 43000000),
+           ("brca1", "17", "hg19", 41100000),
+           ("brca2", "13", "hg38", 32300000),
+           ("brca2", "13", "hg19", 32800000)]
+
+BUILDS = ("hg19", "hg38")
+REGION_FILE = "%(gene)s_%(build)s.txt"
+
+MAGIC = b"BRCAREF1"
+COUNT_FORMAT = "<I"
+# build, chromosome, start, offset of the bases in the file, length
+ENTRY_FORMAT = "<8s4sIQI"
+
+
+def region_file(reference_dir, gene, build, file_name=REGION_FILE):
+    return os.path.join(reference_dir, file_name % {"gene": gene, "build": build})
+
+
+def pack(reference_dir, builds=BUILDS, file_name=REGION_FILE):
+    """returns the packed file content of the regions of builds, read from
+    the file_name files of reference_dir"""
+    regions = [region for region in REGIONS if region[2] in builds]
+    sequences = []
+    for gene, chrom, build, start in regions:
+        with open(region_file(reference_dir, gene, build, file_name), "rb") as f:
+            sequences.append(f.read().strip().upper())
+    offset = len(MAGIC) + struct.calcsize(COUNT_FORMAT) + len(regions) * struct.calcsize(ENTRY_FORMAT)
+    header = [MAGIC, struct.pack(COUNT_FORMAT, len(regions))]
+    for (gene, chrom, build, start), sequence in zip(regions, sequences):
+        header.append(struct.pack(ENTRY_FORMAT, build.encode("ascii"), chrom.encode("ascii"), start, offset, len(sequence)))
+        offset += len(sequence)
+    return b"".join(header + sequences)
+
+
+def packed_file(packed, cache_dir):
+    """returns the path of the packed file with content packed in cache_dir,
+    writing it if it isn't there yet. returns None if it can't be written,
+    or if another user's file has its name"""
+    path = os.path.join(cache_dir, "brca_regions-%s.ref" % hashlib.sha1(packed).hexdigest())
+    try:
+        info = os.stat(path)
+        if info.st_uid == os.getuid() and info.st_size == len(packed):
+            return path
+        return None
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            return None
+    temp_path = None
+    try:
+        # write to a temporary file first so a reader never maps a partial file
+        fd, temp_path = tempfile.mkstemp(dir=cache_dir, prefix="brca_regions-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(packed)
+        os.chmod(temp_path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.rename(temp_path, path)
+        return path
+    except (IOError, OSError):
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+        return None
+
+
+class ReferenceRegions(object):
+
+    def __init__(self, path=None, mapping=None):
+        """maps the packed file at path, or takes a mapping of packed regions"""
+        if mapping is None:
+            with open(path, "rb") as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.mapping = mapping
+        if self.mapping[:len(MAGIC)] != MAGIC:
+            raise Exception("%s is not a packed reference file" % (path or "mapping"))
+        position = len(MAGIC)
+        (count,) = struct.unpack_from(COUNT_FORMAT, self.mapping, position)
+        position += struct.calcsize(COUNT_FORMAT)
+        self.regions = {}
+        for i in range(count):
+            (build, chrom, start, offset, length) = struct.unpack_from(ENTRY_FORMAT, self.mapping, position)
+            position += struct.calcsize(ENTRY_FORMAT)
+            self.regions[(_name(chrom), _name(build))] = (start, offset, length)
+
+    def start(self, chrom, build):
+        return self.regions[(chrom, build)][0]
+
+    def sequence(self, chrom, build):
+        """returns the bases of a region as a read-only buffer over the mapping"""
+        (start, offset, length) = self.regions[(chrom, build)]
+        if buffer is None:
+            return self.mapping[offset:offset + length].decode("ascii")
+        return buffer(self.mapping, offset, length)
+
+    def refs_match(self, chrom, build, positions, refs):
+        """checks many reference alleles against a region in one pass.
+        positions are 1-based genomic positions. returns a boolean array,
+        True where the region holds the allele at its position"""
+        (start, offset, length) = self.regions[(chrom, build)]
+        bases = np.frombuffer(self.mapping, dtype=np.uint8, count=length, offset=offset)
+        offsets = np.asarray(positions, dtype=np.int64) - 1 - start
+        ref_lengths = np.array([len(ref) for ref in refs], dtype=np.int64)
+        if np.any((offsets >= length) & (ref_lengths > 0)):
+            raise Exception("ref not inside BRCA1 or BRCA2")
+
+        # one entry per base of every allele: which allele it belongs to and
+        # where in the region it should be
+        ref_bases = np.frombuffer(b"".join(refs), dtype=np.uint8)
+        allele_of_base = np.repeat(np.arange(len(refs)), ref_lengths)
+        allele_starts = np.cumsum(ref_lengths) - ref_lengths
+        base_offsets = np.repeat(offsets - allele_starts, ref_lengths) + np.arange(len(ref_bases))
+
+        inside = (base_offsets >= 0) & (base_offsets < length)
+        mismatched = np.ones(len(ref_bases), dtype=bool)
+        mismatched[inside] = bases[base_offsets[inside]] != ref_bases[inside]
+        return np.bincount(allele_of_base[mismatched], minlength=len(refs)) == 0
+
+    def bases(self, chrom, build, positions):
+        """returns the bases at many 1-based genomic positions of a region as
+        one string, the positions must be inside the region"""
+        (start, offset, length) = self.regions[(chrom, build)]
+        bases = np.frombuffer(self.mapping, dtype=np.uint8, count=length, offset=offset)
+        offsets = np.asarray(positions, dtype=np.int64) - 1 - start
+        if np.any((offsets < 0) | (offsets >= length)):
+            raise Exception("position not inside BRCA1 or BRCA2")
+        return str(bases[offsets].tostring().decode("ascii"))
+
+    def gene(self, chrom):
+        """returns {build: {"start": ..., "sequence": ...}} for a chromosome,
+        the layout the merge scripts use for BRCA1 and BRCA2"""
+        return dict((build, {"start": self.start(chrom, build), "sequence": self.sequence(chrom, build)})
+                    for region_chrom, build in self.regions.keys() if region_chrom == chrom)
+
+
+def load(reference_dir, builds=BUILDS, file_name=REGION_FILE, cache_dir=None):
+    """maps the packed regions of builds, read from the file_name files of
+    reference_dir. file_name is formatted with the gene and build"""
+    packed = pack(reference_dir, builds, file_name)
+    path = packed_file(packed, cache_dir or tempfile.gettempdir())
+    if path is not None:
+        return ReferenceRegions(path)
+    mapping = mmap.mmap(-1, len(packed))
+    mapping.write(packed)
+    return ReferenceRegions(mapping=mapping)
+
+
+def brca_references(reference_dir, cache_dir=None):
+    """returns the BRCA1 and BRCA2 reference dicts for reference_dir"""
+    regions = load(reference_dir, cache_dir=cache_dir)
+    return (regions.gene("17"), regions.gene("13"))
+
+
+def _name(field):
+    # header fields are NUL padded
+    return str(field.rstrip(b"\0").decode("ascii"))
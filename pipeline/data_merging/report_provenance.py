@@ -0,0 +1,131 @@
+"""
+Index of the reports behind each merged variant.
+
+The report ids of each source are kept for every variant as a run of sorted
+integers in one flat array per source, with an array of offsets marking
+where each variant's run ends. Which reports back a variant, and which
+reports of a source back no variant at all, are then slices and set
+operations instead of splitting the comma separated BX_ID_<source> columns
+again.
+
+variant_merging.py writes the index of merged.tsv next to it as
+provenance.bin. The file starts with a header line holding the format
+version and the SHA-1 of the payload. The payload is marshalled: the
+sources, the variant keys, and the offsets and ids of each source as raw
+arrays of integers.
+"""
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+from array import array
+
+VERSION = 1
+
+MAGIC = "BRCA_REPORT_PROVENANCE"
+
+# the layout of marshalled values and arrays depends on the interpreter and machine
+FORMAT = "marshal%d-%s-i%d" % (marshal.version, sys.byteorder, array('i').itemsize)
+
+PROVENANCE_FILE = "provenance.bin"
+
+BX_ID_PREFIX = "BX_ID_"
+
+
+class ReportProvenance(object):
+
+    def __init__(self, sources):
+        self.sources = list(sources)
+        self.keys = []
+        self.rows = {}
+        # per source, the report ids of all variants and the end of each variant's ids
+        self.ids = dict((source, array('i')) for source in self.sources)
+        self.offsets = dict((source, array('i', [0])) for source in self.sources)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def add(self, key, source_ids):
+        """adds a variant backed by {source: report ids}"""
+        if key in self.rows:
+            raise Exception("variant %s is already in the provenance index" % key)
+        self.rows[key] = len(self.keys)
+        self.keys.append(key)
+        for source in self.sources:
+            ids = self.ids[source]
+            ids.extend(sorted(set(source_ids.get(source, ()))))
+            self.offsets[source].append(len(ids))
+
+    def reports(self, key):
+        """returns {source: report ids} of the reports backing a variant"""
+        row = self.rows[key]
+        return dict((source, self._ids(source, row)) for source in self.sources)
+
+    def _ids(self, source, row):
+        offsets = self.offsets[source]
+        return self.ids[source][offsets[row]:offsets[row + 1]].tolist()
+
+    def backed(self, source):
+        """returns the set of report ids of a source that back any variant"""
+        return set(self.ids[source])
+
+    def orphaned(self, source, report_ids):
+        """returns the report ids of a source that back no variant"""
+        return set(report_ids) - self.backed(source)
+
+    def write(self, path):
+        payload = marshal.dumps((self.sources, self.keys,
+                                 [self.offsets[source].tostring() for source in self.sources],
+                                 [self.ids[source].tostring() for source in self.sources]))
+        # write to a temporary file first so a reader never sees a partial index
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+        with os.fdopen(fd, "wb") as f:
+            f.write("%s %d %s %s\n" % (MAGIC, VERSION, FORMAT, hashlib.sha1(payload).hexdigest()))
+            f.write(payload)
+        os.rename(temp_path, path)
+
+
+def read(path):
+    """reads an index written by ReportProvenance.write, raising an Exception
+    if it was written by another version or machine, or is corrupted"""
+    with open(path, "rb") as f:
+        header = f.readline().split()
+        payload = f.read()
+    if len(header) != 4 or header[0] != MAGIC:
+        raise Exception("ERROR: %s is not a report provenance index" % path)
+    (magic, version, provenance_format, digest) = header
+    if int(version) != VERSION or provenance_format != FORMAT:
+        raise Exception("ERROR: report provenance index %s has format %s %s, expected %d %s" %
+                        (path, version, provenance_format, VERSION, FORMAT))
+    if hashlib.sha1(payload).hexdigest() != digest:
+        raise Exception("ERROR: checksum mismatch in report provenance index %s" % path)
+
+    (sources, keys, offsets, ids) = marshal.loads(payload)
+    provenance = ReportProvenance(sources)
+    provenance.keys = keys
+    provenance.rows = dict((key, row) for row, key in enumerate(keys))
+    for source, source_offsets, source_ids in zip(sources, offsets, ids):
+        provenance.offsets[source] = array('i', source_offsets)
+        provenance.ids[source] = array('i', source_ids)
+    return provenance
+
+
+def bx_id_columns(columns):
+    """returns (column index, source) of the BX_ID_<source> columns"""
+    return [(i, column[len(BX_ID_PREFIX):]) for i, column in enumerate(columns) if column.startswith(BX_ID_PREFIX)]
+
+
+def report_ids(value):
+    """returns the report ids in a BX_ID cell, a list of ids, one id or a
+    comma separated string of them, "-" or empty for none"""
+    if type(value) == list:
+        values = value
+    elif isinstance(value, basestring):
+        values = value.split(",")
+    else:
+        values = [value]
+    return [int(v) for v in values if v not in ("-", "", None)]
@@ -0,0 +1,389 @@
+"""
+Streaming reader and writer for sites-only VCF files, a lightweight stand-in
+for the parts of PyVCF the pipeline uses.
+
+A record keeps the columns of its line as strings and decodes a column the
+first time it is read, to the same types vcf.Reader gives it. The INFO column
+is split into keys and raw values the first time it is used, and a value is
+only decoded when its key is asked for. A record whose columns and INFO
+values are unchanged is written back as the exact line it was read from;
+changed columns and values are serialized the way vcf.Writer does. FORMAT and
+sample columns are not parsed, they are kept as raw text and written back as
+they were.
+
+ALT alleles are plain strings instead of PyVCF's _Substitution objects.
+"""
+import re
+from collections import MutableMapping, OrderedDict, namedtuple
+from copy import deepcopy
+
+# an ##INFO line of the header, num is None for ".", -1 for "A", -2 for "G" and -3 for "R"
+Info = namedtuple("Info", ["id", "num", "type", "desc"])
+
+INFO_PATTERN = re.compile(r'##INFO=<ID=(?P<id>[^,>]+),\s*Number=(?P<num>[^,>]+),\s*'
+                          r'Type=(?P<type>[^,>]+)(?:,\s*Description="(?P<desc>[^"]*)")?')
+
+NUMBERS = {".": None, "A": -1, "G": -2, "R": -3}
+
+# types vcf.Reader gives reserved INFO keys that are not in the header
+RESERVED_INFO = {"AA": "String", "AC": "Integer", "AF": "Float", "AN": "Integer",
+                 "BQ": "Float", "CIGAR": "String", "DB": "Flag", "DP": "Integer",
+                 "END": "Integer", "H2": "Flag", "H3": "Flag", "MQ": "Float",
+                 "MQ0": "Integer", "NS": "Integer", "SB": "String", "SOMATIC": "Flag",
+                 "VALIDATED": "Flag", "1000G": "Flag",
+                 # keys used for structural variants
+                 "IMPRECISE": "Flag", "NOVEL": "Flag", "SVTYPE": "String",
+                 "SVLEN": "Integer", "CIPOS": "Integer", "CIEND": "Integer",
+                 "HOMLEN": "Integer", "HOMSEQ": "String", "BKPTID": "String",
+                 "MEINFO": "String", "METRANS": "String", "DGVID": "String",
+                 "DBVARID": "String", "DBRIPID": "String", "MATEID": "String",
+                 "PARID": "String", "EVENT": "String", "CILEN": "Integer",
+                 "DPADJ": "Integer", "CN": "Integer", "CNADJ": "Integer",
+                 "CICN": "Integer", "CICNADJ": "Integer"}
+
+MISSING = (".", "")
+
+# separator of columns without strict_whitespace, as in vcf.Reader
+WHITESPACE = re.compile(r"\t| +")
+
+COLUMN_HEADER = "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+
+# original of a value that was assigned, so it is always written out
+_ASSIGNED = object()
+
+
+def parse_info_header(line):
+    match = INFO_PATTERN.match(line)
+    if match is None:
+        return None
+    num = match.group("num")
+    num = NUMBERS[num] if num in NUMBERS else int(num)
+    return Info(match.group("id"), num, match.group("type"), match.group("desc"))
+
+
+def _decode_values(func, text):
+    return [func(value) if value != "." else None for value in text.split(",")]
+
+
+def decode_info(infos, key, text):
+    """decodes the raw INFO value of key as vcf.Reader does, text is None
+    for a key without a value"""
+    info = infos.get(key)
+    if info is not None:
+        value_type = info.type
+    else:
+        value_type = RESERVED_INFO.get(key, "Flag" if text is None else "String")
+    if value_type == "Flag" or text is None:
+        return True
+    if value_type == "Integer":
+        try:
+            value = _decode_values(int, text)
+        except ValueError:
+            value = _decode_values(float, text)
+    elif value_type == "Float":
+        value = _decode_values(float, text)
+    else:
+        value = _decode_values(str, text)
+    if info is not None and info.num == 1:
+        return value[0]
+    return value
+
+
+def _stringify(value, delimiter=","):
+    if type(value) == list:
+        return delimiter.join(str(v) if v is not None else "." for v in value)
+    return str(value) if value is not None else "."
+
+
+def format_info_entry(key, value):
+    if isinstance(value, bool):
+        return key if value else None
+    return key + "=" + _stringify(value)
+
+
+def _snapshot(value):
+    return list(value) if type(value) == list else value
+
+
+def _changed(value, original):
+    return original is _ASSIGNED or value != original
+
+
+class RecordInfo(MutableMapping):
+    """INFO of a record as a mapping of key to value, decoding the value of
+    a key the first time it is read"""
+
+    __slots__ = ("_text", "_infos", "_raw", "_values", "_originals", "_keys_changed")
+
+    def __init__(self, text, infos):
+        self._text = text
+        self._infos = infos
+        # raw value of each key in column order, split on first use
+        self._raw = None
+        self._values = {}
+        self._originals = {}
+        self._keys_changed = False
+
+    def _entries(self):
+        if self._raw is None:
+            raw = OrderedDict()
+            if self._text not in MISSING:
+                for entry in self._text.split(";"):
+                    key, separator, value = entry.partition("=")
+                    raw[key] = value if separator else None
+            self._raw = raw
+        return self._raw
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        value = decode_info(self._infos, key, self._entries()[key])
+        self._values[key] = value
+        self._originals[key] = _snapshot(value)
+        return value
+
+    def __setitem__(self, key, value):
+        entries = self._entries()
+        if key not in entries:
+            entries[key] = None
+            self._keys_changed = True
+        self._values[key] = value
+        self._originals[key] = _ASSIGNED
+
+    def __delitem__(self, key):
+        del self._entries()[key]
+        self._values.pop(key, None)
+        self._originals.pop(key, None)
+        self._keys_changed = True
+
+    def __iter__(self):
+        return iter(self._entries())
+
+    def __len__(self):
+        return len(self._entries())
+
+    def __contains__(self, key):
+        return key in self._entries()
+
+    def has_key(self, key):
+        return key in self
+
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
+
+    def __deepcopy__(self, memo):
+        info = RecordInfo(self._text, self._infos)
+        if self._raw is not None:
+            info._raw = OrderedDict(self._raw)
+        info._values = deepcopy(self._values, memo)
+        info._originals = dict(self._originals)
+        info._keys_changed = self._keys_changed
+        return info
+
+    def changed(self):
+        return self._keys_changed or any(_changed(value, self._originals[key])
+                                         for key, value in self._values.iteritems())
+
+    def text(self):
+        """the INFO column, as it was read if nothing changed"""
+        if not self.changed():
+            return self._text
+        entries = []
+        for key, raw in self._raw.iteritems():
+            if key in self._values and _changed(self._values[key], self._originals[key]):
+                entry = format_info_entry(key, self._values[key])
+            elif raw is None:
+                entry = key
+            else:
+                entry = key + "=" + raw
+            if entry is not None:
+                entries.append(entry)
+        return ";".join(entries) if entries else "."
+
+
+def _decode_id(text):
+    return text if text != "." else None
+
+
+def _decode_alt(text):
+    return [alt if alt != "." else None for alt in text.split(",")]
+
+
+def _decode_qual(text):
+    try:
+        return int(text)
+    except ValueError:
+        try:
+            return float(text)
+        except ValueError:
+            return None
+
+
+def _decode_filter(text):
+    if text == ".":
+        return None
+    if text == "PASS":
+        return []
+    return text.split(";")
+
+
+def _format_qual(qual):
+    # PyVCF writes a QUAL of 0 as missing, which changes the record
+    return "." if qual is None else str(qual)
+
+
+def _format_filter(filters):
+    return "PASS" if filters == [] else _stringify(filters, ";")
+
+
+def _column(index, decode):
+    def get(self):
+        try:
+            return self._values[index]
+        except KeyError:
+            pass
+        value = decode(self._fields[index])
+        self._values[index] = value
+        self._originals[index] = _snapshot(value)
+        return value
+
+    def set(self, value):
+        self._values[index] = value
+        self._originals[index] = _ASSIGNED
+
+    return property(get, set)
+
+
+class Record(object):
+    """one line of a sites-only VCF, with the attributes of a PyVCF _Record"""
+
+    __slots__ = ("_line", "_fields", "_values", "_originals", "_info", "_infos")
+
+    def __init__(self, line, fields, infos):
+        self._line = line
+        # CHROM to INFO, then FORMAT and samples as one string if the line has them
+        self._fields = fields
+        self._values = {}
+        self._originals = {}
+        self._info = None
+        self._infos = infos
+
+    CHROM = _column(0, str)
+    POS = _column(1, int)
+    ID = _column(2, _decode_id)
+    REF = _column(3, str)
+    ALT = _column(4, _decode_alt)
+    QUAL = _column(5, _decode_qual)
+    FILTER = _column(6, _decode_filter)
+
+    @property
+    def INFO(self):
+        if self._info is None:
+            self._info = RecordInfo(self._fields[7], self._infos)
+        return self._info
+
+    @INFO.setter
+    def INFO(self, info):
+        self._info = RecordInfo(".", self._infos)
+        self._info.update(info)
+
+    def __deepcopy__(self, memo):
+        record = Record(self._line, list(self._fields), self._infos)
+        record._values = deepcopy(self._values, memo)
+        record._originals = dict(self._originals)
+        if self._info is not None:
+            record._info = deepcopy(self._info, memo)
+        return record
+
+    def __repr__(self):
+        return "Record(CHROM=%s, POS=%s, REF=%s, ALT=%s)" % (self.CHROM, self.POS, self.REF, self.ALT)
+
+    def line(self):
+        """the record as a VCF line, the line it was read from if nothing changed"""
+        changed = [index for index, value in self._values.iteritems()
+                   if _changed(value, self._originals[index])]
+        info_changed = self._info is not None and self._info.changed()
+        if not changed and not info_changed:
+            return self._line if self._line.endswith("\n") else self._line + "\n"
+        fields = list(self._fields)
+        for index in changed:
+            fields[index] = COLUMN_FORMATS[index](self._values[index])
+        if info_changed:
+            fields[7] = self._info.text()
+        return "\t".join(fields) + "\n"
+
+
+COLUMN_FORMATS = [_stringify, _stringify, _stringify, _stringify, _stringify, _format_qual, _format_filter]
+
+
+class Reader(object):
+    """iterates the records of a VCF file, in the style of vcf.Reader"""
+
+    def __init__(self, fsock, strict_whitespace=False):
+        self.reader = iter(fsock)
+        self.header_lines = []
+        self.infos = OrderedDict()
+        self.samples = []
+        self._separator = None if strict_whitespace else WHITESPACE
+        self._next_line = None
+        for line in self.reader:
+            if line.startswith("##"):
+                self.header_lines.append(line)
+                info = parse_info_header(line)
+                if info is not None:
+                    self.infos[info.id] = info
+            elif line.startswith("#"):
+                self.header_lines.append(line)
+                self.samples = line.rstrip().split("\t")[9:]
+                break
+            else:
+                # no column header, the line is the first record
+                self._next_line = line
+                break
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._next_line is not None:
+            line = self._next_line
+            self._next_line = None
+        else:
+            line = next(self.reader)
+        stripped = line.strip()
+        # blank lines are skipped, as vcf.Reader does
+        while not stripped:
+            line = next(self.reader)
+            stripped = line.strip()
+        if self._separator is None:
+            fields = stripped.split("\t", 8)
+        else:
+            fields = self._separator.split(stripped)
+            if len(fields) > 9:
+                fields[8:] = ["\t".join(fields[8:])]
+        return Record(line, fields, self.infos)
+
+    __next__ = next
+
+
+class Writer(object):
+    """writes records to a VCF file under the header of the template reader,
+    in the style of vcf.Writer"""
+
+    def __init__(self, stream, template):
+        self.stream = stream
+        header_lines = [line if line.endswith("\n") else line + "\n" for line in template.header_lines]
+        if not header_lines or not header_lines[-1].startswith("#CHROM"):
+            header_lines.append(COLUMN_HEADER)
+        stream.writelines(header_lines)
+
+    def write_record(self, record):
+        self.stream.write(record.line())
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.stream.close()
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import reference_regions
+from liftover import Liftover
+
+# the source regions start at 41100001 and 32800001, the target ones at 43000001 and 32300001
+SEQUENCES = {("brca1", "hg19"): "ACGTACGTAC", ("brca1", "hg38"): "TTACGTTCATAC",
+             ("brca2", "hg19"): "GATTACA", ("brca2", "hg38"): "CCTGAAT"}
+
+CHAIN = """chain 1000 chr1 249250621 + 0 10 chr1 248956422 + 0 10 1
+10
+
+chain 1000 chr17 81195210 + 41100000 41100010 chr17 83257441 + 43000002 43000012 2
+4 1 1
+5
+
+chain 1000 chr13 115169878 + 32800000 32800005 chr13 114364328 - %d %d 3
+5
+""" % (114364328 - 32300005, 114364328 - 32300000)
+
+
+class TestLiftover(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        for (gene, build), sequence in SEQUENCES.items():
+            with open(reference_regions.region_file(self.dir, gene, build), "w") as f:
+                f.write(sequence + "\n")
+        chain_path = os.path.join(self.dir, "hg19ToHg38.over.chain")
+        with open(chain_path, "w") as f:
+            f.write(CHAIN)
+        self.liftover = Liftover(chain_path, reference_regions.load(self.dir, cache_dir=self.dir))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_lift_inside_a_block(self):
+        self.assertEqual(self.liftover.lift("17", 41100002, "CG"), ("17", 43000004, "CG"))
+        self.assertEqual(self.liftover.lift("chr17", "41100006", "G"), ("chr17", 43000008, "C"))
+
+    def test_allele_is_cut_at_the_end_of_its_block(self):
+        self.assertEqual(self.liftover.lift("17", 41100004, "TA"), ("17", 43000006, "T"))
+
+    def test_unliftable(self):
+        # across two blocks, in the gap between them, outside the regions
+        self.assertIsNone(self.liftover.lift("17", 41100004, "TAC"))
+        self.assertIsNone(self.liftover.lift("17", 41100005, "A"))
+        self.assertIsNone(self.liftover.lift("17", 41100011, "A"))
+        self.assertIsNone(self.liftover.lift("1", 5, "A"))
+
+    def test_minus_strand(self):
+        self.assertEqual(self.liftover.lift("13", 32800001, "GA"), ("13", 32300004, "GA"))
+
+    def test_lift_vcf(self):
+        vcf = StringIO("##fileformat=VCFv4.0\n"
+                       "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+                       "17\t41100002\tv1\tC\tT\t.\t.\tA=1;B=a b\n"
+                       "17 41100007 v2 G T . . A=2\n"
+                       "17\t41100007\tv3\tG\tA\t.\t.\tA=3\n"
+                       "\n"
+                       "17\t41100005\tv4\tA\tG\t.\t.\tA=4\n")
+        (out, unmapped) = (StringIO(), StringIO())
+        self.assertEqual(self.liftover.lift_vcf(vcf, out, unmapped), (4, 2))
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], "##fileformat=VCFv4.0")
+        self.assertTrue(all(line.startswith("##liftOver") or line.startswith("##new_reference") for line in lines[1:5]))
+        self.assertEqual(lines[5:], ["#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO",
+                                     "17\t43000004\tv1\tC\tT\t.\t.\tA=1;B=a b",
+                                     "17\t43000009\tv2\tA\tT\t.\t.\tA=2"])
+        # v3's lifted REF is its ALT
+        self.assertEqual(unmapped.getvalue().splitlines()[2:],
+                         ["17\t41100007\tv3\tG\tA\t.\t.\tA=3", "17\t41100005\tv4\tA\tG\t.\t.\tA=4"])
+
+
+if __name__ == "__main__":
+    unittest.main()
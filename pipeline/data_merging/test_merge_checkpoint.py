@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import merge_checkpoint
+from variant_table import VariantTable
+
+
+class TestMergeCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.checkpoint_dir = tempfile.mkdtemp()
+        self.variants = VariantTable(["Source", "Pos", "Submitter_ClinVar"], "-")
+        self.variants["chr13:g.1:A>T"] = ["ENIGMA", "1", "-"]
+        self.variants["chr13:g.2:A>T"] = [["ENIGMA", "ClinVar"], "2", ["Ambry", None, 0.5, 3]]
+        self.variants["chr13:g.3:A>T"] = ["ClinVar", "3", "-"]
+        del self.variants["chr13:g.1:A>T"]
+        self.state = {"sources": [("ClinVar", "ClinVarready.vcf")], "discarded_reports_size": 42}
+
+    def tearDown(self):
+        shutil.rmtree(self.checkpoint_dir)
+
+    def test_round_trip(self):
+        merge_checkpoint.save(self.checkpoint_dir, "variant_standardize", self.variants, self.state)
+        checkpoint = merge_checkpoint.load(self.checkpoint_dir, "variant_standardize")
+        self.assertEqual(checkpoint.state, self.state)
+        self.assertEqual(checkpoint.columns, ["Source", "Pos", "Submitter_ClinVar"])
+        self.assertEqual(list(checkpoint.variants.iteritems()), list(self.variants.iteritems()))
+        self.assertEqual(checkpoint.variants.default, "-")
+
+        # the loaded table can be changed like the original
+        checkpoint.variants.set_cell("chr13:g.3:A>T", 2, ["Ambry", None, 0.5, 3])
+        checkpoint.variants.add_columns(["BX_ID_LOVD"])
+        self.assertEqual(checkpoint.variants["chr13:g.3:A>T"], ["ClinVar", "3", ["Ambry", None, 0.5, 3], "-"])
+        self.assertEqual(len(checkpoint.variants.dictionaries[2]), 2)
+
+    def test_corrupted_checkpoint_is_rejected(self):
+        path = merge_checkpoint.save(self.checkpoint_dir, "add_new_source", self.variants, self.state)
+        with open(path, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(chr(ord(last) ^ 1))
+        with self.assertRaises(Exception):
+            merge_checkpoint.load(self.checkpoint_dir, "add_new_source")
+
+    def test_other_version_is_rejected(self):
+        path = merge_checkpoint.save(self.checkpoint_dir, "add_new_source", self.variants, self.state)
+        with open(path, "rb") as f:
+            text = f.read()
+        with open(path, "wb") as f:
+            f.write(text.replace(" %d " % merge_checkpoint.VERSION, " %d " % (merge_checkpoint.VERSION + 1), 1))
+        with self.assertRaises(Exception):
+            merge_checkpoint.load(self.checkpoint_dir, "add_new_source")
+
+    def test_missing_checkpoint_is_rejected(self):
+        with self.assertRaises(Exception):
+            merge_checkpoint.load(self.checkpoint_dir, "preprocessing")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import merge_profile
+
+
+class TestMergeProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_stages_are_written_in_start_order(self):
+        profile = merge_profile.MergeProfile()
+        with profile.stage("preprocessing"):
+            with profile.stage("read_enigma", "ENIGMA"):
+                profile.count_records(10, 8)
+            with merge_profile.Stage("preprocess_source", "BIC") as stage:
+                stage.records_in = 5
+            profile.add(stage)
+        path = os.path.join(self.out_dir, "merge_profile.json")
+        profile.write(path)
+
+        with open(path) as f:
+            written = json.load(f)
+        self.assertEqual(written["version"], merge_profile.VERSION)
+        stages = [(s["stage"], s["source"], s["records_in"], s["records_out"]) for s in written["stages"]]
+        self.assertEqual(stages, [("preprocessing", None, None, None),
+                                  ("read_enigma", "ENIGMA", 10, 8),
+                                  ("preprocess_source", "BIC", 5, None)])
+        for s in written["stages"]:
+            self.assertTrue(s["wall_seconds"] >= 0)
+            self.assertTrue(s["cpu_seconds"] >= 0)
+            self.assertTrue(s["peak_rss_kb"] > 0)
+
+    @unittest.skipUnless(os.path.exists("/proc/self/clear_refs"), "peak RSS can only be reset on Linux")
+    def test_peak_rss_is_the_stage_peak(self):
+        profile = merge_profile.MergeProfile()
+        with profile.stage("outer") as outer:
+            with profile.stage("large") as large:
+                data = "x" * (200 * 1024 * 1024)
+                del data
+            with profile.stage("small") as small:
+                pass
+        self.assertTrue(large.peak_rss_kb > 200 * 1024)
+        self.assertTrue(small.peak_rss_kb < 100 * 1024)
+        self.assertTrue(outer.peak_rss_kb >= large.peak_rss_kb)
+
+    def test_count_records_outside_a_stage_is_ignored(self):
+        profile = merge_profile.MergeProfile()
+        profile.count_records(1, 1)
+        self.assertEqual(profile.stages, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
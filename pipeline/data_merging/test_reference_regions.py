@@ -0,0 +1,90 @@
+import mmap
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+import reference_regions
+
+
+class TestReferenceRegions(unittest.TestCase):
+
+    def setUp(self):
+        self.reference_dir = tempfile.mkdtemp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.sequences = {}
+        for i, (gene, chrom, build, start) in enumerate(reference_regions.REGIONS):
+            sequence = "acgtN"[i:] + "ACGT" * (i + 1)
+            self.sequences[(chrom, build)] = sequence.upper()
+            with open(reference_regions.region_file(self.reference_dir, gene, build), "w") as f:
+                f.write(sequence + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.reference_dir)
+        shutil.rmtree(self.cache_dir)
+
+    def load(self, **kwargs):
+        return reference_regions.load(self.reference_dir, cache_dir=self.cache_dir, **kwargs)
+
+    def test_load_packs_and_maps_regions(self):
+        files = sorted(os.listdir(self.reference_dir))
+        regions = self.load()
+        self.assertEqual(sorted(os.listdir(self.reference_dir)), files)
+        (packed,) = os.listdir(self.cache_dir)
+        self.assertEqual(stat.S_IMODE(os.stat(os.path.join(self.cache_dir, packed)).st_mode), 0o644)
+        for (chrom, build), sequence in self.sequences.items():
+            self.assertEqual(str(regions.sequence(chrom, build)), sequence)
+            self.assertEqual(regions.sequence(chrom, build)[2:5], sequence[2:5])
+        self.assertEqual(regions.start("13", "hg38"), 32300000)
+
+    def test_brca_references_layout(self):
+        (brca1, brca2) = reference_regions.brca_references(self.reference_dir, self.cache_dir)
+        self.assertEqual(sorted(brca1.keys()), ["hg19", "hg38"])
+        self.assertEqual(brca1["hg19"]["start"], 41100000)
+        self.assertEqual(str(brca2["hg38"]["sequence"]), self.sequences[("13", "hg38")])
+
+    def test_load_shares_the_packed_file(self):
+        self.load()
+        files = os.listdir(self.cache_dir)
+        self.load()
+        self.assertEqual(os.listdir(self.cache_dir), files)
+        with open(reference_regions.region_file(self.reference_dir, "brca1", "hg38"), "w") as f:
+            f.write("ttttt")
+        self.assertEqual(str(self.load().sequence("17", "hg38")), "TTTTT")
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_load_without_a_writable_cache(self):
+        regions = reference_regions.load(self.reference_dir, cache_dir=os.path.join(self.cache_dir, "missing"))
+        self.assertEqual(str(regions.sequence("17", "hg19")), self.sequences[("17", "hg19")])
+
+    def test_load_some_builds_from_other_file_names(self):
+        for gene, chrom, build, start in reference_regions.REGIONS:
+            if build == "hg19":
+                os.rename(reference_regions.region_file(self.reference_dir, gene, build),
+                          os.path.join(self.reference_dir, gene + ".txt"))
+            else:
+                os.remove(reference_regions.region_file(self.reference_dir, gene, build))
+        regions = self.load(builds=("hg19",), file_name="%(gene)s.txt")
+        self.assertEqual(sorted(regions.regions.keys()), [("13", "hg19"), ("17", "hg19")])
+        self.assertEqual(str(regions.sequence("13", "hg19")), self.sequences[("13", "hg19")])
+
+    def test_refs_match(self):
+        regions = self.load()
+        start = regions.start("13", "hg38")
+        # the region is GTNACGTACGTACGT
+        match = regions.refs_match("13", "hg38", [start + 1, start + 2, start + 4, start + 5, start + 14, start],
+                                   ["GT", "GA", "ACGT", "", "GTA", "A"])
+        self.assertEqual(list(match), [True, False, True, True, False, False])
+        with self.assertRaises(Exception):
+            regions.refs_match("13", "hg38", [start + 16], ["A"])
+
+    def test_rejects_other_mappings(self):
+        mapping = mmap.mmap(-1, 40)
+        mapping.write(b"ACGT" * 10)
+        with self.assertRaises(Exception):
+            reference_regions.ReferenceRegions(mapping=mapping)
+
+
+if __name__ == '__main__':
+    unittest.main()
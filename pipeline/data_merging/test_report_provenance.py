@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import report_provenance
+
+
+class TestReportProvenance(unittest.TestCase):
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        self.provenance = report_provenance.ReportProvenance(["ENIGMA", "ClinVar"])
+        self.provenance.add("chr13:g.1:A>T", {"ENIGMA": [3], "ClinVar": [7, 5, 7]})
+        self.provenance.add("chr13:g.2:A>T,chr13:g.2:AA>TA", {"ClinVar": [1]})
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_reports_backing_a_variant(self):
+        self.assertEqual(self.provenance.reports("chr13:g.1:A>T"), {"ENIGMA": [3], "ClinVar": [5, 7]})
+        self.assertEqual(self.provenance.reports("chr13:g.2:A>T,chr13:g.2:AA>TA"), {"ENIGMA": [], "ClinVar": [1]})
+        self.assertEqual(len(self.provenance), 2)
+        with self.assertRaises(Exception):
+            self.provenance.add("chr13:g.1:A>T", {})
+
+    def test_orphaned_reports(self):
+        self.assertEqual(self.provenance.backed("ClinVar"), set([1, 5, 7]))
+        self.assertEqual(self.provenance.orphaned("ClinVar", [1, 2, 5, 7, 9]), set([2, 9]))
+        self.assertEqual(self.provenance.orphaned("ENIGMA", [3]), set())
+
+    def test_write_and_read(self):
+        path = os.path.join(self.out_dir, report_provenance.PROVENANCE_FILE)
+        self.provenance.write(path)
+        provenance = report_provenance.read(path)
+        self.assertEqual(provenance.sources, ["ENIGMA", "ClinVar"])
+        self.assertTrue("chr13:g.2:A>T,chr13:g.2:AA>TA" in provenance)
+        self.assertEqual(provenance.reports("chr13:g.1:A>T"), {"ENIGMA": [3], "ClinVar": [5, 7]})
+
+        with open(path, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(chr(ord(last) ^ 1))
+        with self.assertRaises(Exception):
+            report_provenance.read(path)
+
+    def test_report_ids_of_cells(self):
+        self.assertEqual(report_provenance.report_ids(["1", 2]), [1, 2])
+        self.assertEqual(report_provenance.report_ids("3,4"), [3, 4])
+        self.assertEqual(report_provenance.report_ids(5), [5])
+        self.assertEqual(report_provenance.report_ids("-"), [])
+        self.assertEqual(report_provenance.report_ids(["-"]), [])
+        self.assertEqual(report_provenance.bx_id_columns(["Source", "BX_ID_ENIGMA", "BX_ID_1000_Genomes"]),
+                         [(1, "ENIGMA"), (2, "1000_Genomes")])
+
+
+if __name__ == '__main__':
+    unittest.main()
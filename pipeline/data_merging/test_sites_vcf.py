@@ -0,0 +1,109 @@
+import os
+import unittest
+from copy import deepcopy
+from StringIO import StringIO
+
+import sites_vcf
+
+
+TEST_FILES = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'test_files')
+
+HEADER = ('##fileformat=VCFv4.0\n'
+          '##INFO=<ID=AC,Number=A,Type=Integer,Description="Allele count">\n'
+          '##INFO=<ID=DP,Number=1,Type=Integer,Description="Depth">\n'
+          '##INFO=<ID=AF,Number=A,Type=Float,Description="Allele frequency">\n'
+          '##INFO=<ID=NAME,Number=1,Type=String,Description="Name">\n'
+          '##INFO=<ID=MULTI,Number=0,Type=Flag,Description="Multi allelic">\n'
+          '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+
+LINE = '13\t32314943\trs1\tA\tG,T\t100\tPASS\tAC=1,.;DP=7;AF=0.10,2e-05;NAME=;MULTI;OTHER=a b\n'
+
+
+def read(text, strict_whitespace=True):
+    return sites_vcf.Reader(StringIO(text), strict_whitespace=strict_whitespace)
+
+
+def write(reader, records):
+    out = StringIO()
+    writer = sites_vcf.Writer(out, reader)
+    for record in records:
+        writer.write_record(record)
+    return out.getvalue()
+
+
+class TestSitesVcf(unittest.TestCase):
+
+    def test_columns_are_typed_like_pyvcf(self):
+        record = next(read(HEADER + LINE))
+        self.assertEqual((record.CHROM, record.POS, record.ID, record.REF), ('13', 32314943, 'rs1', 'A'))
+        self.assertEqual(record.ALT, ['G', 'T'])
+        self.assertEqual((record.QUAL, record.FILTER), (100, []))
+
+        record = next(read(HEADER + '13\t5\t.\tA\t.\t.\t.\t.\n'))
+        self.assertEqual((record.ID, record.ALT, record.QUAL, record.FILTER), (None, [None], None, None))
+        self.assertEqual(len(record.INFO), 0)
+
+    def test_info_is_decoded_by_header_type(self):
+        info = next(read(HEADER + LINE)).INFO
+        self.assertEqual(info['AC'], [1, None])
+        self.assertEqual(info['DP'], 7)
+        self.assertEqual(info['AF'], [0.1, 2e-05])
+        self.assertEqual(info['NAME'], '')
+        self.assertEqual(info['MULTI'], True)
+        self.assertEqual(info['OTHER'], ['a b'])
+        self.assertEqual(info.keys(), ['AC', 'DP', 'AF', 'NAME', 'MULTI', 'OTHER'])
+        self.assertTrue(info.has_key('DP'))
+        self.assertRaises(KeyError, lambda: info['BX_ID'])
+
+    def test_unchanged_records_round_trip(self):
+        reader = read(HEADER + LINE + LINE)
+        records = list(reader)
+        records[1].INFO['AF']
+        records[1].ALT
+        self.assertEqual(write(reader, records), HEADER + LINE + LINE)
+
+        with open(os.path.join(TEST_FILES, 'ExAC_AF.vcf')) as f:
+            text = f.read()
+        reader = read(text)
+        self.assertEqual(write(reader, reader), text)
+
+    def test_changed_values_are_serialized(self):
+        reader = read(HEADER + LINE)
+        record = next(reader)
+        record.INFO['AC'].append(3)
+        record.INFO['MULTI'] = False
+        record.INFO['BX_ID'] = 1
+        record.ALT = ['G']
+        record.POS = 10
+        self.assertEqual(write(reader, [record]).splitlines()[-1],
+                         '13\t10\trs1\tA\tG\t100\tPASS\tAC=1,.,3;DP=7;AF=0.10,2e-05;NAME=;OTHER=a b;BX_ID=1')
+
+    def test_zero_qual_is_kept(self):
+        reader = read(HEADER + LINE)
+        record = next(reader)
+        record.QUAL = 0
+        self.assertEqual(write(reader, [record]).splitlines()[-1].split('\t')[5], '0')
+        record.QUAL = None
+        self.assertEqual(write(reader, [record]).splitlines()[-1].split('\t')[5], '.')
+
+    def test_deepcopy_is_independent(self):
+        record = next(read(HEADER + LINE))
+        copied = deepcopy(record)
+        copied.INFO['AC'] = [1]
+        copied.ALT = ['G']
+        self.assertEqual(record.ALT, ['G', 'T'])
+        self.assertEqual(record.INFO['AC'], [1, None])
+        self.assertEqual(record.line(), LINE)
+        self.assertTrue(copied.line().startswith('13\t32314943\trs1\tA\tG\t100\tPASS\tAC=1;'))
+
+    def test_loose_whitespace_splits_on_spaces(self):
+        record = next(read('13 5  .\tA\tG\t.\t.\tDP=1\n', strict_whitespace=False))
+        self.assertEqual((record.CHROM, record.POS, record.INFO['DP']), ('13', 5, [1]))
+
+    def test_writer_adds_missing_column_header(self):
+        reader = read('13\t5\t.\tA\tG\t.\t.\tDP=1\n')
+        self.assertEqual(write(reader, reader), sites_vcf.COLUMN_HEADER + '13\t5\t.\tA\tG\t.\t.\tDP=1\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
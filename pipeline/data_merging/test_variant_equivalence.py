@@ -0,0 +1,77 @@
+from hypothesis import given
+from hypothesis.strategies import integers, tuples, sampled_from, lists
+import unittest
+
+from variant_equivalence import edits_equal
+
+
+#
+# generators
+#
+base = sampled_from(('A', 'C', 'T', 'G'))
+subseq = lists(base, max_size=6).map(lambda x: ''.join(x))
+# short, low complexity references so that equivalent edits are common
+reference = lists(sampled_from(('A', 'C')), min_size=1, max_size=30).map(lambda x: ''.join(x))
+edit = tuples(integers(min_value=0, max_value=30), integers(min_value=0, max_value=6), subseq)
+
+
+def fit_edit(seq, e):
+    "Move an edit inside the reference"
+    (pos, ref_len, alt) = e
+    pos = pos % (len(seq) + 1)
+    return (pos, min(ref_len, len(seq) - pos), alt)
+
+
+def apply_edit(seq, e):
+    (pos, ref_len, alt) = e
+    return seq[0:pos] + alt + seq[pos + ref_len:]
+
+
+#
+# tests
+#
+
+@given(reference, edit, edit)
+def test_edits_equal_matches_edited_sequences(seq, e1, e2):
+    "Comparing the window must agree with comparing the fully edited sequences"
+    e1 = fit_edit(seq, e1)
+    e2 = fit_edit(seq, e2)
+    (pos1, ref_len1, alt1) = e1
+    (pos2, ref_len2, alt2) = e2
+    expected = apply_edit(seq, e1) == apply_edit(seq, e2)
+    assert edits_equal(seq, pos1, ref_len1, alt1, pos2, ref_len2, alt2) == expected
+
+
+@given(reference, edit, edit)
+def test_edits_equal_commutative(seq, e1, e2):
+    e1 = fit_edit(seq, e1)
+    e2 = fit_edit(seq, e2)
+    (pos1, ref_len1, alt1) = e1
+    (pos2, ref_len2, alt2) = e2
+    assert (edits_equal(seq, pos1, ref_len1, alt1, pos2, ref_len2, alt2) ==
+            edits_equal(seq, pos2, ref_len2, alt2, pos1, ref_len1, alt1))
+
+
+class TestVariantEquivalence(unittest.TestCase):
+
+    def test_shifted_deletion_in_repeat(self):
+        seq = 'GCACACACT'
+        # deleting either CA or AC from the repeat gives GCACACT
+        self.assertTrue(edits_equal(seq, 1, 2, '', 4, 2, ''))
+        self.assertFalse(edits_equal(seq, 1, 2, '', 7, 2, ''))
+
+    def test_shifted_insertion_in_repeat(self):
+        seq = 'GAAAT'
+        self.assertTrue(edits_equal(seq, 1, 0, 'A', 4, 0, 'A'))
+        self.assertFalse(edits_equal(seq, 1, 0, 'A', 4, 0, 'T'))
+
+    def test_different_length_change(self):
+        self.assertFalse(edits_equal('GAAAT', 1, 1, '', 1, 0, 'A'))
+
+    def test_accepts_memoryview(self):
+        seq = memoryview('GAAAT')
+        self.assertTrue(edits_equal(seq, 1, 1, '', 3, 1, ''))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,17 @@
 from hypothesis import given, assume, settings
-from hypothesis.strategies import integers, tuples, text, sampled_from, lists
-from variant_merging import variant_equal, init, normalize_values, add_variant_to_dict, COLUMN_SOURCE, COLUMN_GENE, COLUMN_GENOMIC_HGVS, COLUMN_VCF_CHR, COLUMN_VCF_POS, COLUMN_VCF_REF, COLUMN_VCF_ALT, append_exac_allele_frequencies, EXAC_SUBPOPULATIONS
+from hypothesis.strategies import integers, tuples, text, sampled_from, lists, booleans
+from variant_merging import variant_equal, canonical_variant_key, find_equivalent_variant, init, normalize_values, add_variant_to_dict, COLUMN_SOURCE, COLUMN_GENE, COLUMN_GENOMIC_HGVS, COLUMN_VCF_CHR, COLUMN_VCF_POS, COLUMN_VCF_REF, COLUMN_VCF_ALT, append_exac_allele_frequencies, EXAC_SUBPOPULATIONS, repeat_merging, is_coordinate_sorted, merge_equivalent_window, merge_equivalent_rows, merge_position, is_position_sorted, ref_correct, refs_correct, standardize_coordinates, standardize_variant
 import unittest
 import itertools
 import os
+import shutil
+import tempfile
+from StringIO import StringIO
 import pytest
-import vcf
+import sites_vcf
 from utilities import round_sigfigs
+import equivalence_cache
+from equivalence_cache import EquivalenceCache
 
 
 runtimes = 500000
@@ -298,7 +303,66 @@ def test_variant_equal_not_equiv(v1, v2, ref_id):
     else:
         assert variant_equal(add_start(v1, ref_id), add_start(v2, ref_id), ref_id)
 
+@given(variant, variant, reference_id)
+def test_canonical_variant_key_matches_variant_equal(v1, v2, ref_id):
+    "Variants share a canonical key exactly when variant_equal says they are equal"
+    (_, pos1, ref1, _) = v1
+    (_, pos2, ref2, _) = v2
+    assume(pos1 + len(ref1) <= reference_length)
+    assume(pos2 + len(ref2) <= reference_length)
+
+    v1 = add_start(v1, ref_id)
+    v2 = add_start(v2, ref_id)
+    same_key = canonical_variant_key(v1, ref_id) == canonical_variant_key(v2, ref_id)
+    assert same_key == variant_equal(v1, v2, ref_id)
+
+@given(variant_on_ref, reference_id)
+def test_canonical_variant_key_equiv(v, ref_id):
+    (chrom, pos, reflen, alt) = v
+    refsequence = chrom_ref[chrom][ref_id]["sequence"]
+    assume(pos + reflen <= len(refsequence))
+    v = inject_ref(refsequence, v)
+
+    for veq in all_norm_equiv(refsequence, v):
+        if is_in_bounds(veq):
+            assert canonical_variant_key(add_start(v, ref_id), ref_id) == canonical_variant_key(add_start(veq, ref_id), ref_id)
+
 # Do we need to explicitly test variations in surrounding reference length?
+@given(lists(tuples(chrom, integers(min_value=0, max_value=reference_length - 6),
+                   integers(min_value=0, max_value=5), subseq), max_size=20), reference_id)
+def test_refs_correct_matches_ref_correct(variants, ref_id):
+    "Checking a whole column of variants must agree with checking them one at a time"
+    # about half of the refs are copied from the reference
+    variants = [add_start((chr, pos, str(chrom_ref[chr][ref_id]['sequence'][pos:pos + reflen]) if reflen % 2 else alt[:5], ''),
+                          ref_id)
+                for (chr, pos, reflen, alt) in variants]
+    correct = refs_correct([v[0] for v in variants], [v[1] for v in variants], [v[2] for v in variants], ref_id)
+    assert list(correct) == [ref_correct(chr, pos, ref, alt, ref_id) for (chr, pos, ref, alt) in variants]
+
+
+# alleles as the sources write them, with "-" or nothing for an empty allele
+source_allele = subseq.map(lambda x: x[:4]) | sampled_from(('-', ''))
+
+@given(lists(tuples(chrom, integers(min_value=1, max_value=reference_length - 6), integers(min_value=0, max_value=4),
+                    source_allele, source_allele, booleans()), max_size=20))
+def test_standardize_coordinates_matches_standardize_variant(variants):
+    "Standardizing a whole column of variants must agree with standardizing them one at a time"
+    # refs are copied from the reference, or random when reflen is 0
+    variants = [add_start((chr, pos, str(chrom_ref[chr]['hg38']['sequence'][pos:pos + reflen]) if reflen else ref, alt),
+                          'hg38') + (as_string,)
+                for (chr, pos, reflen, ref, alt, as_string) in variants]
+    variants = [(chr, str(pos) if as_string else pos, ref, alt) for (chr, pos, ref, alt, as_string) in variants
+                if ref not in ('-', '') or alt not in ('-', '')]
+    (positions, refs, alts, reasons) = standardize_coordinates(*zip(*variants) or [[]] * 4)
+    for (chr, pos, ref, alt), standardized in zip(variants, zip(positions, refs, alts, reasons)):
+        items = ['-', '-', '-', chr, pos, ref, alt]
+        if standardize_variant('', items, {}, []) is None:
+            assert standardized[3] is not None
+        else:
+            assert standardized == (items[COLUMN_VCF_POS], items[COLUMN_VCF_REF], items[COLUMN_VCF_ALT], None)
+            assert type(standardized[0]) == type(items[COLUMN_VCF_POS])
+
+
 # The tests above only test random variants against normalized (minimum reference)
 # variants.
 
@@ -374,9 +438,114 @@ class TestVariantMerging(unittest.TestCase):
         merged = variant_dict[self.genomic_coordinate]
         self.assertEqual('5104delAA', merged[9])
 
+    def shifted_deletions(self):
+        # pick the first homopolymer run of length three in the BRCA2 reference
+        sequence = BRCA2['hg38']['sequence']
+        offset = next(i for i in range(1, len(sequence) - 3)
+                      if sequence[i] == sequence[i + 1] == sequence[i + 2] and sequence[i - 1] != sequence[i])
+        start = BRCA2['hg38']['start']
+
+        def make_variant(pos, ref, alt):
+            return ['ENIGMA', 'BRCA2', '-', '13', str(start + pos + 1), ref, alt]
+
+        # deleting any one base of the run yields the same sequence
+        return {'left': make_variant(offset - 1, sequence[offset - 1:offset + 1], sequence[offset - 1]),
+                'middle': make_variant(offset, sequence[offset:offset + 2], sequence[offset]),
+                'right': make_variant(offset + 1, sequence[offset + 1:offset + 3], sequence[offset + 1]),
+                'other': make_variant(offset + 1, sequence[offset + 1], 'N')}
+
+    def test_find_equivalent_variant_groups_shifted_deletions(self):
+        equivalence = find_equivalent_variant(self.shifted_deletions())
+        self.assertEqual(equivalence, [set(['left', 'middle', 'right'])])
+
+    def test_find_equivalent_variant_reuses_equivalence_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            sequences = [BRCA1['hg38']['sequence'], BRCA2['hg38']['sequence']]
+            cache = EquivalenceCache(cache_dir, 'hg38', sequences)
+            self.assertEqual(find_equivalent_variant(self.shifted_deletions(), cache), [set(['left', 'middle', 'right'])])
+            self.assertEqual(cache.misses, 4)
+            cache.save()
+
+            cache = EquivalenceCache(cache_dir, 'hg38', sequences)
+            self.assertEqual(find_equivalent_variant(self.shifted_deletions(), cache), [set(['left', 'middle', 'right'])])
+            self.assertEqual((cache.hits, cache.misses), (4, 0))
+            self.assertEqual(cache.spot_check(canonical_variant_key, 10), [])
+
+            # a stale entry is caught by validation
+            v = cache.keys.keys()[0]
+            cache.keys[v] = ('13', 0, 0, '')
+            self.assertEqual(cache.spot_check(canonical_variant_key, 10), [v])
+
+            # keys of another key version are never loaded
+            original_version = equivalence_cache.CANONICAL_KEY_VERSION
+            equivalence_cache.CANONICAL_KEY_VERSION = original_version + 1
+            try:
+                self.assertEqual(EquivalenceCache(cache_dir, 'hg38', sequences).keys, {})
+            finally:
+                equivalence_cache.CANONICAL_KEY_VERSION = original_version
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_merge_equivalent_rows_accumulates_distinct_values(self):
+        rows = [['ENIGMA', 'BRCA2', '-', '13', '100', 'GA', 'G', 'Pathogenic', ['SCV1', 'SCV2'], '-'],
+                [['ClinVar', 'BIC'], 'BRCA2', 'chr13:g.99:TG>T', '13', '99', 'TG', 'T', 'Pathogenic', 'SCV2', '-'],
+                ['LOVD', 'BRCA2', '-', '13', '101', 'AG', 'A', '-', ['SCV3', 'SCV1'], '-']]
+        self.assertEqual(merge_equivalent_rows(rows),
+                         [['ENIGMA', 'ClinVar', 'BIC', 'LOVD'], 'BRCA2', 'chr13:g.99:TG>T', '13', '100', 'GA', 'G',
+                          'Pathogenic', ['SCV1', 'SCV2', 'SCV3'], '-'])
+
+    def test_merge_equivalent_window_merges_shifted_deletions(self):
+        def position(item):
+            return merge_position(item[1][COLUMN_VCF_CHR], item[1][COLUMN_VCF_POS])
+        variants = sorted(self.shifted_deletions().items(), key=position)
+        positions = [(p, list(items)) for p, items in itertools.groupby(variants, position)]
+        start = BRCA1['hg38']['start']
+        far = [(merge_position('17', start + i), [('far%d' % i, ['ENIGMA', 'BRCA1', '-', '17', str(start + i), 'A', 'C'])])
+               for i in (10, 20)]
+        consumed = []
+
+        def read_positions():
+            for p, items in positions + far:
+                consumed.append(p)
+                yield p, items
+
+        equivalence = []
+        merged = merge_equivalent_window(read_positions(), None, equivalence)
+        rows = dict(next(merged) for i in range(2))
+        self.assertEqual(set(rows.keys()), set(['left,middle,right', 'other']))
+        self.assertEqual(equivalence, [set(['left', 'middle', 'right'])])
+        # BRCA2 variants are written before reading past the first BRCA1 position
+        self.assertEqual(consumed[-1], far[0][0])
+        self.assertEqual([key for key, row in merged], ['far10', 'far20'])
+
+    def test_repeat_merging_collapses_repeated_records(self):
+        BIC_VCF_FILENAME = os.path.join(os.path.dirname(__file__), 'test_files/BIC.vcf')
+        out_dir = tempfile.mkdtemp()
+        try:
+            out_filename = os.path.join(out_dir, 'BICready.vcf')
+            repeat_merging(open(BIC_VCF_FILENAME, 'r'), open(out_filename, 'w'))
+            records = list(sites_vcf.Reader(open(out_filename, 'r'), strict_whitespace=True))
+        finally:
+            shutil.rmtree(out_dir)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].INFO['Creation_Date'], ['08-OCT-02', '23-DEC-03'])
+        self.assertEqual(records[0].INFO['Exon'], ['I-1'])
+
+    def test_is_coordinate_sorted(self):
+        header = '##fileformat=VCFv4.0\n#CHROM\tPOS\tID\tREF\tALT\n'
+        self.assertTrue(is_coordinate_sorted(StringIO(header + '13\t5\t.\n13\t5\t.\n13\t9\t.\n17\t1\t.\n')))
+        self.assertFalse(is_coordinate_sorted(StringIO(header + '13\t9\t.\n13\t5\t.\n')))
+        self.assertFalse(is_coordinate_sorted(StringIO(header + '13\t5\t.\n17\t1\t.\n13\t9\t.\n')))
+
+    def test_is_position_sorted(self):
+        header = '##fileformat=VCFv4.0\n#CHROM\tPOS\tID\tREF\tALT\n'
+        self.assertTrue(is_position_sorted(StringIO(header + '13\t5\t.\n13\t5\t.\n17\t1\t.\n')))
+        self.assertFalse(is_position_sorted(StringIO(header + '17\t1\t.\n13\t5\t.\n')))
+
     def test_append_exac_allele_frequencies_rounds_to_three_sig_figs(self):
         EXAC_VCF_FILENAME = os.path.join(os.path.dirname(__file__), 'test_files/ExAC_AF.vcf')
-        for record in vcf.Reader(open(EXAC_VCF_FILENAME, 'r')):
+        for record in sites_vcf.Reader(open(EXAC_VCF_FILENAME, 'r')):
             record = append_exac_allele_frequencies(record, new_record=None, i=None)
             for subpopulation in EXAC_SUBPOPULATIONS:
                 val = record.INFO["AF_" + subpopulation]
@@ -0,0 +1,59 @@
+import unittest
+
+from variant_normalization import VariantNormalizer
+
+# position 101 is the first base of each region
+REGIONS = {"13": (100, "ACGTTTTACG"), "17": (100, "GGGCATCAT")}
+
+
+class TestVariantNormalizer(unittest.TestCase):
+
+    def setUp(self):
+        self.normalizer = VariantNormalizer(REGIONS)
+
+    def test_ref_correct(self):
+        self.assertTrue(self.normalizer.ref_correct(("13", "101", "ACG", "A")))
+        self.assertFalse(self.normalizer.ref_correct(("13", "101", "ACC", "A")))
+        with self.assertRaises(AssertionError):
+            self.normalizer.ref_correct(("7", "101", "A", "T"))
+
+    def test_shifted_deletions_are_equal(self):
+        # deleting any one T of the run of four gives the same sequence
+        v1 = ("13", "104", "TT", "T")
+        v2 = ("13", "106", "TT", "T")
+        v3 = ("13", "103", "GTTTTA", "GTTTA")
+        self.assertTrue(self.normalizer.variant_equal(v1, v2))
+        self.assertTrue(self.normalizer.variant_equal(v1, v3))
+        self.assertFalse(self.normalizer.variant_equal(v1, ("13", "107", "TA", "T")))
+        self.assertFalse(self.normalizer.variant_equal(v1, ("17", "104", "TT", "T")))
+
+    def test_canonical_key_agrees_with_variant_equal(self):
+        variants = [("13", "104", "TT", "T"), ("13", "106", "TT", "T"), ("13", "107", "TA", "T"),
+                    ("17", "104", "C", "CATC"), ("17", "107", "T", "TCAT"), ("17", "104", "C", "T")]
+        for v1 in variants:
+            for v2 in variants:
+                self.assertEqual(self.normalizer.canonical_key(v1) == self.normalizer.canonical_key(v2),
+                                 self.normalizer.variant_equal(v1, v2))
+
+    def test_contains(self):
+        self.assertTrue(self.normalizer.contains("13", "101", 10))
+        self.assertTrue(self.normalizer.contains("17", 110, 0))
+        self.assertFalse(self.normalizer.contains("13", "100", 1))
+        self.assertFalse(self.normalizer.contains("13", "102", 10))
+        self.assertFalse(self.normalizer.contains("7", "101", 1))
+
+    def test_group_equivalent(self):
+        variants = [("13", "104", "TT", "T"), ("13", "106", "TT", "T"), ("17", "104", "C", "T"),
+                    ("7", "1", "A", "T"), ("7", "1", "A", "T"),
+                    ("13", "100", "A", "T"), ("13", "109", "CGA", "C"), ("13", "109", "CGT", "C")]
+        groups = sorted(self.normalizer.group_equivalent(variants).values())
+        self.assertEqual(groups, sorted([[("13", "104", "TT", "T"), ("13", "106", "TT", "T")],
+                                         [("17", "104", "C", "T")],
+                                         [("7", "1", "A", "T"), ("7", "1", "A", "T")],
+                                         [("13", "100", "A", "T")],
+                                         [("13", "109", "CGA", "C")],
+                                         [("13", "109", "CGT", "C")]]))
+
+
+if __name__ == '__main__':
+    unittest.main()
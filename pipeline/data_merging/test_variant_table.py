@@ -0,0 +1,76 @@
+import unittest
+
+from variant_table import EncodedRows, VariantTable, format_cell
+
+
+class TestVariantTable(unittest.TestCase):
+
+    def setUp(self):
+        self.columns = ["Source", "Chr", "Pos"]
+        self.table = VariantTable(self.columns, "-")
+        self.table["chr13:g.1:A>T"] = ["ENIGMA", "13", "1"]
+        self.table["chr13:g.2:A>T"] = [["ENIGMA", "ClinVar"], "13", "2"]
+
+    def test_round_trip(self):
+        self.assertEqual(self.table["chr13:g.2:A>T"], [["ENIGMA", "ClinVar"], "13", "2"])
+        self.assertEqual(len(self.table), 2)
+        self.assertEqual(self.table.keys(), ["chr13:g.1:A>T", "chr13:g.2:A>T"])
+
+    def test_repeated_values_share_codes(self):
+        self.assertEqual(len(self.table.dictionaries[1]), 1)
+        self.assertEqual(self.table.dictionaries[0].decode(0), "ENIGMA")
+
+    def test_decoded_rows_are_copies(self):
+        self.table["chr13:g.2:A>T"][0].append("BIC")
+        self.assertEqual(self.table.get_cell("chr13:g.2:A>T", 0), ["ENIGMA", "ClinVar"])
+
+    def test_add_columns_fills_default(self):
+        self.table.add_columns(["Pathogenicity_ClinVar"])
+        self.assertEqual(self.columns[-1], "Pathogenicity_ClinVar")
+        self.assertEqual(self.table["chr13:g.1:A>T"], ["ENIGMA", "13", "1", "-"])
+        self.table.set_cell("chr13:g.1:A>T", 3, ["Benign"])
+        self.assertEqual(self.table.get_cell("chr13:g.1:A>T", 3), ["Benign"])
+
+    def test_pop_removes_row(self):
+        self.assertEqual(self.table.pop("chr13:g.1:A>T"), ["ENIGMA", "13", "1"])
+        self.assertFalse("chr13:g.1:A>T" in self.table)
+        self.assertEqual([k for k, v in self.table.iteritems()], ["chr13:g.2:A>T"])
+        self.table["chr13:g.1:A>T"] = ["BIC", "13", "1"]
+        self.assertEqual(self.table.keys(), ["chr13:g.2:A>T", "chr13:g.1:A>T"])
+
+    def test_values_are_shared_across_columns_and_tables(self):
+        # distinct string objects, as they would be when read from different files
+        submitter = "".join(["Ambry", "Genetics"])
+        other = VariantTable(["Submitter_ClinVar", "Submitter_LOVD"], "-")
+        other["chr13:g.1:A>T"] = [[submitter], "".join(["Ambry", "Genetics"])]
+        self.assertIs(other.dictionaries[0].values[0][0], other.dictionaries[1].values[0])
+        reports = EncodedRows(["Submitter_ClinVar"])
+        reports.append(["".join(["Ambry", "Genetics"])])
+        self.assertIs(reports.dictionaries[0].values[0], other.dictionaries[1].values[0])
+
+    def test_encoded_rows(self):
+        reports = EncodedRows(self.columns)
+        reports.extend([["ENIGMA", "13", "1"], [["BIC"], "13", "1"]])
+        self.assertEqual(len(reports), 2)
+        self.assertEqual(list(reports), [["ENIGMA", "13", "1"], [["BIC"], "13", "1"]])
+        self.assertEqual(len(reports.dictionaries[1]), 1)
+        self.assertEqual(list(reports.formatted_rows(lambda value: ",".join(value) if type(value) == list else value)),
+                         [["ENIGMA", "13", "1"], ["BIC", "13", "1"]])
+        with self.assertRaises(Exception):
+            reports.append(["ENIGMA"])
+
+    def test_formatted_rows(self):
+        self.table.set_cell("chr13:g.1:A>T", 2, 1)
+        self.assertEqual(list(self.table.formatted_rows(format_cell, ["chr13:g.2:A>T", "chr13:g.1:A>T"])),
+                         [["ENIGMA,ClinVar", "13", "2"], ["ENIGMA", "13", "1"]])
+        del self.table["chr13:g.2:A>T"]
+        self.assertEqual(list(self.table.formatted_rows(format_cell)), [["ENIGMA", "13", "1"]])
+        self.assertEqual(format_cell([1, "-", 0.5]), "1,-,0.5")
+
+    def test_rejects_wrong_width(self):
+        with self.assertRaises(Exception):
+            self.table["chr13:g.3:A>T"] = ["ENIGMA"]
+
+
+if __name__ == '__main__':
+    unittest.main()
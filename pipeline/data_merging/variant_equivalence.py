@@ -0,0 +1,101 @@
+"""
+Sequence level comparison of variants against a reference slice.
+
+Two variants are equivalent when applying each of them to the reference
+yields the same sequence. Outside the span between the two edits the edited
+sequences are always identical, so only that span is compared, and it is
+read in place from a memoryview or buffer of the reference.
+"""
+
+# version of the keys built from canonical_edit. Bump it whenever
+# canonical_edit or a key built from it changes, so cached keys of an
+# earlier version are never reused
+CANONICAL_KEY_VERSION = 1
+
+
+def edits_equal(seq, pos1, ref_len1, alt1, pos2, ref_len2, alt2):
+    """returns seq[:pos1] + alt1 + seq[pos1 + ref_len1:] ==
+               seq[:pos2] + alt2 + seq[pos2 + ref_len2:]
+    positions are 0-based offsets into seq"""
+    alt1 = str(alt1)
+    alt2 = str(alt2)
+
+    # must be same number of bases after variation
+    shift = len(alt1) - ref_len1
+    if shift != len(alt2) - ref_len2:
+        return False
+
+    # make sure that edit 1 is upstream of edit 2
+    if pos1 > pos2:
+        pos1, ref_len1, alt1, pos2, ref_len2, alt2 = pos2, ref_len2, alt2, pos1, ref_len1, alt1
+
+    # Both edited sequences match the reference before pos1 and match the
+    # reference shifted by `shift` from end onwards.
+    end = max(pos1 + len(alt1), pos2 + len(alt2))
+    if isinstance(seq, str):
+        seq = memoryview(seq)
+    window1 = [(alt1, 0, len(alt1)),
+               (seq, pos1 + ref_len1, end - shift)]
+    window2 = [(seq, pos1, pos2),
+               (alt2, 0, len(alt2)),
+               (seq, pos2 + ref_len2, end - shift)]
+    return _segments_equal(window1, window2)
+
+
+def canonical_edit(seq, pos, ref_len, alt):
+    """returns (pos, ref_len, alt) of the edit replacing ref_len bases at
+    pos with alt, left-aligned and trimmed against seq. Two edits give the
+    same result iff edits_equal considers them equal"""
+    seq_len = len(seq)
+    assert pos >= 0, "variant position is below the reference"
+    assert pos + ref_len <= seq_len, "variant position is above the reference"
+
+    # The edited sequence is seq[:pos] + alt + seq[pos + ref_len:], of length
+    # edited_len. It is never built; only the bases around the edit are read.
+    alt_len = len(alt)
+    edited_len = seq_len + alt_len - ref_len
+    min_len = min(seq_len, edited_len)
+
+    def edited_base(i):
+        if i < pos:
+            return seq[i]
+        elif i < pos + alt_len:
+            return alt[i - pos]
+        else:
+            return seq[i - alt_len + ref_len]
+
+    # length of the common suffix of the reference and the edited sequence
+    suffix = seq_len - pos - ref_len
+    while suffix < min_len and edited_base(edited_len - 1 - suffix) == seq[seq_len - 1 - suffix]:
+        suffix += 1
+
+    # length of the common prefix, not overlapping the common suffix, which
+    # shifts the edit as far left as the reference allows
+    prefix = min(pos, min_len - suffix)
+    while prefix < min_len - suffix and edited_base(prefix) == seq[prefix]:
+        prefix += 1
+
+    canonical_alt = "".join(edited_base(i) for i in xrange(prefix, edited_len - suffix))
+    return (prefix, seq_len - suffix - prefix, canonical_alt)
+
+
+def _segments_equal(segments1, segments2):
+    # segments are (buffer, start, stop) and both lists cover the same length
+    segments1 = [segment for segment in segments1 if segment[2] > segment[1]]
+    segments2 = [segment for segment in segments2 if segment[2] > segment[1]]
+    i, j = 0, 0
+    while i < len(segments1) and j < len(segments2):
+        buf1, start1, stop1 = segments1[i]
+        buf2, start2, stop2 = segments2[j]
+        n = min(stop1 - start1, stop2 - start2)
+        if buf1[start1:start1 + n] != buf2[start2:start2 + n]:
+            return False
+        if start1 + n == stop1:
+            i += 1
+        else:
+            segments1[i] = (buf1, start1 + n, stop1)
+        if start2 + n == stop2:
+            j += 1
+        else:
+            segments2[j] = (buf2, start2 + n, stop2)
+    return i == len(segments1) and j == len(segments2)
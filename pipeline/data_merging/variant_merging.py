@@ -5,23 +5,35 @@ the exisitng enigma variants:
 """
 import argparse
 import datetime
+import heapq
+import itertools
 import os
 import pickle
 import re
 import shutil
 import subprocess
 import tempfile
-import vcf
 import logging
+import multiprocessing
+import numpy as np
 from StringIO import StringIO
+from collections import OrderedDict
 from copy import deepcopy
 from pprint import pprint
 from shutil import copy
 from numbers import Number
 import csv
 import aggregate_reports
+import equivalence_cache
+import merge_checkpoint
+import merge_profile
+import reference_regions
+import report_provenance
+import sites_vcf
 import urllib
 import utilities
+import variant_equivalence
+from variant_table import VariantTable, format_cell
 
 
 # GENOMIC VERSION:
@@ -39,6 +51,9 @@ COLUMN_VCF_ALT = 6
 # This is the string to be stored when a field is empty
 DEFAULT_CONTENTS = "-"
 
+# buffer size of the merged and reports TSVs, which are written a row at a time
+OUTPUT_BUFFER_SIZE = 1 << 20
+
 # files needed for string comparison
 
 # key value pair dictionaries of all extra fields in various databases to add
@@ -173,6 +188,10 @@ ESP_FILE = "esp.brca12.sorted.hg38.vcf"
 
 DISCARDED_REPORTS_WRITER = None
 
+# stages of the merge in the order they run, each writes a checkpoint of the variants when it finishes
+STAGES = ["preprocessing", "add_new_source", "variant_standardize", "string_comparison_merge", "write_new_tsv"]
+RESUMABLE_STAGES = STAGES[1:]
+
 
 def options(parser):
     parser.add_argument("-i", "--input", help="Input VCF directory",
@@ -180,30 +199,41 @@ def options(parser):
     parser.add_argument("-o", "--output",
                         default="/home/brca/pipeline-data/pipeline-output/")
     parser.add_argument("-p", "--de_novo", default=False,
-                        help="string comparison all over, instead of loading from pickle dump",
+                        help="string comparison all over, instead of reusing the equivalence cache",
                         action="store_true")
+    parser.add_argument("-e", "--equivalence_cache",
+                        help="directory of the equivalence cache kept between runs, defaults to the output directory")
+    parser.add_argument("--validate_equivalence_cache", type=int, default=0, metavar="N",
+                        help="recompute N randomly chosen cached equivalence keys and discard the cache if any differ")
     parser.add_argument('-r', "--reference", help="reference data directory",
                         default="/home/brca/pipeline-data/pipeline-resources/")
     parser.add_argument('-a', "--artifacts_dir", help='Artifacts directory with pipeline artifact files.')
     parser.add_argument("-v", "--verbose", action="count", default=False, help="determines logging")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of sources to preprocess in parallel")
+    parser.add_argument("-s", "--streaming", default=False, action="store_true",
+                        help="merge the position sorted sources in one pass, holding only nearby variants in memory")
+    parser.add_argument("--checkpoint_dir",
+                        help="directory of the checkpoints written after each stage, defaults to checkpoints in the output directory")
+    parser.add_argument("--resume_from", "--resume-from", choices=RESUMABLE_STAGES,
+                        help="restart a failed run at this stage from the checkpoint of the stage before it")
 
 ARGS = None
+PROFILE = merge_profile.MergeProfile()
+REFERENCE = None
 BRCA1 = None
 BRCA2 = None
 
 
 def init(args):
-    global BRCA1, BRCA2, ARGS
+    global REFERENCE, BRCA1, BRCA2, ARGS
 
     ARGS = args
-    BRCA1 = {"hg38": {"start": 43000000,
-                      "sequence": open(ARGS.reference + "brca1_hg38.txt", "r").read().upper()},
-             "hg19": {"start": 41100000,
-                      "sequence": open(ARGS.reference + "brca1_hg19.txt", "r").read().upper()}}
-    BRCA2 = {"hg38": {"start": 32300000,
-                      "sequence": open(ARGS.reference + "brca2_hg38.txt", "r").read().upper()},
-             "hg19": {"start": 32800000,
-                      "sequence": open(ARGS.reference + "brca2_hg19.txt", "r").read().upper()}}
+    # sequences are buffers over one shared mapping of the packed reference,
+    # which preprocessing workers inherit without copying
+    REFERENCE = reference_regions.load(ARGS.reference)
+    BRCA1 = REFERENCE.gene("17")
+    BRCA2 = REFERENCE.gene("13")
 
 
 def main():
@@ -211,8 +241,11 @@ def main():
 
     parser = argparse.ArgumentParser()
     options(parser)
+    args = parser.parse_args()
+    if args.resume_from and args.streaming:
+        parser.error("--resume_from can't be used with --streaming, which has no checkpoints")
 
-    init(parser.parse_args())
+    init(args)
 
     if ARGS.verbose:
         logging_level = logging.DEBUG
@@ -220,44 +253,106 @@ def main():
         logging_level = logging.CRITICAL
 
     log_file_path = ARGS.artifacts_dir + "variant_merging.log"
-    logging.basicConfig(filename=log_file_path, filemode="w", level=logging_level)
-
-    discarded_reports_file = open(ARGS.artifacts_dir + "discarded_reports.tsv", "w")
+    logging.basicConfig(filename=log_file_path, filemode="a" if ARGS.resume_from else "w", level=logging_level)
 
     fieldnames = ['Report_id', 'Source', 'Reason', 'Variant']
 
-    DISCARDED_REPORTS_WRITER = csv.DictWriter(discarded_reports_file, delimiter="\t", fieldnames=fieldnames)
-    DISCARDED_REPORTS_WRITER.writeheader()
-
-    # merge repeats within data sources before merging between data sources
-    source_dict, columns, variants = preprocessing()
+    if ARGS.resume_from:
+        with PROFILE.stage("resume_checkpoint") as stage:
+            checkpoint = merge_checkpoint.load(checkpoint_dir(), STAGES[STAGES.index(ARGS.resume_from) - 1])
+            stage.records_out = len(checkpoint.variants)
+        print "resuming from %s with the checkpoint of %s" % (ARGS.resume_from, checkpoint.stage)
+        (sources, columns, variants) = (checkpoint.state["sources"], checkpoint.columns, checkpoint.variants)
+        # drops reports discarded after the checkpoint, the stages that discarded them are run again
+        discarded_reports_file = open(ARGS.artifacts_dir + "discarded_reports.tsv", "r+")
+        discarded_reports_file.truncate(checkpoint.state["discarded_reports_size"])
+        discarded_reports_file.seek(0, os.SEEK_END)
+        DISCARDED_REPORTS_WRITER = csv.DictWriter(discarded_reports_file, delimiter="\t", fieldnames=fieldnames)
+    else:
+        discarded_reports_file = open(ARGS.artifacts_dir + "discarded_reports.tsv", "w")
+        DISCARDED_REPORTS_WRITER = csv.DictWriter(discarded_reports_file, delimiter="\t", fieldnames=fieldnames)
+        DISCARDED_REPORTS_WRITER.writeheader()
+
+        # merge repeats within data sources before merging between data sources
+        with PROFILE.stage("preprocessing"):
+            source_dict, columns, variants = preprocessing()
+        sources = source_dict.items()
+        if not ARGS.streaming:
+            save_checkpoint("preprocessing", variants, sources, discarded_reports_file)
+
+    if ARGS.streaming:
+        print "\n------------streaming merge of sorted datasets------------------------------"
+        with PROFILE.stage("streaming_merge") as stage:
+            n_variants = streaming_merge(columns, variants, source_dict, ARGS.output + "merged.tsv")
+            stage.records_out = n_variants
+        finish_merge(n_variants, discarded_reports_file, columns)
+        return
 
     # merges repeats from different data sources, adds necessary columns and data
-    print "\n------------merging different datasets------------------------------"
-    for source_name, file in source_dict.iteritems():
-        (columns, variants) = add_new_source(columns, variants, source_name,
-                                             file, FIELD_DICT[source_name])
+    if runs_stage("add_new_source"):
+        print "\n------------merging different datasets------------------------------"
+        for source_name, file in sources:
+            with PROFILE.stage("add_new_source", source_name):
+                (columns, variants) = add_new_source(columns, variants, source_name,
+                                                     file, FIELD_DICT[source_name])
+        save_checkpoint("add_new_source", variants, sources, discarded_reports_file)
 
     # standardizes genomic coordinates for variants
-    print "\n------------standardizing genomic coordinates-------------"
-    variants = variant_standardize(columns, variants=variants)
+    if runs_stage("variant_standardize"):
+        print "\n------------standardizing genomic coordinates-------------"
+        with PROFILE.stage("variant_standardize") as stage:
+            stage.records_in = len(variants)
+            variants = variant_standardize(columns, variants=variants)
+            stage.records_out = len(variants)
+        save_checkpoint("variant_standardize", variants, sources, discarded_reports_file)
 
     # compare dna sequence results of variants and merge if equivalent
-    print "------------dna sequence comparison merge-------------------------------"
-    variants = string_comparison_merge(variants)
+    if runs_stage("string_comparison_merge"):
+        print "------------dna sequence comparison merge-------------------------------"
+        with PROFILE.stage("string_comparison_merge") as stage:
+            stage.records_in = len(variants)
+            variants = string_comparison_merge(variants)
+            stage.records_out = len(variants)
+        save_checkpoint("string_comparison_merge", variants, sources, discarded_reports_file)
 
     # write final output to file
-    write_new_tsv(ARGS.output + "merged.tsv", columns, variants)
+    with PROFILE.stage("write_new_tsv") as stage:
+        write_new_tsv(ARGS.output + "merged.tsv", columns, variants)
+        stage.records_out = len(variants)
+
+    finish_merge(len(variants), discarded_reports_file, columns)
+
+
+def runs_stage(stage):
+    return ARGS.resume_from is None or STAGES.index(stage) >= STAGES.index(ARGS.resume_from)
+
+
+def checkpoint_dir():
+    return ARGS.checkpoint_dir or os.path.join(ARGS.output, "checkpoints")
 
+
+def save_checkpoint(stage, variants, sources, discarded_reports_file):
+    # the size of the discarded reports lets a resumed run drop the reports of the stages it repeats
+    discarded_reports_file.flush()
+    with PROFILE.stage("save_checkpoint", stage) as profile_stage:
+        merge_checkpoint.save(checkpoint_dir(), stage, variants,
+                              {"sources": sources, "discarded_reports_size": discarded_reports_file.tell()})
+        profile_stage.records_out = len(variants)
+
+
+def finish_merge(n_variants, discarded_reports_file, columns):
     # copy enigma file to artifacts directory along with other ready files
     copy(ARGS.input + ENIGMA_FILE, ARGS.output)
 
     # write reports to reports file
-    aggregate_reports.write_reports_tsv(ARGS.output + "reports.tsv", columns, ARGS.output)
+    with PROFILE.stage("write_reports_tsv"):
+        aggregate_reports.write_reports_tsv(ARGS.output + "reports.tsv", columns, ARGS.output)
 
     discarded_reports_file.close()
 
-    print "final number of variants: %d" % len(variants)
+    PROFILE.write(ARGS.artifacts_dir + "merge_profile.json")
+
+    print "final number of variants: %d" % n_variants
     print "Done"
 
 
@@ -277,46 +372,31 @@ def variant_standardize(columns, variants="pickle"):
         with open("temp_variants.pkl", "r") as fv:
             variants = pickle.loads(fv.read())
         fv.close()
+    keys = variants.keys()
+    chroms = variants.column(COLUMN_VCF_CHR)
+    (positions, refs, alts, reasons) = standardize_coordinates(chroms, variants.column(COLUMN_VCF_POS),
+                                                               variants.column(COLUMN_VCF_REF),
+                                                               variants.column(COLUMN_VCF_ALT))
+
     variants_to_remove = list()
+    # new genomic coordinate -> merged values of the variants moved there
     variants_to_add = {}
-    for ev, items in variants.iteritems():
-        bx_ids_for_variant = get_bx_ids_for_variant(bx_id_column_indexes, items)
-        chr = items[COLUMN_VCF_CHR]
-        pos = items[COLUMN_VCF_POS]
-        ref = items[COLUMN_VCF_REF]
-        alt = items[COLUMN_VCF_ALT]
-        if ref == "None":
-            ref = ""
-        if alt == "None":
-            alt = ""
-        if re.search("^-", ref) or re.search("^-", alt):
-            (chr, pos, ref, alt) = add_leading_base(chr, pos, ref, alt)
-        if len(ref) < 1 or len(alt) < 1:
-            (chr, pos, ref, alt) = add_leading_base(chr, pos, ref, alt)
-        (chr, pos, ref, alt) = trim_bases(chr, pos, ref, alt)
-
-        hgvs = "chr%s:g.%s:%s>%s" % (str(chr), str(pos), ref, alt)
-
-        # If the reference is wrong, remove the variant
-        if not ref_correct(chr, pos, ref, alt):
-            reason_for_discard = "Incorrect Reference"
-            variants_to_remove = prepare_variant_for_removal_and_log(ev, hgvs, items, bx_ids_for_variant, reason_for_discard, variants_to_remove)
+    for ev, chr, pos, ref, alt, reason in itertools.izip(keys, chroms, positions, refs, alts, reasons):
+        if reason is not None:
+            items = variants[ev]
+            hgvs = "chr%s:g.%s:%s>%s" % (str(chr), str(pos), ref, alt)
+            bx_ids_for_variant = get_bx_ids_for_variant(bx_id_column_indexes, items)
+            variants_to_remove = prepare_variant_for_removal_and_log(ev, hgvs, items, bx_ids_for_variant, reason, variants_to_remove)
             continue
 
-        if variant_is_false(ref, alt):
-            reason_for_discard = "Variant ref and alt are the same"
-            variants_to_remove = prepare_variant_for_removal_and_log(ev, hgvs, items, bx_ids_for_variant, reason_for_discard, variants_to_remove)
-            continue
-
-        items[COLUMN_VCF_POS] = pos
-        items[COLUMN_VCF_REF] = ref
-        items[COLUMN_VCF_ALT] = alt
+        variants.set_cell(ev, COLUMN_VCF_POS, pos)
+        variants.set_cell(ev, COLUMN_VCF_REF, ref)
+        variants.set_cell(ev, COLUMN_VCF_ALT, alt)
         newHgvs = "chr%s:g.%s:%s>%s" % (str(chr), str(pos), ref, str(alt))
-
         if newHgvs != ev:
             logging.debug("Changed genomic coordinate representation, replacing %s with %s", ev, newHgvs)
             variants_to_remove.append(ev)
-            variants_to_add = add_variant_to_dict(variants_to_add, newHgvs, items)
+            variants_to_add = add_variant_to_dict(variants_to_add, newHgvs, variants[ev])
 
     variants = remove_bad_variants(variants_to_remove, variants)
     variants = add_and_merge_new_variant_representations(variants_to_add, variants)
@@ -324,6 +404,107 @@ def variant_standardize(columns, variants="pickle"):
     return variants
 
 
+def standardize_coordinates(chroms, positions, refs, alts, version="hg38"):
+    """standardize_variant for whole columns of variants. Leading bases are
+    read from the reference and reference alleles are checked for all
+    variants at once. returns the new positions, refs and alts, and the
+    reason each variant is discarded, None for the variants that are kept"""
+    positions = list(positions)
+    refs = ["" if ref == "None" else ref for ref in refs]
+    alts = ["" if alt == "None" else alt for alt in alts]
+
+    padded = [i for i in xrange(len(chroms)) if refs[i][:1] == "-" or alts[i][:1] == "-" or
+              len(refs[i]) < 1 or len(alts[i]) < 1]
+    add_leading_bases(chroms, positions, refs, alts, padded, version)
+
+    # only alleles of more than one base can have bases in common
+    for i in xrange(len(chroms)):
+        if len(refs[i]) > 1 and len(alts[i]) > 1:
+            (positions[i], refs[i], alts[i]) = trim_bases(chroms[i], positions[i], refs[i], alts[i])[1:]
+
+    correct = refs_correct(chroms, positions, refs, version)
+    reasons = []
+    for i in xrange(len(chroms)):
+        # ref_correct logs the wrong reference, and decides the variants outside the regions
+        if not correct[i] and not ref_correct(chroms[i], positions[i], refs[i], alts[i], version):
+            reasons.append("Incorrect Reference")
+        elif variant_is_false(refs[i], alts[i]):
+            reasons.append("Variant ref and alt are the same")
+        else:
+            reasons.append(None)
+    return (positions, refs, alts, reasons)
+
+
+def add_leading_bases(chroms, positions, refs, alts, rows, version="hg38"):
+    """add_leading_base for the given rows of the columns, in place. The
+    leading bases of each chromosome are read from the reference at once,
+    add_leading_base handles the rows it would reject"""
+    leading = {"13": [], "17": []}
+    for i in rows:
+        empty_ref = refs[i] in ("-", "")
+        empty_alt = alts[i] in ("-", "")
+        if (chroms[i] in leading and empty_ref != empty_alt and
+                (type(positions[i]) == int or str(positions[i]).isdigit())):
+            # an insertion comes after the base at its position, a deletion is of the bases from its position
+            leading_pos = int(positions[i]) if empty_ref else int(positions[i]) - 1
+            leading[chroms[i]].append((i, leading_pos))
+        else:
+            (positions[i], refs[i], alts[i]) = add_leading_base(chroms[i], positions[i], refs[i], alts[i], version)[1:]
+    for chr, gene in (("13", BRCA2), ("17", BRCA1)):
+        start = gene[version]["start"]
+        length = len(gene[version]["sequence"])
+        inside = []
+        for i, pos in leading[chr]:
+            if 0 <= pos - 1 - start < length:
+                inside.append((i, pos))
+            else:
+                (positions[i], refs[i], alts[i]) = add_leading_base(chroms[i], positions[i], refs[i], alts[i], version)[1:]
+        bases = REFERENCE.bases(chr, version, [pos for i, pos in inside])
+        for (i, pos), base in itertools.izip(inside, bases):
+            positions[i] = str(pos)
+            refs[i] = base + ("" if refs[i] == "-" else refs[i])
+            alts[i] = base + ("" if alts[i] == "-" else alts[i])
+
+
+def standardize_variant(ev, items, bx_id_column_indexes, variants_to_remove):
+    """standardizes the representation of one variant in place, see
+    variant_standardize. returns the new genomic coordinate, or None if the
+    variant was discarded and added to variants_to_remove"""
+    bx_ids_for_variant = get_bx_ids_for_variant(bx_id_column_indexes, items)
+    chr = items[COLUMN_VCF_CHR]
+    pos = items[COLUMN_VCF_POS]
+    ref = items[COLUMN_VCF_REF]
+    alt = items[COLUMN_VCF_ALT]
+    if ref == "None":
+        ref = ""
+    if alt == "None":
+        alt = ""
+    if re.search("^-", ref) or re.search("^-", alt):
+        (chr, pos, ref, alt) = add_leading_base(chr, pos, ref, alt)
+    if len(ref) < 1 or len(alt) < 1:
+        (chr, pos, ref, alt) = add_leading_base(chr, pos, ref, alt)
+    (chr, pos, ref, alt) = trim_bases(chr, pos, ref, alt)
+
+    hgvs = "chr%s:g.%s:%s>%s" % (str(chr), str(pos), ref, alt)
+
+    # If the reference is wrong, remove the variant
+    if not ref_correct(chr, pos, ref, alt):
+        reason_for_discard = "Incorrect Reference"
+        variants_to_remove = prepare_variant_for_removal_and_log(ev, hgvs, items, bx_ids_for_variant, reason_for_discard, variants_to_remove)
+        return None
+
+    if variant_is_false(ref, alt):
+        reason_for_discard = "Variant ref and alt are the same"
+        variants_to_remove = prepare_variant_for_removal_and_log(ev, hgvs, items, bx_ids_for_variant, reason_for_discard, variants_to_remove)
+        return None
+
+    items[COLUMN_VCF_POS] = pos
+    items[COLUMN_VCF_REF] = ref
+    items[COLUMN_VCF_ALT] = alt
+    newHgvs = "chr%s:g.%s:%s>%s" % (str(chr), str(pos), ref, str(alt))
+    return newHgvs
+
+
 def remove_bad_variants(variants_to_remove, variants):
     for old_variant in variants_to_remove:
         del variants[old_variant]
@@ -384,6 +565,7 @@ def add_variant_to_dict(variant_dict, genomic_coordinate, values):
                 logging.debug("Merged properties: %s", merged_properties)
 
         logging.debug('Merged output: \n %s', existing_variant)
+        variant_dict[genomic_coordinate] = existing_variant
     else:
         variant_dict[genomic_coordinate] = values
 
@@ -510,17 +692,45 @@ def string_comparison_merge(variants):
     # makes sure the input genomic coordinate strings are unique (no dupes)
     assert (len(variants.keys()) == len(set(variants.keys())))
 
-    # optimization for comparison -- saves previously identified equivalent genomic strings in a file for faster reference
+    cache = open_equivalence_cache()
+    equivalence = find_equivalent_variant(variants, cache)
+    save_equivalence(cache, equivalence)
+    for equivalent_v in equivalence:
+        #
+        # equivalent_v contains a set of variants found to be equivalent.
+        # The next step is to merge data for these variants, which will
+        # end up in the array merged_row.
+        # Each variant in the equivalence set is removed from the hash of
+        # variants, and an entry for the entire equivalence set added.
+        merged_row = merge_equivalent_rows([variants.pop(each_v) for each_v in equivalent_v])
+        variants[",".join(list(equivalent_v))] = merged_row
+    return variants
+
+
+def open_equivalence_cache():
+    # optimization for comparison -- keeps the canonical key of every variant seen in
+    # previous runs, so only new variant representations need to be compared
+    cache_dir = ARGS.equivalence_cache or ARGS.output
+    cache = equivalence_cache.EquivalenceCache(cache_dir, VERSION,
+                                               [BRCA1[VERSION]["sequence"], BRCA2[VERSION]["sequence"]])
     if ARGS.de_novo:
-        logging.info('Calculating all equivalent variants without pickle dump.')
-        equivalence = find_equivalent_variant(variants)
-        with open(ARGS.output + "equivalent_variants.pkl", "w") as f:
-            f.write(pickle.dumps(equivalence))
-        f.close()
-    else:
-        logging.warning('Using equivalent_variants.pkl')
-        print "********* WARNING: Using equivalent_variants.pkl to determine equivalents instead of testing individually *******"
-        equivalence = pickle.loads(open(ARGS.output + "equivalent_variants.pkl", "r").read())
+        logging.info('Calculating all equivalent variants without the equivalence cache.')
+        cache.clear()
+    elif ARGS.validate_equivalence_cache:
+        mismatches = cache.spot_check(canonical_variant_key, ARGS.validate_equivalence_cache)
+        if mismatches:
+            logging.warning('%d cached equivalence keys are wrong, discarding the cache', len(mismatches))
+            print "********* WARNING: equivalence cache failed validation, recalculating all equivalent variants *******"
+            cache.clear()
+    return cache
+
+
+def save_equivalence(cache, equivalence):
+    cache.save()
+    logging.info('Equivalence cache hits: %d, misses: %d', cache.hits, cache.misses)
+    print "%d of %d variants found in equivalence cache" % (cache.hits, cache.hits + cache.misses)
+    with open(ARGS.output + "equivalent_variants.pkl", "w") as f:
+        f.write(pickle.dumps(equivalence))
     n_before_merge = 0
     for each in equivalence:
         n_before_merge += len(each)
@@ -529,74 +739,55 @@ def string_comparison_merge(variants):
     logging.info('After merge: %s', str(n_after_merge))
     print "%d equivalent variants are merged into %d unique variants" %(
           n_before_merge, n_after_merge)
-    for equivalent_v in equivalence:
-        #
-        # equivalent_v contains a set of variants found to be equivalent.
-        # The next step is to merge data for these variants, which will
-        # end up in the array merged_row.
-        merged_row = []
-        for each_v in equivalent_v:
-            if len(merged_row) == 0:
-                #
-                # If this is the first variant in the equivalence set, initialize
-                # the merged data to the data for this variant.
-                merged_row = variants[each_v]
-            else:
-                for index, values_merged_so_far in enumerate(merged_row):
-                    values_to_be_merged = variants[each_v][index]
-                    # If either the new value or the old value is non-blank, use it.
-                    if values_merged_so_far == DEFAULT_CONTENTS and values_to_be_merged != DEFAULT_CONTENTS:
-                        merged_row[index] = values_to_be_merged
-                    elif values_merged_so_far != DEFAULT_CONTENTS and values_to_be_merged == DEFAULT_CONTENTS:
-                        merged_row[index] = values_merged_so_far
-                        # Skip over the VCF columns.  We're going to assume that one
-                        # equivalence of them is enough, which will simplify life for
-                        # downstream methods.
-                    elif index == COLUMN_VCF_CHR or index == COLUMN_VCF_POS or index == COLUMN_VCF_REF or index == COLUMN_VCF_ALT:
-                        continue
-                    else:
-                        # If both the new value and old value are non-blank and different,
-                        # generate a list that contains both new and old values.
-                        # If the old value is already a list, append the new value.
-                        # If the old value is not a list, create a list containing the old
-                        # value and append the new value.
-                        if values_merged_so_far != values_to_be_merged:
-                            if type(values_merged_so_far) != list:
-                                values_merged_so_far = [values_merged_so_far]
-                            if values_to_be_merged not in values_merged_so_far:
-                                if type(values_to_be_merged) == list:
-                                    values_merged_so_far.extend(values_to_be_merged)
-                                else:
-                                    values_merged_so_far.append(values_to_be_merged)
-                            merged_row[index] = values_merged_so_far
-
-            # Remove each variant in the equivalence set from the hash of
-            # variants.  Later on, we'll add an entry for the entire equivalence
-            # set.
-            variants.pop(each_v)
-        variants[",".join(list(equivalent_v))] = merged_row
-    return variants
 
 
-def find_equivalent_variant(variants):
-    genome_coors = variants.keys()
+def merge_equivalent_rows(rows):
+    """merges the data of variants found to be equivalent into one row, one
+    column at a time. Blank values are ignored. A column keeps its value if
+    all the variants that have one agree, otherwise it becomes the list of
+    the distinct values in row order, with lists flattened. For chr, pos,
+    ref and alt the first value is enough."""
+    merged_row = []
+    for index, column in enumerate(itertools.izip(*rows)):
+        values = [value for value in column if value != DEFAULT_CONTENTS]
+        if not values:
+            merged_row.append(column[0])
+        elif (index in (COLUMN_VCF_CHR, COLUMN_VCF_POS, COLUMN_VCF_REF, COLUMN_VCF_ALT) or
+              all(value == values[0] for value in values[1:])):
+            merged_row.append(values[0])
+        else:
+            merged_row.append(distinct_values(values))
+    return merged_row
+
+
+def distinct_values(values):
+    # flattens lists, keeping the first occurrence of each value
+    seen = set()
+    merged = []
+    for value in values:
+        for each in (value if type(value) == list else [value]):
+            if each not in seen:
+                seen.add(each)
+                merged.append(each)
+    return merged
+
+
+def find_equivalent_variant(variants, cache=None):
+    # Variants are equivalent when they produce the same edited sequence, so
+    # grouping by canonical key gives the same sets as pairwise variant_equal.
     uniq_variants = {}
     logging.info("Running find_equivalent_variants.")
-    for i, v in enumerate(genome_coors):
-        variant_exist = False
-        for existing_v in uniq_variants:
-            if v == existing_v:
-                logging.debug('v == existing_v \n "v: " %s \n "existing_v: " %s', str(v), str(existing_v))
-                continue
-            else:
-                v1 = [variants[v][COLUMN_VCF_CHR], variants[v][COLUMN_VCF_POS], variants[v][COLUMN_VCF_REF], variants[v][COLUMN_VCF_ALT]]
-                v2 = [variants[existing_v][COLUMN_VCF_CHR], variants[existing_v][COLUMN_VCF_POS], variants[existing_v][COLUMN_VCF_REF], variants[existing_v][COLUMN_VCF_ALT]]
-                if variant_equal(v1, v2):
-                    logging.info("Equal variants: \n %s \n %s", str(v1), str(v2))
-                    variant_exist = True
-                    uniq_variants[existing_v].add(v)
-        if not variant_exist:
-            uniq_variants[v] = set([v])
+    for genome_coor, items in variants.iteritems():
+        v = [items[COLUMN_VCF_CHR], items[COLUMN_VCF_POS], items[COLUMN_VCF_REF], items[COLUMN_VCF_ALT]]
+        if cache is None:
+            key = canonical_variant_key(v)
+        else:
+            key = cache.key(v, canonical_variant_key)
+        if key in uniq_variants:
+            logging.info("Equal variants: \n %s \n %s", genome_coor, str(list(uniq_variants[key])))
+            uniq_variants[key].add(genome_coor)
+        else:
+            uniq_variants[key] = set([genome_coor])
     equivalent_variants = []
     for value in uniq_variants.values():
         if len(value) > 1:
@@ -605,6 +796,225 @@ def find_equivalent_variant(variants):
     return equivalent_variants
 
 
+def canonical_variant_key(v, version="hg38"):
+    """returns (chr, pos, ref_length, alt) describing the edit left-aligned and
+    trimmed against the reference, 0-based relative to the reference slice.
+    Two variants have the same key iff variant_equal considers them equal.
+    Bump variant_equivalence.CANONICAL_KEY_VERSION if the key changes."""
+    chr, pos, ref, alt = v
+    pos = int(pos)
+
+    if chr == "13":
+        seq = BRCA2[version]["sequence"]
+        pos = pos - 1 - BRCA2[version]["start"]
+    elif chr == "17":
+        seq = BRCA1[version]["sequence"]
+        pos = pos - 1 - BRCA1[version]["start"]
+    else:
+        assert False, "Bad chrom in variant"
+
+    return (chr,) + variant_equivalence.canonical_edit(seq, pos, len(ref), alt)
+
+
+def streaming_merge(columns, enigma, source_dict, filename):
+    """merges the ENIGMA reports and the position sorted sources in one pass,
+    writing each merged variant as soon as no later position can hold an
+    equivalent representation of it. returns the number of variants written"""
+    source_columns = add_source_columns(columns, source_dict)
+    positions = merged_positions(enigma, source_dict.items())
+    positions = ((position, position_variants(columns, source_columns, reports))
+                 for position, reports in positions)
+    positions = standardized_positions(columns, positions)
+
+    cache = open_equivalence_cache()
+    equivalence = []
+    merged = merge_equivalent_window(positions, cache, equivalence)
+    n_variants = write_variant_rows(filename, columns, ((genome_coor, map(format_cell, variant))
+                                                        for genome_coor, variant in merged))
+    save_equivalence(cache, equivalence)
+    return n_variants
+
+
+def merge_position(chrom, pos):
+    # order of the sorted source files: by chromosome, then position
+    return (int(chrom), int(pos))
+
+
+def sorted_enigma_reports(path):
+    """reads the ENIGMA reports for the streaming merge, returns the columns
+    and the reports in position order"""
+    enigma_file = open(path, "r")
+    header = enigma_file.readline()
+    columns = add_columns_to_enigma_data(header)
+    # ENIGMA is not sorted, but it is small enough to sort in memory
+    reports = sorted(enigma_reports(enigma_file, header, columns),
+                     key=lambda report: merge_position(report[1][COLUMN_VCF_CHR], report[1][COLUMN_VCF_POS]))
+    enigma_file.close()
+    return (columns, reports)
+
+
+def add_source_columns(columns, source_dict):
+    """appends the columns of each source, as add_new_source does, returns
+    the (column index, INFO field) pairs of each source"""
+    source_columns = {}
+    for source in source_dict.keys():
+        field_dict = FIELD_DICT[source]
+        old_column_num = len(columns)
+        columns.extend(column_title + "_{0}".format(source) for column_title in field_dict.keys())
+        source_columns[source] = zip(range(old_column_num, len(columns)), field_dict.values())
+    return source_columns
+
+
+def merged_positions(enigma, sources):
+    """walks the ENIGMA reports and the records of each source in lockstep,
+    yields (position, reports) for each position, with the reports of a
+    position as (source, genomic coordinate, report) in source order"""
+    streams = [ranked_reports(0, "ENIGMA", ((merge_position(items[COLUMN_VCF_CHR], items[COLUMN_VCF_POS]), hgvs, items)
+                                             for hgvs, items in enigma))]
+    for rank, (source_name, file_name) in enumerate(sources, 1):
+        streams.append(ranked_reports(rank, source_name, source_records(source_name, file_name)))
+    for position, reports in itertools.groupby(heapq.merge(*streams), lambda report: report[0]):
+        yield position, [(source, genome_coor, report) for (_, _, _, source, genome_coor, report) in reports]
+
+
+def ranked_reports(rank, source, reports):
+    # the rank and sequence number keep reports at one position in source and file order
+    for i, (position, genome_coor, report) in enumerate(reports):
+        yield (position, rank, i, source, genome_coor, report)
+
+
+def source_records(source, file_name):
+    """yields (position, genomic coordinate, record) for each record of a
+    source vcf in position order"""
+    f = open(file_name, "r")
+    position_sorted = is_position_sorted(f)
+    f.seek(0)
+    records = sites_vcf.Reader(f, strict_whitespace=True)
+    if not position_sorted:
+        logging.warning("%s is not sorted by position, sorting it in memory", file_name)
+        print "{0} is not sorted by position, sorting it in memory".format(source)
+        records = sorted(records, key=lambda record: merge_position(record.CHROM, record.POS))
+    for record in records:
+        genome_coor = ("chr" + str(record.CHROM) + ":g." + str(record.POS) + ":" +
+                       record.REF + ">" + str(record.ALT[0]))
+        yield (merge_position(record.CHROM, record.POS), genome_coor, record)
+    f.close()
+
+
+def is_position_sorted(f):
+    # true if records are in merge_position order
+    last = None
+    for line in f:
+        if line.startswith("#"):
+            continue
+        fields = line.split("\t", 2)
+        position = merge_position(fields[0], fields[1])
+        if last is not None and position < last:
+            return False
+        last = position
+    return True
+
+
+def position_variants(columns, source_columns, reports):
+    """builds the variants reported at one position the way save_enigma_to_dict
+    and add_new_source do for the whole file"""
+    variants = OrderedDict()
+    for source, genome_coor, report in reports:
+        if source == "ENIGMA":
+            items = report + [DEFAULT_CONTENTS] * (len(columns) - len(report))
+            variants = add_variant_to_dict(variants, genome_coor, items)
+            continue
+        if genome_coor in variants:
+            sources = variants[genome_coor][COLUMN_SOURCE]
+            if type(sources) != list:
+                sources = [sources]
+            variants[genome_coor][COLUMN_SOURCE] = sources + [source]
+        else:
+            variants[genome_coor] = associate_chr_pos_ref_alt_with_item(report, len(columns), source, genome_coor)
+        for column_index, value in source_columns[source]:
+            variants[genome_coor][column_index] = source_field_value(source, report, value, genome_coor)
+    return variants
+
+
+def standardized_positions(columns, positions):
+    # standardizes the variants of each position, dropping discarded ones
+    bx_id_column_indexes = get_bx_id_column_indexes(columns)
+    for position, variants in positions:
+        standardized = []
+        for ev, items in variants.iteritems():
+            newHgvs = standardize_variant(ev, items, bx_id_column_indexes, [])
+            if newHgvs is not None:
+                standardized.append((newHgvs, items))
+        yield position, standardized
+
+
+def merge_equivalent_window(positions, cache, equivalence):
+    """takes (position, [(genomic coordinate, items)]) of standardized
+    variants in position order and yields (genomic coordinate, items) of the
+    merged variants. Equivalent variants are held back only until the input
+    has passed the rightmost position an equivalent representation can start
+    at; the sets of equivalent variants are appended to equivalence"""
+    pending = {}
+    # (position after which a canonical key is complete, sequence number, key)
+    bounds = []
+    sequence = itertools.count()
+    for position, variants in itertools.chain(positions, [((float("inf"), 0), [])]):
+        # standardizing moves a variant at most one base to the left
+        while bounds and bounds[0][0] < position:
+            (_, _, key) = heapq.heappop(bounds)
+            yield merged_equivalent_variant(pending.pop(key), equivalence)
+        for genome_coor, items in variants:
+            v = [items[COLUMN_VCF_CHR], items[COLUMN_VCF_POS], items[COLUMN_VCF_REF], items[COLUMN_VCF_ALT]]
+            if cache is None:
+                key = canonical_variant_key(v)
+            else:
+                key = cache.key(v, canonical_variant_key)
+            if key not in pending:
+                pending[key] = OrderedDict()
+                bound = merge_position(items[COLUMN_VCF_CHR], rightmost_variant_position(key) + 1)
+                heapq.heappush(bounds, (bound, next(sequence), key))
+            pending[key] = add_variant_to_dict(pending[key], genome_coor, items)
+
+
+def merged_equivalent_variant(variants, equivalence):
+    if len(variants) == 1:
+        return variants.items()[0]
+    logging.info("Equal variants: \n %s", str(variants.keys()))
+    equivalence.append(set(variants.keys()))
+    return (",".join(variants.keys()), merge_equivalent_rows(variants.values()))
+
+
+def rightmost_variant_position(key, version="hg38"):
+    """returns the largest position at which a variant with the given
+    canonical key can be written, i.e. the edit shifted as far right as the
+    reference allows"""
+    chr, prefix, ref_len, alt = key
+    if chr == "13":
+        seq = BRCA2[version]["sequence"]
+        start = BRCA2[version]["start"]
+    elif chr == "17":
+        seq = BRCA1[version]["sequence"]
+        start = BRCA1[version]["start"]
+    else:
+        assert False, "Bad chrom in variant"
+
+    alt_len = len(alt)
+    min_len = min(len(seq), len(seq) + alt_len - ref_len)
+
+    def edited_base(i):
+        if i < prefix + alt_len:
+            return alt[i - prefix]
+        else:
+            return seq[i - alt_len + ref_len]
+
+    # every representation leaves the common prefix of the reference and the
+    # edited sequence unchanged, so it starts no later than its end
+    common_prefix = prefix
+    while common_prefix < min_len and edited_base(common_prefix) == seq[common_prefix]:
+        common_prefix += 1
+    return start + common_prefix + 1
+
+
 def preprocessing():
     # Preprocessing variants:
     source_dict = {
@@ -627,91 +1037,182 @@ def preprocessing():
     subprocess.call(
        ["bash", "1000g_preprocess.sh", ARGS.input + GENOME1K_FILE], stdout=f_1000G)
 
-    # merge multiple variant per vcf into multiple lines
-    for source_name, file_name in source_dict.iteritems():
-        print "convert to one variant per line in ", source_name
-        f_in = open(ARGS.input + file_name, "r")
-        f_out = open(ARGS.output + source_name + ".vcf", "w")
-        # Individual reports (lines in VCF/TSV) are given ids as part of the one_variant_transform method.
-        one_variant_transform(f_in, f_out, source_name)
-        f_in.close()
-        f_out.close()
-
-        print "merge repetitive variants within ", source_name
-        f_in = open(ARGS.output + source_name + ".vcf", "r")
-        f_out = open(ARGS.output + source_name + "ready.vcf", "w")
-        repeat_merging(f_in, f_out)
-        source_dict[source_name] = f_out.name
+    # each source is transformed, merged and checked independently, optionally
+    # in parallel, while ENIGMA is read here
+    sources = source_dict.items()
+    if ARGS.jobs > 1:
+        pool = multiprocessing.Pool(min(ARGS.jobs, len(sources)))
+        async_results = pool.map_async(preprocess_source, sources, chunksize=1)
+        pool.close()
+    else:
+        results = map(preprocess_source, sources)
 
     print "-------check if genomic coordinates are correct----------"
-    (columns, variants) = save_enigma_to_dict(ARGS.input + ENIGMA_FILE)
-    for source_name, file_name in source_dict.iteritems():
-        f = open(file_name, "r")
-        d_wrong = ARGS.output + "wrong_genome_coors/"
-        if not os.path.exists(d_wrong):
-            os.makedirs(d_wrong)
-        f_wrong = open(ARGS.output + "wrong_genome_coors/" +
-                       source_name + "_wrong_genome_coor.vcf", "w")
-        f_right = open(ARGS.output + "right" + source_name, "w")
-        vcf_reader = vcf.Reader(f, strict_whitespace=True)
-        vcf_wrong_writer = vcf.Writer(f_wrong, vcf_reader)
-        vcf_right_writer = vcf.Writer(f_right, vcf_reader)
-        n_wrong, n_total = 0, 0
-        for record in vcf_reader:
-            ref = record.REF.replace("-", "")
-            v = [record.CHROM, record.POS, ref, "dummy"]
-            if not ref_correct(record.CHROM, record.POS, record.REF, record.ALT):
-                logging.warning("Reference incorrect for Chrom: %s, Pos: %s, Ref: %s, and Alt: %s",
-                                record.CHROM, record.POS, record.REF, record.ALT)
-                vcf_wrong_writer.write_record(record)
-                n_wrong += 1
-            else:
-                vcf_right_writer.write_record(record)
-            n_total += 1
-        f_right.close()
-        f_wrong.close()
+    with PROFILE.stage("read_enigma", "ENIGMA"):
+        if ARGS.streaming:
+            (columns, variants) = sorted_enigma_reports(ARGS.input + ENIGMA_FILE)
+        else:
+            (columns, variants) = save_enigma_to_dict(ARGS.input + ENIGMA_FILE)
+
+    if ARGS.jobs > 1:
+        results = async_results.get()
+        pool.join()
+
+    for source_name, ready_file_name, n_wrong, n_total, stage in results:
+        source_dict[source_name] = ready_file_name
+        PROFILE.add(stage)
         print "in {0}, wrong: {1}, total: {2}".format(source_name, n_wrong, n_total)
 
     return source_dict, columns, variants
 
 
+def preprocess_source(source):
+    """converts a source vcf to one variant per line, merges repetitive
+    variants and checks reference alleles. returns the name of the merged
+    file, the number of records with a wrong reference, and the profiling
+    Stage of the source, which may have run in a worker process"""
+    (source_name, file_name) = source
+    with merge_profile.Stage("preprocess_source", source_name) as stage:
+        (ready_file_name, n_wrong, n_total) = transform_and_check_source(source_name, file_name)
+        stage.records_in = n_total
+        stage.records_out = n_total - n_wrong
+    return (source_name, ready_file_name, n_wrong, n_total, stage)
+
+
+def transform_and_check_source(source_name, file_name):
+    # merge multiple variant per vcf into multiple lines
+    print "convert to one variant per line in ", source_name
+    f_in = open(ARGS.input + file_name, "r")
+    f_out = open(ARGS.output + source_name + ".vcf", "w")
+    # Individual reports (lines in VCF/TSV) are given ids as part of the one_variant_transform method.
+    one_variant_transform(f_in, f_out, source_name)
+    f_in.close()
+    f_out.close()
+
+    print "merge repetitive variants within ", source_name
+    f_in = open(ARGS.output + source_name + ".vcf", "r")
+    f_out = open(ARGS.output + source_name + "ready.vcf", "w")
+    repeat_merging(f_in, f_out)
+    ready_file_name = f_out.name
+
+    # check if genomic coordinates are correct, for the whole file at once
+    (chroms, positions, refs) = ([], [], [])
+    with open(ready_file_name, "r") as f:
+        for line in f:
+            if not line.startswith("#"):
+                fields = line.split("\t", 5)
+                chroms.append(fields[0])
+                positions.append(fields[1])
+                refs.append(fields[3])
+    correct = refs_correct(chroms, positions, refs)
+
+    d_wrong = ARGS.output + "wrong_genome_coors/"
+    if not os.path.exists(d_wrong):
+        try:
+            os.makedirs(d_wrong)
+        except OSError:
+            # another source created it first
+            if not os.path.isdir(d_wrong):
+                raise
+    f_wrong = open(ARGS.output + "wrong_genome_coors/" +
+                   source_name + "_wrong_genome_coor.vcf", "w")
+    f_right = open(ARGS.output + "right" + source_name, "w")
+    # the ready file was written by sites_vcf.Writer, so its lines are copied as they are
+    records = iter(correct)
+    with open(ready_file_name, "r") as f:
+        for line in f:
+            if line.startswith("#"):
+                f_right.write(line)
+                f_wrong.write(line)
+            elif next(records):
+                f_right.write(line)
+            else:
+                fields = line.split("\t", 5)
+                logging.warning("Reference incorrect for Chrom: %s, Pos: %s, Ref: %s, and Alt: %s",
+                                fields[0], fields[1], fields[3], fields[4])
+                f_wrong.write(line)
+    f_right.close()
+    f_wrong.close()
+
+    n_total = len(correct)
+    n_wrong = n_total - int(np.count_nonzero(correct))
+    return (ready_file_name, n_wrong, n_total)
+
+
 def repeat_merging(f_in, f_out):
     """takes a vcf file, collapses repetitive variant rows and write out
-        to a new vcf file (without header)"""
-    vcf_reader = vcf.Reader(f_in, strict_whitespace=True)
-    variant_dict = {}
+        to a new vcf file. Coordinate sorted input is streamed one position
+        at a time, otherwise all distinct variants are held until the end."""
+    sorted_input = is_coordinate_sorted(f_in)
+    f_in.seek(0)
+    vcf_reader = sites_vcf.Reader(f_in, strict_whitespace=True)
+    vcf_writer = sites_vcf.Writer(f_out, vcf_reader)
+    # distinct variants at the current position, keyed by genomic coordinate
+    variant_dict = OrderedDict()
+    position = None
     num_repeats = 0
     for record in vcf_reader:
+        if sorted_input and (record.CHROM, record.POS) != position:
+            for merged_record in variant_dict.itervalues():
+                vcf_writer.write_record(merged_record)
+            variant_dict.clear()
+            position = (record.CHROM, record.POS)
         genome_coor = "chr{0}:{1}:{2}>{3}".format(
             record.CHROM, str(record.POS), record.REF, record.ALT[0])
-        if genome_coor not in variant_dict.keys():
-            variant_dict[genome_coor] = deepcopy(record)
+        if genome_coor not in variant_dict:
+            variant_dict[genome_coor] = record
         else:
             num_repeats += 1
-            for key in record.INFO:
-                if key not in variant_dict[genome_coor].INFO.keys():
-                    variant_dict[genome_coor].INFO[key] = deepcopy(record.INFO[key])
-                else:
-                    new_value = deepcopy(record.INFO[key])
-                    old_value = deepcopy(variant_dict[genome_coor].INFO[key])
-
-                    if type(new_value) != list:
-                        new_value = [new_value]
-                    if type(old_value) != list:
-                        old_value = [old_value]
-                    if new_value == old_value:
-                        continue
-                    else:
-                        merged_value = list(set(new_value + old_value))
-                        variant_dict[genome_coor].INFO[key] = deepcopy(merged_value)
+            merge_repeat_info(variant_dict[genome_coor], record)
+    for merged_record in variant_dict.itervalues():
+        vcf_writer.write_record(merged_record)
     print "number of repeat records: ", num_repeats, "\n"
-    vcf_writer = vcf.Writer(f_out, vcf_reader)
-    for record in variant_dict.values():
-        vcf_writer.write_record(record)
     f_in.close()
     f_out.close()
 
 
+def merge_repeat_info(record, repeat):
+    # adds INFO values of a repeated record to the first record seen for the variant
+    for key, new_value in repeat.INFO.iteritems():
+        if key not in record.INFO:
+            record.INFO[key] = new_value
+            continue
+        old_value = record.INFO[key]
+        if type(new_value) != list:
+            new_value = [new_value]
+        if type(old_value) != list:
+            old_value = [old_value]
+        if new_value != old_value:
+            merged_value = []
+            seen = set()
+            for value in old_value + new_value:
+                if value not in seen:
+                    seen.add(value)
+                    merged_value.append(value)
+            record.INFO[key] = merged_value
+
+
+def is_coordinate_sorted(f):
+    # true if records of each chromosome are contiguous and in position order
+    finished_chroms = set()
+    chrom = None
+    pos = None
+    for line in f:
+        if line.startswith("#"):
+            continue
+        fields = line.split("\t", 2)
+        if fields[0] != chrom:
+            if fields[0] in finished_chroms:
+                return False
+            finished_chroms.add(chrom)
+            chrom = fields[0]
+            pos = None
+        if pos is not None and int(fields[1]) < pos:
+            return False
+        pos = int(fields[1])
+    return True
+
+
 def get_header(f):
     header = ""
     for line in f:
@@ -724,8 +1225,8 @@ def one_variant_transform(f_in, f_out, source_name):
     """takes a vcf file, read each row, if the ALT field contains more than
        one item, create multiple variant row based on that row. also adds
        ids to all individual reports (each line in the vcf). writes new vcf"""
-    vcf_reader = vcf.Reader(f_in, strict_whitespace=True)
-    vcf_writer = vcf.Writer(f_out, vcf_reader)
+    vcf_reader = sites_vcf.Reader(f_in, strict_whitespace=True)
+    vcf_writer = sites_vcf.Writer(f_out, vcf_reader)
     count = 1
     for record in vcf_reader:
         n = len(record.ALT)
@@ -738,11 +1239,11 @@ def one_variant_transform(f_in, f_out, source_name):
         else:
             for i in range(n):
                 new_record = deepcopy(record)
-                new_record.ALT = [deepcopy(record.ALT[i])]
+                new_record.ALT = [record.ALT[i]]
                 new_record.INFO['BX_ID'] = count
                 count += 1
                 for key in record.INFO.keys():
-                    value = deepcopy(record.INFO[key])
+                    value = record.INFO[key]
                     if type(value) == list and len(value) == n:
                         new_record.INFO[key] = [value[i]]
                 if source_name == "ExAC":
@@ -776,68 +1277,82 @@ def append_exac_allele_frequencies(record, new_record=None, i=None):
 
 
 def write_new_tsv(filename, columns, variants):
-    merged_file = open(filename, "w")
+    genome_coors = sorted(variants.keys())
+    write_variant_rows(filename, columns,
+                       itertools.izip(genome_coors, variants.formatted_rows(format_cell, genome_coors)))
+
+
+def write_variant_rows(filename, columns, rows):
+    # writes (genomic coordinate, cells formatted by format_cell) of each variant, and
+    # the index of the reports behind them next to it. returns the number of rows written
+    merged_file = open(filename, "w", OUTPUT_BUFFER_SIZE)
     merged_file.write("\t".join(columns)+"\n")
-    for key, variant in sorted(variants.iteritems()):
+    bx_id_columns = report_provenance.bx_id_columns(columns)
+    provenance = report_provenance.ReportProvenance(source for i, source in bx_id_columns)
+    # per BX_ID column, the report ids of each distinct cell
+    report_ids = [{} for column in bx_id_columns]
+    n_rows = 0
+    for genome_coor, variant in rows:
         if len(variant) != len(columns):
             raise Exception("mismatching number of columns in head and row")
-        for ii in range(len(variant)):
-            if type(variant[ii]) == list:
-                comma_delimited_string = ",".join(str(xx) for xx in variant[ii])
-                variant[ii] = comma_delimited_string
-            elif type(variant[ii]) == int:
-                variant[ii] = str(variant[ii])
+        source_ids = {}
+        for (i, source), ids in itertools.izip(bx_id_columns, report_ids):
+            cell = variant[i]
+            if cell not in ids:
+                ids[cell] = report_provenance.report_ids(cell)
+            source_ids[source] = ids[cell]
+        provenance.add(genome_coor, source_ids)
         merged_file.write("\t".join(variant)+"\n")
+        n_rows += 1
     merged_file.close()
+    provenance.write(os.path.join(os.path.dirname(filename), report_provenance.PROVENANCE_FILE))
+    return n_rows
 
 
 def add_new_source(columns, variants, source, source_file, source_dict):
     print "adding {0} into merged file.....".format(source)
     old_column_num = len(columns)
-    for column_title in source_dict.keys():
-        columns.append(column_title+"_{0}".format(source))
-    vcf_reader = vcf.Reader(open(source_file, 'r'), strict_whitespace=True)
+    # new columns start out as DEFAULT_CONTENTS for every variant already in the table
+    variants.add_columns([column_title + "_{0}".format(source) for column_title in source_dict.keys()])
+    vcf_reader = sites_vcf.Reader(open(source_file, 'r'), strict_whitespace=True)
     overlap = 0
     variants_num = 0
     for record in vcf_reader:
         variants_num += 1
         genome_coor = ("chr" + str(record.CHROM) + ":g." + str(record.POS) + ":" +
                        record.REF + ">" + str(record.ALT[0]))
-        if genome_coor in variants.keys():
+        if genome_coor in variants:
             overlap += 1
-            if type(variants[genome_coor][COLUMN_SOURCE]) != list:
-                variants[genome_coor][COLUMN_SOURCE] = [variants[genome_coor][COLUMN_SOURCE]]
-            variants[genome_coor][COLUMN_SOURCE].append(source)
+            sources = variants.get_cell(genome_coor, COLUMN_SOURCE)
+            if type(sources) != list:
+                sources = [sources]
+            variants.set_cell(genome_coor, COLUMN_SOURCE, sources + [source])
         else:
-            variants[genome_coor] = associate_chr_pos_ref_alt_with_item(record, old_column_num, source, genome_coor)
-        for value in source_dict.values():
-            try:
-                if source == "LOVD":
-                    field_value = map(urllib.unquote_plus, record.INFO[value])
-                    variants[genome_coor].append(field_value)
-                else:
-                    variants[genome_coor].append(record.INFO[value])
-            except KeyError:
-                logging.warning("KeyError appending VCF record.INFO[value] to variant. Variant: %s \n Record.INFO: %s \n value: %s", variants[genome_coor], record.INFO, value)
-                if source == "BIC":
-                    variants[genome_coor].append(DEFAULT_CONTENTS)
-                    logging.debug("Could not find value %s for source %s in variant %s, inserting default content %s instead.", value, source, DEFAULT_CONTENTS)
-                else:
-                    raise Exception("There was a problem appending a value for %s to variant %s" % (value, variants[genome_coor]))
-    # for those enigma record that doesn't have a hit with new genome coordinate
-    # add extra cells of "-" to the end of old record
-    for value in variants.values():
-        if len(value) != len(columns):
-            value += [DEFAULT_CONTENTS] * len(source_dict)
+            variants[genome_coor] = associate_chr_pos_ref_alt_with_item(record, len(columns), source, genome_coor)
+        for column_index, value in enumerate(source_dict.values(), old_column_num):
+            variants.set_cell(genome_coor, column_index, source_field_value(source, record, value, genome_coor))
     print "number of variants in " + source + " is ", variants_num
     print "overlap with previous dataset: ", overlap
     print "number of total variants with the addition of " + source + " is: ", len(variants), "\n"
-    for index, value in variants.iteritems():
-        if len(value) != len(columns):
-            raise Exception("mismatching number of columns in head and row")
+    PROFILE.count_records(variants_num, len(variants))
     return (columns, variants)
 
 
+def source_field_value(source, record, value, genome_coor):
+    try:
+        if source == "LOVD":
+            return map(urllib.unquote_plus, record.INFO[value])
+        else:
+            return record.INFO[value]
+    except KeyError:
+        logging.warning("KeyError appending VCF record.INFO[value] to variant. Variant: %s \n Record.INFO: %s \n value: %s", genome_coor, record.INFO, value)
+        if source == "BIC":
+            logging.debug("Could not find value %s for source %s in variant %s, inserting default content %s instead.", value, source, genome_coor, DEFAULT_CONTENTS)
+            return DEFAULT_CONTENTS
+        else:
+            raise Exception("There was a problem appending a value for %s to variant %s" % (value, genome_coor))
+
+
 def associate_chr_pos_ref_alt_with_item(line, column_num, source, genome_coor):
     # places genomic coordinate data in correct positions to align with relevant columns in output tsv file.
     item = ['-'] * column_num
@@ -886,40 +1401,49 @@ def add_columns_to_enigma_data(line):
 
 
 def save_enigma_to_dict(path):
+    enigma_file = open(path, "r")
+    header = enigma_file.readline()
+    columns = add_columns_to_enigma_data(header)
+    variants = VariantTable(columns, DEFAULT_CONTENTS)
+    for hgvs, items in enigma_reports(enigma_file, header, columns):
+        variants = add_variant_to_dict(variants, hgvs, items)
+    enigma_file.close()
+    return (columns, variants)
+
+
+def enigma_reports(enigma_file, header, columns):
+    # yields (genomic coordinate, items) of each ENIGMA report with a correct
+    # reference, logging the others as discarded
     global DISCARDED_REPORTS_WRITER
 
-    enigma_file = open(path, "r")
-    variants = dict()
-    line_num = 0
     f_wrong = open(ARGS.output + "ENIGMA_wrong_genome.txt", "w")
+    f_wrong.write(header)
     n_wrong, n_total = 0, 0
     bx_id_column_index = None
-    for line in enigma_file:
-        line_num += 1
-        if line_num == 1:
-            columns = add_columns_to_enigma_data(line)
-            for i, column in enumerate(columns):
-                if "BX_ID" in column:
-                    bx_id_column_index = i
-            f_wrong.write(line)
+    for i, column in enumerate(columns):
+        if "BX_ID" in column:
+            bx_id_column_index = i
+    lines = enigma_file.readlines()
+    reports = [associate_chr_pos_ref_alt_with_enigma_item(line) for line in lines]
+    correct = refs_correct([report[1] for report in reports], [report[2] for report in reports],
+                           [report[3] for report in reports])
+    for line, (items, chrom, pos, ref, alt), ref_is_correct in zip(lines, reports, correct):
+        bx_id = items[bx_id_column_index]
+        hgvs = "chr%s:g.%s:%s>%s" % (str(chrom), str(pos), ref, alt)
+
+        if ref_is_correct:
+            yield (hgvs, items)
         else:
-            (items, chrom, pos, ref, alt) = associate_chr_pos_ref_alt_with_enigma_item(line)
-            bx_id = items[bx_id_column_index]
-            hgvs = "chr%s:g.%s:%s>%s" % (str(chrom), str(pos), ref, alt)
-
-            if ref_correct(chrom, pos, ref, alt):
-                variants = add_variant_to_dict(variants, hgvs, items)
-            else:
-                logging.warning("Ref incorrect for Enigma report, throwing away: %s", line)
-                log_discarded_reports("ENIGMA", bx_id, hgvs, "Incorrect Reference")
-                n_wrong += 1
-                f_wrong.write(line)
+            logging.warning("Ref incorrect for Enigma report, throwing away: %s", line)
+            log_discarded_reports("ENIGMA", bx_id, hgvs, "Incorrect Reference")
+            n_wrong += 1
+            f_wrong.write(line)
 
-            n_total += 1
+        n_total += 1
 
     f_wrong.close()
     print "in ENIGMA, wrong: {0}, total: {1}".format(n_wrong, n_total)
-    return (columns, variants)
+    PROFILE.count_records(n_total, n_total - n_wrong)
 
 
 def variant_equal(v1, v2, version="hg38"):
@@ -960,16 +1484,15 @@ def variant_equal(v1, v2, version="hg38"):
     assert pos1 + len(ref1) <= reflen, "v1 position is above the reference"
     assert pos2 + len(ref2) <= reflen, "v2 position is above the reference"
 
-    # replace vcf ref string with alt string
-    edited_v1 = seq[0:pos1]+alt1+seq[pos1+len(ref1):]
-    edited_v2 = seq[0:pos2]+alt2+seq[pos2+len(ref2):]
+    # compare the sequences resulting from replacing vcf ref string with alt string
+    equal = variant_equivalence.edits_equal(seq, pos1, len(ref1), alt1, pos2, len(ref2), alt2)
 
-    if edited_v1 == edited_v2:
+    if equal:
         logging.debug("VARIANTS EQUAL:")
-        logging.debug("Converted %s into %s due to variant v1 %s", seq[pos1-5:pos1+5], edited_v1[pos1-5:pos1+5], v1)
-        logging.debug("Converted %s into %s due to variant v2 %s", seq[pos2-5:pos2+5], edited_v2[pos2-5:pos2+5], v2)
+        logging.debug("Variant v1 %s edits %s", v1, seq[pos1-5:pos1+5])
+        logging.debug("Variant v2 %s edits %s", v2, seq[pos2-5:pos2+5])
 
-    return edited_v1 == edited_v2
+    return equal
 
 
 def ref_correct(chr, pos, ref, alt, version="hg38"):
@@ -995,6 +1518,21 @@ def ref_correct(chr, pos, ref, alt, version="hg38"):
         return True
 
 
+def refs_correct(chroms, positions, refs, version="hg38"):
+    """ref_correct for whole columns of variants at once, returns a boolean
+    numpy array"""
+    chroms = np.array(chroms, dtype=object)
+    assert(np.all((chroms == "13") | (chroms == "17")))
+    positions = np.array([0 if pos == "None" else int(pos) for pos in positions], dtype=np.int64)
+    refs = np.array(refs, dtype=object)
+    correct = np.zeros(len(refs), dtype=bool)
+    for chr in ("13", "17"):
+        selected = (chroms == chr) & (positions > 0)
+        if np.any(selected):
+            correct[selected] = REFERENCE.refs_match(chr, version, positions[selected], refs[selected])
+    return correct
+
+
 def isEmpty(value):
     return value == '-' or value is None or value == [] or value == ['-'] or value == ''
 
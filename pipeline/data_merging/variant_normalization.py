@@ -0,0 +1,90 @@
+"""
+Normalization and comparison of (chr, pos, ref, alt) variants in genomic
+coordinates of one build of the BRCA1 and BRCA2 regions.
+
+This is shared by the string comparison scripts of the merge and of the
+ClinVar concordance pipeline, and by the database overlap report. Positions
+are lifted to 0-based offsets into the region of their chromosome, and
+compared with the sequence level functions of variant_equivalence.
+"""
+import variant_equivalence
+
+CHROMOSOMES = ("13", "17")
+
+
+class VariantNormalizer(object):
+    """takes {chr: (start, sequence)}, where start is the genomic position
+    just before the first base of the sequence"""
+
+    def __init__(self, regions):
+        self.regions = regions
+
+    @classmethod
+    def from_reference(cls, reference, build):
+        """the normalizer of a build of reference_regions.ReferenceRegions"""
+        return cls(dict((chrom, (reference.start(chrom, build), reference.sequence(chrom, build)))
+                        for chrom in CHROMOSOMES))
+
+    def lift(self, chr, pos):
+        """returns the region sequence of chr and the 0-based offset of pos in it"""
+        if chr not in self.regions:
+            assert False, "Bad chrom in variant"
+        (start, seq) = self.regions[chr]
+        return (seq, int(pos) - 1 - start)
+
+    def contains(self, chr, pos, ref_len):
+        """True if the ref_len bases at pos of chr are inside a region"""
+        if chr not in self.regions:
+            return False
+        (start, seq) = self.regions[chr]
+        offset = int(pos) - 1 - start
+        return offset >= 0 and offset + ref_len <= len(seq)
+
+    def genome_ref(self, v):
+        """returns the reference bases under the ref allele of v"""
+        chr, pos, ref, alt = v
+        (seq, pos) = self.lift(chr, pos)
+        genome_ref = seq[pos:pos + len(ref)].upper()
+        if len(ref) != 0 and len(genome_ref) == 0:
+            print v
+            raise Exception("ref not inside BRCA1 or BRCA2")
+        return genome_ref
+
+    def ref_correct(self, v):
+        return self.genome_ref(v) == v[2]
+
+    def variant_equal(self, v1, v2):
+        """True if applying v1 and v2 to the reference gives the same sequence"""
+        if v1 == v2:
+            return True
+        chr1, pos1, ref1, alt1 = v1
+        chr2, pos2, ref2, alt2 = v2
+        if chr1 != chr2:
+            return False
+        if (len(ref1) - len(alt1)) != (len(ref2) - len(alt2)):
+            return False
+        (seq, pos1) = self.lift(chr1, pos1)
+        (seq, pos2) = self.lift(chr2, pos2)
+        return variant_equivalence.edits_equal(seq, pos1, len(ref1), alt1, pos2, len(ref2), alt2)
+
+    def canonical_key(self, v):
+        """returns (chr, pos, ref_length, alt) of v left-aligned and trimmed
+        against the reference, 0-based relative to the region. Two variants
+        have the same key iff variant_equal considers them equal"""
+        chr, pos, ref, alt = v
+        (seq, pos) = self.lift(chr, pos)
+        return (chr,) + variant_equivalence.canonical_edit(seq, pos, len(ref), alt)
+
+    def group_equivalent(self, variants):
+        """returns {canonical key: [variants]} grouping equivalent variants in
+        one pass. Variants outside the regions are only grouped with copies
+        of themselves"""
+        groups = {}
+        for v in variants:
+            chr, pos, ref, alt = v
+            if self.contains(chr, pos, len(ref)):
+                key = self.canonical_key(v)
+            else:
+                key = tuple(v)
+            groups.setdefault(key, []).append(v)
+        return groups
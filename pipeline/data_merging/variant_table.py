@@ -0,0 +1,257 @@
+"""
+Columnar in-memory table of merged variants.
+
+Each column is an array of integer codes into a dictionary of the distinct
+values seen in that column, so a value repeated across thousands of variants
+is stored once. Rows are addressed by integer id, and by genomic coordinate
+string through the same mapping interface the merge code used with a plain
+dict of lists: reading a variant decodes a fresh list of cells, assigning a
+list encodes it back.
+
+The dictionaries of every column and table take their values from one
+process-wide ValuePool. A submitter or classification that turns up in many
+columns, sources and list cells is then a single string object.
+"""
+from array import array
+from itertools import izip
+
+
+class ValuePool(object):
+    """Keeps one copy of each distinct value. Lists are frozen into tuples of
+    pooled values."""
+
+    def __init__(self):
+        self.values = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def frozen(self, value):
+        if type(value) is list:
+            return tuple(self.frozen(v) for v in value)
+        return self.values.setdefault((type(value), value), value)
+
+
+VALUES = ValuePool()
+
+
+class ValueDictionary(object):
+    """Assigns integer codes to distinct cell values. Lists are stored as
+    tuples so they can be looked up, and are decoded back into new lists."""
+
+    def __init__(self, pool=VALUES):
+        self.values = []
+        self.codes = {}
+        self.pool = pool
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, value):
+        # most cells are plain strings, which are their own key
+        key = value if type(value) is str else _hashable(value)
+        code = self.codes.get(key)
+        if code is None:
+            code = len(self.values)
+            self.codes[key] = code
+            self.values.append(self.pool.frozen(value))
+        return code
+
+    def decode(self, code):
+        value = self.values[code]
+        return _thawed(value) if type(value) is tuple else value
+
+    @classmethod
+    def from_values(cls, values, pool=VALUES):
+        """rebuilds a dictionary from the values of another one, keeping their codes"""
+        dictionary = cls(pool)
+        for value in values:
+            dictionary.encode(_thawed(value) if type(value) is tuple else value)
+        return dictionary
+
+
+class VariantTable(object):
+
+    def __init__(self, columns, default=None):
+        self.columns = columns
+        self.default = default
+        self.dictionaries = [ValueDictionary() for column in columns]
+        self.codes = [array('i') for column in columns]
+        # row id -> genomic coordinate, None once the row is removed
+        self.row_keys = []
+        # genomic coordinate -> row id
+        self.rows = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, genome_coor):
+        return genome_coor in self.rows
+
+    def __iter__(self):
+        return self.iterkeys()
+
+    def __getitem__(self, genome_coor):
+        return self.decode_row(self.rows[genome_coor])
+
+    def __setitem__(self, genome_coor, values):
+        if len(values) != len(self.columns):
+            raise Exception("mismatching number of columns in head and row")
+        row = self.rows.get(genome_coor)
+        if row is None:
+            row = len(self.row_keys)
+            self.row_keys.append(genome_coor)
+            self.rows[genome_coor] = row
+            for i, value in enumerate(values):
+                self.codes[i].append(self.dictionaries[i].encode(value))
+        else:
+            for i, value in enumerate(values):
+                self.codes[i][row] = self.dictionaries[i].encode(value)
+
+    def __delitem__(self, genome_coor):
+        row = self.rows.pop(genome_coor)
+        self.row_keys[row] = None
+
+    def pop(self, genome_coor):
+        values = self[genome_coor]
+        del self[genome_coor]
+        return values
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def values(self):
+        return list(self.itervalues())
+
+    def iterkeys(self):
+        for genome_coor in self.row_keys:
+            if genome_coor is not None:
+                yield genome_coor
+
+    def itervalues(self):
+        for genome_coor, values in self.iteritems():
+            yield values
+
+    def iteritems(self):
+        # rows added while iterating are not visited
+        for row in xrange(len(self.row_keys)):
+            genome_coor = self.row_keys[row]
+            if genome_coor is not None:
+                yield genome_coor, self.decode_row(row)
+
+    def decode_row(self, row):
+        return [self.dictionaries[i].decode(self.codes[i][row]) for i in xrange(len(self.columns))]
+
+    def column(self, column_index):
+        """returns the values of a column, in the order of keys()"""
+        dictionary = self.dictionaries[column_index]
+        codes = self.codes[column_index]
+        return [dictionary.decode(codes[row]) for row, genome_coor in enumerate(self.row_keys)
+                if genome_coor is not None]
+
+    def formatted_rows(self, format_value, keys=None):
+        """yields the rows of keys, all rows in order by default, as cells
+        formatted by format_value, which is called once for each distinct
+        value of a column"""
+        formatted = _formatted_values(self.dictionaries, format_value)
+        columns = zip(formatted, self.codes)
+        for genome_coor in (self.iterkeys() if keys is None else keys):
+            row = self.rows[genome_coor]
+            yield [strings[codes[row]] for strings, codes in columns]
+
+    def get_cell(self, genome_coor, column_index):
+        return self.dictionaries[column_index].decode(self.codes[column_index][self.rows[genome_coor]])
+
+    def set_cell(self, genome_coor, column_index, value):
+        self.codes[column_index][self.rows[genome_coor]] = self.dictionaries[column_index].encode(value)
+
+    def compact(self):
+        """drops the rows of removed variants and renumbers the others"""
+        live = [row for row, genome_coor in enumerate(self.row_keys) if genome_coor is not None]
+        if len(live) == len(self.row_keys):
+            return
+        self.codes = [array('i', (codes[row] for row in live)) for codes in self.codes]
+        self.row_keys = [self.row_keys[row] for row in live]
+        self.rows = dict((genome_coor, row) for row, genome_coor in enumerate(self.row_keys))
+
+    @classmethod
+    def from_columns(cls, columns, default, row_keys, dictionaries, codes):
+        """builds a table of compacted rows from its per-column dictionaries and code arrays"""
+        table = cls(columns, default)
+        table.dictionaries = dictionaries
+        table.codes = codes
+        table.row_keys = row_keys
+        table.rows = dict((genome_coor, row) for row, genome_coor in enumerate(row_keys))
+        return table
+
+    def add_columns(self, column_names):
+        """appends columns holding the default value for every existing row"""
+        for column_name in column_names:
+            dictionary = ValueDictionary()
+            default_code = dictionary.encode(self.default)
+            self.columns.append(column_name)
+            self.dictionaries.append(dictionary)
+            self.codes.append(array('i', [default_code]) * len(self.row_keys))
+
+
+class EncodedRows(object):
+    """Append-only rows kept as dictionary codes, for rows without a unique
+    key such as the individual reports. Iterating decodes fresh lists."""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.dictionaries = [ValueDictionary() for column in columns]
+        self.codes = [array('i') for column in columns]
+
+    def __len__(self):
+        return len(self.codes[0]) if self.codes else 0
+
+    def __iter__(self):
+        for row in xrange(len(self)):
+            yield self[row]
+
+    def __getitem__(self, row):
+        return [dictionary.decode(codes[row]) for dictionary, codes in izip(self.dictionaries, self.codes)]
+
+    def append(self, values):
+        if len(values) != len(self.columns):
+            raise Exception("mismatching number of columns in head and row")
+        for dictionary, codes, value in izip(self.dictionaries, self.codes, values):
+            codes.append(dictionary.encode(value))
+
+    def extend(self, rows):
+        for values in rows:
+            self.append(values)
+
+    def formatted_rows(self, format_value):
+        """yields rows of cells formatted by format_value, which is called once
+        for each distinct value of a column"""
+        formatted = _formatted_values(self.dictionaries, format_value)
+        for row in xrange(len(self)):
+            yield [strings[codes[row]] for strings, codes in izip(formatted, self.codes)]
+
+
+def format_cell(value):
+    """the text of a cell in the output TSVs: list items joined by commas"""
+    if type(value) == list:
+        return ",".join(str(xx) for xx in value)
+    elif type(value) == int:
+        return str(value)
+    return value
+
+
+def _formatted_values(dictionaries, format_value):
+    # for each column, the formatted text of each code
+    return [[format_value(dictionary.decode(code)) for code in xrange(len(dictionary))]
+            for dictionary in dictionaries]
+
+
+def _hashable(value):
+    # distinguishes values that compare equal across types, e.g. 1, 1.0 and True
+    if type(value) is list:
+        return (list, tuple(_hashable(v) for v in value))
+    return (type(value), value)
+
+
+def _thawed(value):
+    return [_thawed(v) if type(v) is tuple else v for v in value]
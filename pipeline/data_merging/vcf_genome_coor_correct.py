@@ -1,4 +1,4 @@
-import vcf
+import sites_vcf
 import glob
 import string_comp
 
@@ -10,7 +10,7 @@ PATH = "/hive/groups/cgl/brca/phase1/data/allVcfs/"
 def main():
     for file in glob.glob(PATH + "*"):
         f = open(file, "r")
-        vcf_reader = vcf.Reader(f, strict_whitespace=True)
+        vcf_reader = sites_vcf.Reader(f, strict_whitespace=True)
         n_wrong = 0
         n_total = 0
         for record in vcf_reader:
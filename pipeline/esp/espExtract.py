@@ -12,7 +12,11 @@ where freq is one of EA or AA (European Ancestry or African-American Ancestry)
 or if the --full option is given, echo the full VCF record.
 """
 import argparse
-import vcf
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "data_merging"))
+import sites_vcf
 
 EMPTY = '-'
 
@@ -29,9 +33,9 @@ def main():
 
     start = int(args.start)
     end = int(args.end)
-    reader = vcf.Reader(open(args.inputVcf, 'r'))
+    reader = sites_vcf.Reader(open(args.inputVcf, 'r'))
     if args.full:
-        writer = vcf.Writer(open(args.output, "w"), reader)
+        writer = sites_vcf.Writer(open(args.output, "w"), reader)
     for record in reader:
         if record.INFO.has_key("GRCh38_POSITION"):
             tokens = record.INFO["GRCh38_POSITION"][0].split(":")
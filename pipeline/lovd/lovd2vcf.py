@@ -22,6 +22,9 @@ import pyhgvs as hgvs
 import pyhgvs.utils as hgvs_utils
 from pygr.seqdb import SequenceFileDB
 import urllib
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "data_merging"))
+import reference_regions
+from liftover import Liftover
 
 
 LOVD_LIST_FIELDS = ["genetic_origin", "RNA", "variant_effect", "individuals", "submitters", "Protein", "cDNA"]
@@ -47,6 +50,12 @@ def parse_args():
                         help='Whole path to genome file. Default: (/hive/groups/cgl/brca/phase1/data/resources/hg19.fa)')
     parser.add_argument('-r', '--rpath', default='/hive/groups/cgl/brca/phase1/data/resources/refseq_annotation.hg19.gp',
                         help='Whole path to refSeq file. Default: (/hive/groups/cgl/brca/phase1/data/resources/refseq_annotation.hg19.gp)')
+    parser.add_argument('-l', '--liftover',
+                        help='hg19 to hg38 chain file. If given, variants are lifted to hg38 before they are written.')
+    parser.add_argument('--brcaResources',
+                        help='Directory with the brca*_hg*.txt reference sequences, required with --liftover.')
+    parser.add_argument('-u', '--unmapped', type=argparse.FileType('w'), default=sys.stderr,
+                        help='File of the variants that could not be lifted to hg38. Default: standard error')
 
     options = parser.parse_args()
     return options
@@ -66,6 +75,10 @@ def main(args):
 
     genome = SequenceFileDB(genome_path)
 
+    liftover = None
+    if options.liftover:
+        liftover = Liftover(options.liftover, reference_regions.load(options.brcaResources))
+
     def get_transcript(name):
         return transcripts.get(name)
 
@@ -79,7 +92,7 @@ def main(args):
     # print header lines to vcf file
     print('##fileformat=VCFv4.0', file=vcfFile)
     print('##source=exLOVD', file=vcfFile)
-    print('##reference=GRCh37', file=vcfFile)
+    print('##reference=GRCh38' if liftover else '##reference=GRCh37', file=vcfFile)
     for annotation, description in annotDict.items():
         print('##INFO=<ID={0},Number=.,Type=String,Description="{1}">'.format(annotation.replace(' ', '_'), description), file=vcfFile)
     print('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO', file=vcfFile)
@@ -118,7 +131,14 @@ def main(args):
         try:
             chrom, offset, ref, alt = hgvs.parse_hgvs_name(queryHgvsName, genome, get_transcript=get_transcript)
             chrom = chrom.replace('chr', '')
-            print('{0}\t{1}\t{2}\t{3}\t{4}\t.\t.\t{5}'.format(chrom, offset, queryHgvsName, ref, alt, INFO_field_string), file=vcfFile)
+            fields = [chrom, str(offset), queryHgvsName, ref, alt, '.', '.', INFO_field_string]
+            if liftover:
+                lifted = liftover.lift_fields(fields)
+                if lifted is None:
+                    print('\t'.join(fields), file=options.unmapped)
+                    continue
+                fields = lifted
+            print('\t'.join(fields), file=vcfFile)
         except Exception as e:
             print(str(e)+': could not parse hgvs field '+queryHgvsName, file=errorsFile)
 
@@ -1,6 +1,5 @@
 import subprocess
 import os
-import urllib2
 import tarfile
 import datetime
 import socket
@@ -14,7 +13,10 @@ import tempfile
 import shutil
 import json
 
-from retrying import retry
+import downloader
+import script_runner
+from artifact_cache import ArtifactCache
+from stream_chain import INPUT, OUTPUT, Step, run_chain
 
 
 #######################
@@ -30,6 +32,10 @@ def create_path_if_nonexistent(path):
 
 def print_subprocess_output_and_error(sp):
     out, err = sp.communicate()
+    print_output_and_error(out, err)
+
+
+def print_output_and_error(out, err):
     if out:
         print "standard output of subprocess:"
         print out
@@ -38,52 +44,91 @@ def print_subprocess_output_and_error(sp):
         print err
 
 
-@retry(stop_max_attempt_number=3, wait_fixed=3000)
-def urlopen_with_retry(url):
-    return urllib2.urlopen(url)
+class ScriptExecution(luigi.Config):
+    mode = luigi.Parameter(default="subprocess",
+                           description='how run_process runs python scripts: "subprocess" starts a new interpreter '
+                                       'for each, "fork" runs each in a fork of the worker, which imports the '
+                                       'slow to load libraries only once')
 
 
-def download_file_and_display_progress(url, file_name=None):
-    if file_name is None:
-        file_name = url.split('/')[-1]
+def run_process(args, stdout=subprocess.PIPE):
+    """runs args, printing its standard output unless stdout is a file to write it to,
+    and its standard error. python scripts run as configured by ScriptExecution"""
+    mode = ScriptExecution().mode
+    if mode not in ("subprocess", "fork"):
+        raise ValueError("unknown script execution mode %s" % mode)
+    if mode == "fork" and args[0] == "python":
+        (_, out, err) = script_runner.run_forked(args[1], args[2:],
+                                                 None if stdout == subprocess.PIPE else stdout)
+        print_output_and_error(out, err)
+    else:
+        sp = subprocess.Popen(args, stdout=stdout, stderr=subprocess.PIPE)
+        print_subprocess_output_and_error(sp)
 
-    u = urlopen_with_retry(url)
-    f = open(file_name, 'wb')
-    meta = u.info()
-    file_size = int(meta.getheaders("Content-Length")[0])
-    print "Downloading: %s Bytes: %s" % (file_name, file_size)
 
-    file_size_dl = 0
-    block_sz = 8192
-    while True:
-        buffer = u.read(block_sz)
-        if not buffer:
-            break
+class DownloadCache(luigi.Config):
+    path = luigi.Parameter(default="",
+                           description='directory of a cache of downloaded upstream files shared by runs, '
+                                       'no cache if empty')
+    max_size_gb = luigi.FloatParameter(default=200.0,
+                                       description='gigabytes the cache may hold, least recently used files are '
+                                                   'evicted first')
+    max_age_days = luigi.IntParameter(default=180,
+                                      description='days after which a cached file no run has used is evicted')
 
-        file_size_dl += len(buffer)
-        f.write(buffer)
-        status = r"%10d  [%3.2f%%]" % (file_size_dl, file_size_dl * 100. / file_size)
-        status = status + chr(8)*(len(status)+1)
-        print status,
 
-    f.close()
-    print "Finished downloading %s" % (file_name)
+def download_cache():
+    """returns the ArtifactCache configured by DownloadCache, None if there is none"""
+    config = DownloadCache()
+    if not config.path:
+        return None
+    return ArtifactCache(config.path, max_bytes=int(config.max_size_gb * 1024 ** 3),
+                         max_age_days=config.max_age_days)
 
 
-def download_file_with_basic_auth(url, file_name, username, password):
-    p = urllib2.HTTPPasswordMgrWithDefaultRealm()
+class SourceChains(luigi.Config):
+    mode = luigi.Parameter(default="staged",
+                           description='"staged" runs each step of the ESP, 1000 Genomes and ExAC chains as a task '
+                                       'writing its own file, "fused" streams each chain from its inputs to its '
+                                       'output file')
+    spill = luigi.BoolParameter(default=False,
+                                description='in fused mode, also write the output of each step to the file the '
+                                            'staged task would, for debugging')
+
 
-    p.add_password(None, url, username, password)
+def fused_source_chains():
+    mode = SourceChains().mode
+    if mode not in ("staged", "fused"):
+        raise ValueError("unknown source chain mode %s" % mode)
+    return mode == "fused"
 
-    handler = urllib2.HTTPBasicAuthHandler(p)
-    opener = urllib2.build_opener(handler)
-    urllib2.install_opener(opener)
 
-    data = urlopen_with_retry(url).read()
-    f = open(file_name, "wb")
-    f.write(data)
-    f.close()
-    print "Finished downloading %s" % (file_name)
+class Liftover(luigi.Config):
+    engine = luigi.Parameter(default="builtin",
+                             description='"builtin" lifts hg19 VCFs to hg38 with data_merging/liftover.py, which '
+                                         'loads only the chain blocks around BRCA1 and BRCA2, "crossmap" runs '
+                                         'CrossMap.py with the whole chain and hg38.fa')
+
+
+def liftover_args(resources_dir, hg19_vcf, hg38_vcf):
+    """returns the command lifting hg19_vcf to hg38_vcf with the configured Liftover engine,
+    both can be stream_chain's INPUT and OUTPUT"""
+    engine = Liftover().engine
+    chain_file = resources_dir + "/hg19ToHg38.over.chain.gz"
+    if engine == "builtin":
+        return ["python", os.path.join(data_merging_method_dir, "liftover.py"), "-c", chain_file,
+                "-r", resources_dir, "-i", hg19_vcf, "-o", hg38_vcf]
+    if engine == "crossmap":
+        return ["CrossMap.py", "vcf", chain_file, hg19_vcf, resources_dir + "/hg38.fa", hg38_vcf]
+    raise ValueError("unknown liftover engine %s" % engine)
+
+
+def download_file_and_display_progress(url, file_name=None):
+    downloader.download(url, file_name, cache=download_cache())
+
+
+def download_file_with_basic_auth(url, file_name, username, password):
+    downloader.download(url, file_name, username=username, password=password, cache=download_cache())
 
 
 def check_file_for_contents(file_path):
@@ -183,8 +228,7 @@ class ConvertLatestClinvarDataToXML(luigi.Task):
         writable_clinvar_xml_file = open(clinvar_xml_file, "w")
         args = ["python", "clinVarBrca.py", clinvar_file_dir + "/ClinVarFullRelease_00-latest.xml.gz", "-a", artifacts_dir]
         print "Running clinVarBrca.py with the following args: %s. This takes a while..." % (args)
-        sp = subprocess.Popen(args, stdout=writable_clinvar_xml_file, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args, stdout=writable_clinvar_xml_file)
 
         check_file_for_contents(clinvar_xml_file)
 
@@ -203,8 +247,7 @@ class ConvertClinvarXMLToTXT(luigi.Task):
         writable_clinvar_txt_file = open(clinvar_txt_file, "w")
         args = ["python", "clinVarParse.py", clinvar_file_dir + "/ClinVarBrca.xml", "--assembly", "GRCh38"]
         print "Running clinVarParse.py with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=writable_clinvar_txt_file, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args, stdout=writable_clinvar_txt_file)
 
         check_file_for_contents(clinvar_txt_file)
 
@@ -223,8 +266,7 @@ class ConvertClinvarTXTToVCF(luigi.Task):
         args = ["python", "convert_tsv_to_vcf.py", "-i", clinvar_file_dir + "/ClinVarBrca.txt", "-o",
                 clinvar_file_dir + "/ClinVarBrca.vcf", "-s", "ClinVar"]
         print "Running convert_tsv_to_vcf.py with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
 
         check_file_for_contents(clinvar_vcf_file)
 
@@ -308,8 +350,7 @@ class ExtractESPDataForBRCA1Region(luigi.Task):
         args = ["python", "espExtract.py", brca1_region_file, "--start",
                 "43044295", "--end", "43125483", "--full", "1", "-o", brca1_region_output]
         print "Calling espExtract.py for BRCA1 region with the following arguments: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
 
         check_file_for_contents(brca1_region_output)
 
@@ -330,8 +371,7 @@ class ExtractESPDataForBRCA2Region(luigi.Task):
         args = ["python", "espExtract.py", brca2_region_file, "--start", "32315473",
                 "--end", "32400266", "--full", "1", "-o", brca2_region_output]
         print "Calling espExtract.py for BRCA 2 region with the following arguments: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
 
 
 @requires(ExtractESPDataForBRCA2Region)
@@ -350,8 +390,7 @@ class ConcatenateESPBRCA12Data(luigi.Task):
         writable_concatenated_brca_output_file = open(concatenated_brca_output_file, 'w')
         args = ["vcf-concat", brca1_region_output, brca2_region_output]
         print "Calling vcf-concat with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=writable_concatenated_brca_output_file, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args, stdout=writable_concatenated_brca_output_file)
 
         writable_concatenated_brca_output_file.close()
         check_file_for_contents(concatenated_brca_output_file)
@@ -372,8 +411,7 @@ class SortConcatenatedESPBRCA12Data(luigi.Task):
         writable_sorted_concatenated_brca_output_file = open(sorted_concatenated_brca_output_file, 'w')
         args = ["vcf-sort", concatenated_brca_output_file]
         print "Calling vcf-sort with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=writable_sorted_concatenated_brca_output_file, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args, stdout=writable_sorted_concatenated_brca_output_file)
 
         writable_sorted_concatenated_brca_output_file.close()
         check_file_for_contents(sorted_concatenated_brca_output_file)
@@ -394,6 +432,35 @@ class CopyESPOutputToOutputDir(luigi.Task):
         check_file_for_contents(self.output_dir + "/esp.brca12.sorted.hg38.vcf")
 
 
+@requires(DecompressESPTarfile)
+class StreamESPOutputToOutputDir(luigi.Task):
+    """
+    Runs ExtractESPDataForBRCA1Region through CopyESPOutputToOutputDir as one streaming pipeline.
+    """
+
+    def output(self):
+        return luigi.LocalTarget(self.output_dir + "/esp.brca12.sorted.hg38.vcf")
+
+    def run(self):
+        esp_file_dir = self.file_parent_dir + "/ESP"
+        create_path_if_nonexistent(self.output_dir)
+
+        sources = [Step("esp.brca1.vcf",
+                        ["python", "espExtract.py",
+                         esp_file_dir + "/ESP6500SI-V2-SSA137.GRCh38-liftover.chr17.snps_indels.vcf",
+                         "--start", "43044295", "--end", "43125483", "--full", "1", "-o", OUTPUT],
+                        cwd=esp_method_dir),
+                   Step("esp.brca2.vcf",
+                        ["python", "espExtract.py",
+                         esp_file_dir + "/ESP6500SI-V2-SSA137.GRCh38-liftover.chr13.snps_indels.vcf",
+                         "--start", "32315473", "--end", "32400266", "--full", "1", "-o", OUTPUT],
+                        cwd=esp_method_dir)]
+        steps = [Step("esp.brca12.sorted.hg38.vcf", ["vcf-sort"])]
+        run_chain(sources, steps, self.output().path, esp_file_dir, SourceChains().spill)
+
+        check_file_for_contents(self.output().path)
+
+
 ###############################################
 #                     BIC                     #
 ###############################################
@@ -462,8 +529,7 @@ class ConvertBRCA1BICDataToVCF(luigi.Task):
                 self.resources_dir + "/hg19.fa", "-r", self.resources_dir + "/refseq_annotation.hg19.gp", "-a",
                 bic_method_dir + "/bicAnnotation"]
         print "Converting BRCA1 BIC data to vcf with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
 
         check_file_for_contents(bic_brca1_vcf_file)
 
@@ -486,8 +552,7 @@ class ConvertBRCA2BICDataToVCF(luigi.Task):
                 self.resources_dir + "/hg19.fa", "-r", self.resources_dir + "/refseq_annotation.hg19.gp", "-a",
                 bic_method_dir + "/bicAnnotation"]
         print "Converting BRCA2 BIC data to vcf with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
 
         check_file_for_contents(bic_brca2_vcf_file)
 
@@ -506,8 +571,7 @@ class ConcatenateBRCA12BICData(luigi.Task):
         writable_bic_brca12_vcf_file = open(bic_brca12_vcf_file, 'w')
         args = ["vcf-concat", bic_file_dir + "/bic_brca1.hg19.vcf", bic_file_dir + "/bic_brca2.hg19.vcf"]
         print "Concatenating BRCA1/2 BIC data with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=writable_bic_brca12_vcf_file, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args, stdout=writable_bic_brca12_vcf_file)
 
         check_file_for_contents(bic_brca12_vcf_file)
 
@@ -525,12 +589,10 @@ class CrossmapConcatenatedBICData(luigi.Task):
 
         bic_brca12_hg38_vcf_file = bic_file_dir + "/bic_brca12.hg38.vcf"
         writable_bic_brca12_hg38_vcf_file = open(bic_brca12_hg38_vcf_file, 'w')
-        args = ["CrossMap.py", "vcf", brca_resources_dir + "/hg19ToHg38.over.chain.gz",
-                bic_file_dir + "/bic_brca12.hg19.vcf", brca_resources_dir + "/hg38.fa",
-                bic_file_dir + "/bic_brca12.hg38.vcf"]
-        print "Crossmapping concatenated BIC data with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=writable_bic_brca12_hg38_vcf_file, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        args = liftover_args(brca_resources_dir, bic_file_dir + "/bic_brca12.hg19.vcf",
+                             bic_file_dir + "/bic_brca12.hg38.vcf")
+        print "Lifting over concatenated BIC data with the following args: %s" % (args)
+        run_process(args, stdout=writable_bic_brca12_hg38_vcf_file)
 
         check_file_for_contents(bic_brca12_hg38_vcf_file)
 
@@ -549,8 +611,7 @@ class SortBICData(luigi.Task):
         writable_sorted_bic_output_file = open(sorted_bic_output_file, 'w')
         args = ["vcf-sort", bic_file_dir + "/bic_brca12.hg38.vcf"]
         print "Sorting BIC data with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=writable_sorted_bic_output_file, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args, stdout=writable_sorted_bic_output_file)
 
         check_file_for_contents(sorted_bic_output_file)
 
@@ -601,8 +662,7 @@ class ExtractDataFromLatestEXLOVD(luigi.Task):
         ex_lovd_data_host_url = "http://hci-exlovd.hci.utah.edu/"
         args = ["extract_data.py", "-u", ex_lovd_data_host_url, "-l", "BRCA1", "BRCA2", "-o", ex_lovd_file_dir]
         print "Running extract_data.py with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
         print "Extracted data from %s." % (ex_lovd_data_host_url)
 
 
@@ -625,8 +685,7 @@ class ConvertEXLOVDBRCA1ExtractToVCF(luigi.Task):
                 "-r", brca_resources_dir + "/refseq_annotation.hg19.gp", "-g",
                 brca_resources_dir + "/hg19.fa", '-e', artifacts_dir + '/exLOVD_BRCA1_error_variants.txt']
         print "Running lovd2vcf with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
 
         check_file_for_contents(ex_lovd_file_dir + "/exLOVD_brca1.hg19.vcf")
 
@@ -648,8 +707,7 @@ class ConvertEXLOVDBRCA2ExtractToVCF(luigi.Task):
                 "-r", brca_resources_dir + "/refseq_annotation.hg19.gp", "-g",
                 brca_resources_dir + "/hg19.fa", '-e', artifacts_dir + '/exLOVD_BRCA2_error_variants.txt']
         print "Running lovd2vcf with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
 
         check_file_for_contents(ex_lovd_file_dir + "/exLOVD_brca2.hg19.vcf")
 
@@ -668,8 +726,7 @@ class ConcatenateEXLOVDVCFFiles(luigi.Task):
         writable_ex_lovd_brca12_hg19_vcf_file = open(ex_lovd_brca12_hg19_vcf_file, 'w')
         args = ["vcf-concat", ex_lovd_file_dir + "/exLOVD_brca1.hg19.vcf", ex_lovd_file_dir + "/exLOVD_brca2.hg19.vcf"]
         print "Running vcf-concat with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=writable_ex_lovd_brca12_hg19_vcf_file, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args, stdout=writable_ex_lovd_brca12_hg19_vcf_file)
 
         check_file_for_contents(ex_lovd_file_dir + "/exLOVD_brca12.hg19.vcf")
 
@@ -685,12 +742,10 @@ class CrossmapConcatenatedEXLOVDData(luigi.Task):
         ex_lovd_file_dir = self.file_parent_dir + "/exLOVD"
         brca_resources_dir = self.resources_dir
 
-        args = ["CrossMap.py", "vcf", brca_resources_dir + "/hg19ToHg38.over.chain.gz",
-                ex_lovd_file_dir + "/exLOVD_brca12.hg19.vcf", brca_resources_dir + "/hg38.fa",
-                ex_lovd_file_dir + "/exLOVD_brca12.hg38.vcf"]
-        print "Running CrossMap.py with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        args = liftover_args(brca_resources_dir, ex_lovd_file_dir + "/exLOVD_brca12.hg19.vcf",
+                             ex_lovd_file_dir + "/exLOVD_brca12.hg38.vcf")
+        print "Running liftover with the following args: %s" % (args)
+        run_process(args)
 
         check_file_for_contents(ex_lovd_file_dir + "/exLOVD_brca12.hg38.vcf")
 
@@ -709,8 +764,7 @@ class SortEXLOVDOutput(luigi.Task):
         writable_sorted_ex_lovd_output_file = open(sorted_ex_lovd_output_file, 'w')
         args = ["vcf-sort", ex_lovd_file_dir + "/exLOVD_brca12.hg38.vcf"]
         print "Running vcf-sort with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=writable_sorted_ex_lovd_output_file, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args, stdout=writable_sorted_ex_lovd_output_file)
         print "Sorted BRCA1/2 hg38 vcf file into %s" % (writable_sorted_ex_lovd_output_file)
 
         check_file_for_contents(ex_lovd_file_dir + "/exLOVD_brca12.sorted.hg38.vcf")
@@ -768,9 +822,7 @@ class DownloadLOVDInputFile(luigi.Task):
 
     def run(self):
         create_path_if_nonexistent(os.path.dirname(self.output().path))
-        data = urlopen_with_retry(self.shared_lovd_data_url).read()
-        with open(self.output().path, "wb") as f:
-            f.write(data)
+        downloader.download(self.shared_lovd_data_url, self.output().path, cache=download_cache())
 
 @requires(DownloadLOVDInputFile)
 class ConvertSharedLOVDToVCF(luigi.Task):
@@ -792,8 +844,7 @@ class ConvertSharedLOVDToVCF(luigi.Task):
 
         print "Running lovd2vcf with the following args: %s" % (args)
 
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
 
         check_file_for_contents(self.output().path)
 
@@ -809,12 +860,10 @@ class CrossmapConcatenatedSharedLOVDData(luigi.Task):
         lovd_file_dir = self.file_parent_dir + "/LOVD"
         brca_resources_dir = self.resources_dir
 
-        args = ["CrossMap.py", "vcf", brca_resources_dir + "/hg19ToHg38.over.chain.gz",
-                lovd_file_dir + "/sharedLOVD_brca12.hg19.vcf", brca_resources_dir + "/hg38.fa",
-                lovd_file_dir + "/sharedLOVD_brca12.hg38.vcf"]
-        print "Running CrossMap.py with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        args = liftover_args(brca_resources_dir, lovd_file_dir + "/sharedLOVD_brca12.hg19.vcf",
+                             lovd_file_dir + "/sharedLOVD_brca12.hg38.vcf")
+        print "Running liftover with the following args: %s" % (args)
+        run_process(args)
 
         check_file_for_contents(lovd_file_dir + "/sharedLOVD_brca12.hg38.vcf")
 
@@ -833,8 +882,7 @@ class SortSharedLOVDOutput(luigi.Task):
         writable_sorted_lovd_output_file = open(sorted_lovd_output_file, 'w')
         args = ["vcf-sort", lovd_file_dir + "/sharedLOVD_brca12.hg38.vcf"]
         print "Running vcf-sort with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=writable_sorted_lovd_output_file, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args, stdout=writable_sorted_lovd_output_file)
         print "Sorted BRCA1/2 hg38 vcf file into %s" % (writable_sorted_lovd_output_file)
 
         check_file_for_contents(lovd_file_dir + "/sharedLOVD_brca12.sorted.hg38.vcf")
@@ -947,8 +995,7 @@ class ExtractCHR13BRCAData(luigi.Task):
                 g1k_file_dir + "/ALL.chr13.phase3_shapeit2_mvncall_integrated_v5a.20130502.genotypes.vcf.gz",
                 "13:32889617-32973809"]
         print "Running tabix with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=writable_chr13_brca2_vcf_file, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args, stdout=writable_chr13_brca2_vcf_file)
 
         check_file_for_contents(chr13_brca2_vcf_file)
 
@@ -969,8 +1016,7 @@ class ExtractCHR17BRCAData(luigi.Task):
                 g1k_file_dir + "/ALL.chr17.phase3_shapeit2_mvncall_integrated_v5a.20130502.genotypes.vcf.gz",
                 "17:41196312-41277500"]
         print "Running tabix with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=writable_chr17_brca1_vcf_file, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args, stdout=writable_chr17_brca1_vcf_file)
 
         check_file_for_contents(chr17_brca1_vcf_file)
 
@@ -989,8 +1035,7 @@ class ConcatenateG1KData(luigi.Task):
         args = ["vcf-concat", g1k_file_dir + "/chr13_brca2_1000g_GRCh37.vcf",
                 g1k_file_dir + "/chr17_brca1_1000g_GRCh37.vcf"]
         print "Running vcf-concat with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=writable_concatenated_g1k_vcf, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args, stdout=writable_concatenated_g1k_vcf)
 
         check_file_for_contents(concatenated_g1k_vcf)
 
@@ -1006,12 +1051,10 @@ class CrossmapConcatenatedG1KData(luigi.Task):
         g1k_file_dir = self.file_parent_dir + '/G1K'
         brca_resources_dir = self.resources_dir
 
-        args = ["CrossMap.py", "vcf", brca_resources_dir + "/hg19ToHg38.over.chain.gz",
-                g1k_file_dir + "/brca12_1000g_GRCh37.vcf", brca_resources_dir + "/hg38.fa",
-                g1k_file_dir + "/1000G_brca.hg38.vcf"]
-        print "Running CrossMap.py with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        args = liftover_args(brca_resources_dir, g1k_file_dir + "/brca12_1000g_GRCh37.vcf",
+                             g1k_file_dir + "/1000G_brca.hg38.vcf")
+        print "Running liftover with the following args: %s" % (args)
+        run_process(args)
 
         check_file_for_contents(g1k_file_dir + "/1000G_brca.hg38.vcf")
 
@@ -1030,8 +1073,7 @@ class SortG1KData(luigi.Task):
         writable_sorted_g1k_output_file = open(sorted_g1k_output_file, 'w')
         args = ["vcf-sort", g1k_file_dir + "/1000G_brca.hg38.vcf"]
         print "Running vcf-sort with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=writable_sorted_g1k_output_file, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args, stdout=writable_sorted_g1k_output_file)
 
         check_file_for_contents(g1k_file_dir + "/1000G_brca.sorted.hg38.vcf")
 
@@ -1051,6 +1093,36 @@ class CopyG1KOutputToOutputDir(luigi.Task):
         check_file_for_contents(self.output_dir + "/1000G_brca.sorted.hg38.vcf")
 
 
+@requires(DownloadG1KCHR17GZTBI)
+class StreamG1KOutputToOutputDir(luigi.Task):
+    """
+    Runs ExtractCHR13BRCAData through CopyG1KOutputToOutputDir as one streaming pipeline.
+    """
+
+    def output(self):
+        return luigi.LocalTarget(self.output_dir + "/1000G_brca.sorted.hg38.vcf")
+
+    def run(self):
+        g1k_file_dir = self.file_parent_dir + '/G1K'
+        brca_resources_dir = self.resources_dir
+        create_path_if_nonexistent(self.output_dir)
+
+        sources = [Step("chr13_brca2_1000g_GRCh37.vcf",
+                        ["tabix", "-h",
+                         g1k_file_dir + "/ALL.chr13.phase3_shapeit2_mvncall_integrated_v5a.20130502.genotypes.vcf.gz",
+                         "13:32889617-32973809"]),
+                   Step("chr17_brca1_1000g_GRCh37.vcf",
+                        ["tabix", "-h",
+                         g1k_file_dir + "/ALL.chr17.phase3_shapeit2_mvncall_integrated_v5a.20130502.genotypes.vcf.gz",
+                         "17:41196312-41277500"])]
+        steps = [Step("1000G_brca.hg38.vcf",
+                      liftover_args(brca_resources_dir, INPUT, OUTPUT)),
+                 Step("1000G_brca.sorted.hg38.vcf", ["vcf-sort"])]
+        run_chain(sources, steps, self.output().path, g1k_file_dir, SourceChains().spill)
+
+        check_file_for_contents(self.output().path)
+
+
 ###############################################
 #                    EXAC                     #
 ###############################################
@@ -1111,8 +1183,7 @@ class ExtractBRCA1DataFromExac(luigi.Task):
 
         args = ["tabix", "-h", exac_file_dir + "/ExAC_nonTCGA.r0.3.1.sites.vep.vcf.gz", "17:41196312-41277500"]
         print "Running tabix with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=writable_exac_brca1_hg19_vcf_file, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args, stdout=writable_exac_brca1_hg19_vcf_file)
 
         check_file_for_contents(exac_brca1_hg19_vcf_file)
 
@@ -1131,8 +1202,7 @@ class ExtractBRCA2DataFromExac(luigi.Task):
 
         args = ["tabix", "-h", exac_file_dir + "/ExAC_nonTCGA.r0.3.1.sites.vep.vcf.gz", "13:32889617-32973809"]
         print "Running tabix with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=writable_exac_brca2_hg19_vcf_file, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args, stdout=writable_exac_brca2_hg19_vcf_file)
 
         check_file_for_contents(exac_brca2_hg19_vcf_file)
 
@@ -1150,8 +1220,7 @@ class ConcatenateEXACData(luigi.Task):
         writable_exac_brca12_hg19_vcf_file = open(exac_brca12_hg19_vcf_file, 'w')
         args = ["vcf-concat", exac_file_dir + "/exac.brca1.hg19.vcf", exac_file_dir + "/exac.brca2.hg19.vcf"]
         print "Running tabix with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=writable_exac_brca12_hg19_vcf_file, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args, stdout=writable_exac_brca12_hg19_vcf_file)
 
         check_file_for_contents(exac_brca12_hg19_vcf_file)
 
@@ -1166,12 +1235,10 @@ class CrossmapEXACData(luigi.Task):
         exac_file_dir = self.file_parent_dir + '/exac'
         brca_resources_dir = self.resources_dir
 
-        args = ["CrossMap.py", "vcf", brca_resources_dir + "/hg19ToHg38.over.chain.gz",
-                exac_file_dir + "/exac.brca12.hg19.vcf", brca_resources_dir + "/hg38.fa",
-                exac_file_dir + "/exac.brca12.hg38.vcf"]
-        print "Running CrossMap.py with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        args = liftover_args(brca_resources_dir, exac_file_dir + "/exac.brca12.hg19.vcf",
+                             exac_file_dir + "/exac.brca12.hg38.vcf")
+        print "Running liftover with the following args: %s" % (args)
+        run_process(args)
 
         check_file_for_contents(exac_file_dir + "/exac.brca12.hg38.vcf")
 
@@ -1188,8 +1255,7 @@ class SortEXACData(luigi.Task):
         with self.output().open("w") as vcf_file:
             args = ["vcf-sort", exac_file_dir + "/exac.brca12.hg38.vcf"]
             print "Running tabix with the following args: %s" % (args)
-            sp = subprocess.Popen(args, stdout=vcf_file, stderr=subprocess.PIPE)
-            print_subprocess_output_and_error(sp)
+            run_process(args, stdout=vcf_file)
 
         check_file_for_contents(exac_file_dir + "/exac.brca12.sorted.hg38.vcf")
 
@@ -1208,6 +1274,31 @@ class CopyEXACOutputToOutputDir(luigi.Task):
         check_file_for_contents(self.output_dir + "/exac.brca12.sorted.hg38.vcf")
 
 
+@requires(DownloadEXACVCFGZTBIFile)
+class StreamEXACOutputToOutputDir(luigi.Task):
+    """
+    Runs ExtractBRCA1DataFromExac through CopyEXACOutputToOutputDir as one streaming pipeline.
+    """
+
+    def output(self):
+        return luigi.LocalTarget(self.output_dir + "/exac.brca12.sorted.hg38.vcf")
+
+    def run(self):
+        exac_file_dir = self.file_parent_dir + '/exac'
+        brca_resources_dir = self.resources_dir
+        create_path_if_nonexistent(self.output_dir)
+
+        exac_vcf_gz_file = exac_file_dir + "/ExAC_nonTCGA.r0.3.1.sites.vep.vcf.gz"
+        sources = [Step("exac.brca1.hg19.vcf", ["tabix", "-h", exac_vcf_gz_file, "17:41196312-41277500"]),
+                   Step("exac.brca2.hg19.vcf", ["tabix", "-h", exac_vcf_gz_file, "13:32889617-32973809"])]
+        steps = [Step("exac.brca12.hg38.vcf",
+                      liftover_args(brca_resources_dir, INPUT, OUTPUT)),
+                 Step("exac.brca12.sorted.hg38.vcf", ["vcf-sort"])]
+        run_chain(sources, steps, self.output().path, exac_file_dir, SourceChains().spill)
+
+        check_file_for_contents(self.output().path)
+
+
 ###############################################
 #                  ENIGMA                     #
 ###############################################
@@ -1251,8 +1342,7 @@ class DownloadLatestEnigmaData(luigi.Task):
         args = ["python", "enigma_add_bx_id.py", "--input", enigma_file_dir + "/" + enigma_file.name,
                 "--output", enigma_file_dir + "/ENIGMA_combined_with_bx_ids.tsv"]
         print "Running enigma_add_bx_id.py with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
 
         copy(enigma_file_dir + "/ENIGMA_combined_with_bx_ids.tsv", self.output_dir)
 
@@ -1279,6 +1369,12 @@ class MergeVCFsIntoTSVFile(luigi.Task):
 
     release_notes = luigi.Parameter(default=None, description='notes for release, must be a .txt file')
 
+    merge_jobs = luigi.IntParameter(default=1, significant=False,
+                                    description='number of sources variant_merging.py preprocesses in parallel')
+
+    streaming_merge = luigi.BoolParameter(default=False, significant=False,
+                                          description='merge the sorted sources in one pass with variant_merging.py --streaming')
+
     def output(self):
         artifacts_dir = create_path_if_nonexistent(self.output_dir + "/release/artifacts/")
         return luigi.LocalTarget(artifacts_dir + "merged.tsv")
@@ -1290,10 +1386,12 @@ class MergeVCFsIntoTSVFile(luigi.Task):
         os.chdir(data_merging_method_dir)
 
         args = ["python", "variant_merging.py", "-i", self.output_dir + "/", "-o",
-                artifacts_dir, "-p", "-r", brca_resources_dir + "/", "-a", artifacts_dir, "-v"]
+                artifacts_dir, "-e", brca_resources_dir + "/equivalence_cache/", "-r", brca_resources_dir + "/",
+                "-a", artifacts_dir, "-j", str(self.merge_jobs), "-v"]
+        if self.streaming_merge:
+            args.append("--streaming")
         print "Running variant_merging.py with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
 
         check_file_for_contents(artifacts_dir + "merged.tsv")
 
@@ -1312,8 +1410,7 @@ class AnnotateMergedOutput(luigi.Task):
         args = ["python", "add_annotation.py", "-i", artifacts_dir + "merged.tsv",
                 "-o", artifacts_dir + "annotated.tsv", "-l", artifacts_dir + "add-annotation.log", "-v"]
         print "Running add_annotation.py with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
 
         # get number of variants thrown out
         numVariantsRemoved = 0
@@ -1342,8 +1439,7 @@ class AggregateMergedOutput(luigi.Task):
         args = ["python", "aggregate_across_columns.py", "-i", artifacts_dir + "annotated.tsv",
                 "-o", artifacts_dir + "aggregated.tsv"]
         print "Running aggregate_across_columns.py with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
 
         check_input_and_output_tsvs_for_same_number_variants(artifacts_dir + "annotated.tsv",
                                                              artifacts_dir + "aggregated.tsv")
@@ -1372,8 +1468,7 @@ class BuildAggregatedOutput(luigi.Task):
                 "-o", release_dir + "built.tsv",
                 "--artifacts_dir", artifacts_dir]
         print "Running brca_pseudonym_generator.py with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
 
         check_input_and_output_tsvs_for_same_number_variants(artifacts_dir + "aggregated.tsv",
                                                              release_dir + "built.tsv")
@@ -1391,10 +1486,9 @@ class FindMissingReports(luigi.Task):
         os.chdir(data_merging_method_dir)
 
         args = ["python", "check_for_missing_reports.py", "-b", release_dir + "built.tsv", "-r", artifacts_dir,
-                "-a", artifacts_dir, "-v"]
+                "-a", artifacts_dir, "-p", artifacts_dir + "provenance.bin", "-v"]
         print "Running check_for_missing_reports.py with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
 
         check_file_for_contents(artifacts_dir + "missing_reports.log")
 
@@ -1437,8 +1531,7 @@ class RunDiffAndAppendChangeTypesToOutput(luigi.Task):
                 "--diff_dir", diff_dir, "--v1_release_date", previous_release_date_str, "--reports", "False"]
 
         print "Running releaseDiff.py with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
 
         shutil.rmtree(tmp_dir) # cleaning up
 
@@ -1484,8 +1577,7 @@ class RunDiffAndAppendChangeTypesToOutputReports(luigi.Task):
                 "--diff_dir", diff_dir, "--v1_release_date", previous_release_date_str, "--reports", "True"]
 
         print "Running releaseDiff.py with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
 
         shutil.rmtree(tmp_dir) # cleaning up
 
@@ -1507,8 +1599,7 @@ class GenerateReleaseNotes(luigi.Task):
         args = ["python", "buildVersionMetadata.py", "--date", str(self.date), "--notes", self.release_notes,
                 "--output", metadata_dir + "version.json"]
         print "Running buildVersionMetadata.py with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
 
         check_file_for_contents(metadata_dir + "version.json")
 
@@ -1537,8 +1628,7 @@ class GenerateMD5Sums(luigi.Task):
 
         args = ["python", "generateMD5Sums.py", "-i", output_dir, "-o", md5sumsFile]
         print "Generating md5sums with the following args: %s" % (args)
-        sp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print_subprocess_output_and_error(sp)
+        run_process(args)
 
         check_file_for_contents(md5sumsFile)
 
@@ -1606,11 +1696,18 @@ class RunAll(luigi.WrapperTask):
             yield BuildAggregatedOutput(self.date, self.resources_dir, self.output_dir, self.file_parent_dir)
 
         yield CopyClinvarVCFToOutputDir(self.date, self.resources_dir, self.output_dir, self.file_parent_dir)
-        yield CopyESPOutputToOutputDir(self.date, self.resources_dir, self.output_dir, self.file_parent_dir)
+        if fused_source_chains():
+            yield StreamESPOutputToOutputDir(self.date, self.resources_dir, self.output_dir, self.file_parent_dir)
+        else:
+            yield CopyESPOutputToOutputDir(self.date, self.resources_dir, self.output_dir, self.file_parent_dir)
         yield CopyBICOutputToOutputDir(self.date, self.u, self.p, self.resources_dir, self.output_dir,
                                        self.file_parent_dir)
-        yield CopyG1KOutputToOutputDir(self.date, self.resources_dir, self.output_dir, self.file_parent_dir)
-        yield CopyEXACOutputToOutputDir(self.date, self.resources_dir, self.output_dir, self.file_parent_dir)
+        if fused_source_chains():
+            yield StreamG1KOutputToOutputDir(self.date, self.resources_dir, self.output_dir, self.file_parent_dir)
+            yield StreamEXACOutputToOutputDir(self.date, self.resources_dir, self.output_dir, self.file_parent_dir)
+        else:
+            yield CopyG1KOutputToOutputDir(self.date, self.resources_dir, self.output_dir, self.file_parent_dir)
+            yield CopyEXACOutputToOutputDir(self.date, self.resources_dir, self.output_dir, self.file_parent_dir)
         yield CopyEXLOVDOutputToOutputDir(self.date, self.resources_dir, self.output_dir, self.file_parent_dir)
         yield CopySharedLOVDOutputToOutputDir(date=self.date, resources_dir=self.resources_dir, output_dir=self.output_dir, file_parent_dir=self.file_parent_dir)
 
@@ -0,0 +1,194 @@
+"""
+Local cache of the upstream files the pipeline downloads, shared by runs.
+
+Files are stored once under objects/ by the SHA-256 of their content. Each
+entry under index/ maps a URL, the version the server reported for it (its
+ETag or Last-Modified header, or its FTP modification time) and its size to
+the object holding that content. A hit is hardlinked into the run's
+directory, or copied if the run is on another filesystem. Objects are made
+read-only so a task can't change the cached copy through its link.
+
+Entries not used for max_age_days are evicted, and then the least recently
+used objects until the cache holds at most max_bytes. A file linked into a
+run directory survives the eviction of its object.
+
+Workers may store and evict concurrently. An object is staged under tmp/ and
+is only evicted for lacking an index entry once it is older than a worker
+takes to add one, and a file another worker has just removed is skipped.
+"""
+import errno
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+import time
+
+BLOCK_SIZE = 1024 * 1024
+
+# files without an index entry this old were left by a worker that died while storing
+ORPHAN_AGE_SECONDS = 24 * 60 * 60
+
+
+class ArtifactCache(object):
+
+    def __init__(self, cache_dir, max_bytes=None, max_age_days=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.index_dir = os.path.join(cache_dir, "index")
+        self.temp_dir = os.path.join(cache_dir, "tmp")
+        for directory in (self.objects_dir, self.index_dir, self.temp_dir):
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def fetch(self, url, version, size, file_name):
+        """links the cached content of this version of url to file_name,
+        returns False if it isn't cached"""
+        entry = self._read_entry(self._entry_path(url, version, size))
+        if entry is None:
+            return False
+        object_path = self._object_path(entry["sha256"])
+        try:
+            if size is not None and os.path.getsize(object_path) != size:
+                _remove(self._entry_path(url, version, size))
+                return False
+            if os.path.lexists(file_name):
+                os.remove(file_name)
+            _link_or_copy(object_path, file_name)
+        except (IOError, OSError) as e:
+            # the object was never stored, or another worker has just evicted it
+            if e.errno != errno.ENOENT:
+                raise
+            _remove(self._entry_path(url, version, size))
+            return False
+        entry["last_used"] = time.time()
+        self._write_entry(self._entry_path(url, version, size), entry)
+        return True
+
+    def store(self, url, version, size, file_name):
+        """adds the downloaded file_name as this version of url, then evicts"""
+        sha256 = _sha256(file_name)
+        object_path = self._object_path(sha256)
+        if not os.path.exists(object_path):
+            # link or copy under a temporary name, so a partial copy is never an object
+            fd, temp_path = tempfile.mkstemp(dir=self.temp_dir)
+            os.close(fd)
+            os.remove(temp_path)
+            _link_or_copy(file_name, temp_path)
+            os.chmod(temp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.rename(temp_path, object_path)
+        self._write_entry(self._entry_path(url, version, size),
+                          {"url": url, "version": version, "size": size, "sha256": sha256,
+                           "last_used": time.time()})
+        self.evict()
+
+    def evict(self, now=None):
+        """removes entries unused for max_age_days, then the least recently
+        used objects until the cache holds at most max_bytes"""
+        if now is None:
+            now = time.time()
+        entries = {}
+        for name in os.listdir(self.index_dir):
+            if name.endswith(".json"):
+                path = os.path.join(self.index_dir, name)
+                entry = self._read_entry(path)
+                if entry is None:
+                    _remove(path)
+                else:
+                    entries[path] = entry
+
+        if self.max_age_days is not None:
+            for path, entry in entries.items():
+                if now - entry["last_used"] > self.max_age_days * 24 * 60 * 60:
+                    _remove(path)
+                    del entries[path]
+
+        # sha256 -> when any entry last used it
+        last_used = {}
+        for entry in entries.itervalues():
+            last_used[entry["sha256"]] = max(last_used.get(entry["sha256"], 0), entry["last_used"])
+        sizes = {}
+        for sha256 in os.listdir(self.objects_dir):
+            object_path = os.path.join(self.objects_dir, sha256)
+            try:
+                if sha256 in last_used:
+                    sizes[sha256] = os.path.getsize(object_path)
+                elif now - os.path.getctime(object_path) > ORPHAN_AGE_SECONDS:
+                    _remove(object_path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+        if self.max_bytes is not None:
+            total = sum(sizes.itervalues())
+            for sha256 in sorted(sizes, key=lambda sha256: last_used[sha256]):
+                if total <= self.max_bytes:
+                    break
+                total -= sizes[sha256]
+                _remove(self._object_path(sha256))
+                for path, entry in entries.items():
+                    if entry["sha256"] == sha256:
+                        _remove(path)
+                        del entries[path]
+
+        for name in os.listdir(self.temp_dir):
+            path = os.path.join(self.temp_dir, name)
+            try:
+                # linking a file changes its ctime, not its mtime
+                if now - os.path.getctime(path) > ORPHAN_AGE_SECONDS:
+                    _remove(path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+    def _entry_path(self, url, version, size):
+        key = hashlib.sha1(json.dumps([url, version, size])).hexdigest()
+        return os.path.join(self.index_dir, key + ".json")
+
+    def _object_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256)
+
+    def _read_entry(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def _write_entry(self, path, entry):
+        fd, temp_path = tempfile.mkstemp(dir=self.index_dir)
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.rename(temp_path, path)
+
+
+def _sha256(file_name):
+    digest = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), ""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _remove(path):
+    # another worker's eviction may have removed it first
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def _link_or_copy(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        shutil.copyfile(source, destination)
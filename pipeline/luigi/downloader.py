@@ -0,0 +1,337 @@
+"""
+Downloads of the pipeline's upstream source files.
+
+A download is written to <file>.part next to its destination, and renamed to
+the destination only after its size, and its MD5 checksum when one is given,
+have been verified, so a luigi target never exists half written. Progress is
+recorded in <file>.part.json, so a download interrupted by a dropped
+connection or a killed worker resumes where it stopped, unless the file
+changed upstream in the meantime.
+
+HTTP(S) servers that accept Range requests are fetched in CHUNK_SIZE chunks
+over several connections at once. Other HTTP servers are streamed to disk in
+one request. FTP downloads are one stream, resumed with REST.
+
+Given an artifact_cache.ArtifactCache, a download first asks the server for
+the file's version, its ETag or Last-Modified header or its FTP modification
+time, and links the cached copy of that version instead of downloading it
+again. Files whose server reports no version are always downloaded.
+"""
+import ftplib
+import hashlib
+import json
+import os
+import re
+import threading
+import urllib2
+import urlparse
+from Queue import Queue, Empty
+
+from retrying import retry
+
+CHUNK_SIZE = 16 * 1024 * 1024
+WORKERS = 4
+BLOCK_SIZE = 64 * 1024
+
+# attempts of each request, and milliseconds between them
+RETRIES = 5
+RETRY_WAIT_MS = 3000
+
+
+class DownloadError(Exception):
+    pass
+
+
+def download(url, file_name=None, md5=None, username=None, password=None,
+             workers=WORKERS, chunk_size=CHUNK_SIZE, cache=None):
+    """downloads url to file_name, by default its last path component in the
+    current directory, and returns file_name. raises DownloadError if the
+    download is incomplete or does not match md5. with an ArtifactCache as
+    cache, the current version of url is taken from and added to the cache"""
+    if file_name is None:
+        file_name = url.split('/')[-1]
+    scheme = urlparse.urlparse(url).scheme
+    if scheme not in ("ftp", "http", "https"):
+        raise DownloadError("unsupported url %s" % url)
+
+    if cache is not None:
+        (size, version) = _probe(url, username, password)
+        if version is not None and cache.fetch(url, version, size, file_name):
+            _verify(file_name, size, md5)
+            print "Using cached %s for %s" % (url, file_name)
+            return file_name
+
+    part = file_name + ".part"
+    if scheme == "ftp":
+        (size, version) = _ftp_download(url, part, username, password)
+    else:
+        (size, version) = _http_download(url, part, username, password, workers, chunk_size)
+
+    _verify(part, size, md5)
+    os.rename(part, file_name)
+    _remove(_state_path(part))
+    print "Finished downloading %s" % (file_name)
+    if cache is not None and version is not None:
+        cache.store(url, version, size, file_name)
+    return file_name
+
+
+def _probe(url, username, password):
+    """returns the size and version of url, either None if the server doesn't tell"""
+    if urlparse.urlparse(url).scheme == "ftp":
+        return _with_retries(_ftp_probe, url, username, password)
+    response = _with_retries(_opener(url, username, password).open,
+                             urllib2.Request(url, headers={"Range": "bytes=0-0"}))
+    response.close()
+    return (_http_size(response), _http_version(response.info()))
+
+
+def _with_retries(function, *args):
+    return retry(stop_max_attempt_number=RETRIES, wait_fixed=RETRY_WAIT_MS)(function)(*args)
+
+
+def _verify(part, size, md5):
+    actual_size = os.path.getsize(part)
+    if size is not None and actual_size != size:
+        raise DownloadError("downloaded %d of %d bytes of %s" % (actual_size, size, part))
+    if md5 is not None:
+        digest = hashlib.md5()
+        with open(part, "rb") as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), ""):
+                digest.update(block)
+        if digest.hexdigest() != md5.lower():
+            # the data is bad, so a rerun should start over
+            _remove(part)
+            _remove(_state_path(part))
+            raise DownloadError("MD5 of %s is %s, expected %s" % (part, digest.hexdigest(), md5))
+
+
+###################
+# Resumable state #
+###################
+
+
+def _state_path(part):
+    return part + ".json"
+
+
+def _load_state(part, source):
+    """returns the saved progress of part if it is of the same version of the
+    same source, otherwise None"""
+    try:
+        with open(_state_path(part)) as f:
+            state = json.load(f)
+    except (IOError, ValueError):
+        return None
+    if state.get("source") != source or not os.path.exists(part):
+        return None
+    return state
+
+
+def _save_state(part, state):
+    temp_path = _state_path(part) + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(state, f)
+    os.rename(temp_path, _state_path(part))
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+########
+# HTTP #
+########
+
+
+def _opener(url, username, password):
+    handlers = []
+    if username is not None:
+        passwords = urllib2.HTTPPasswordMgrWithDefaultRealm()
+        passwords.add_password(None, url, username, password)
+        handlers.append(urllib2.HTTPBasicAuthHandler(passwords))
+    return urllib2.build_opener(*handlers)
+
+
+def _http_size(response):
+    """returns the size of the file from the response to a request of its
+    first byte, None if the server doesn't tell"""
+    headers = response.info()
+    content_range = re.match(r"bytes 0-0/(\d+)$", headers.getheader("Content-Range") or "")
+    if response.code == 206 and content_range is not None:
+        return int(content_range.group(1))
+    length = headers.getheader("Content-Length")
+    if response.code == 200 and length is not None:
+        return int(length)
+    return None
+
+
+def _http_version(headers):
+    return headers.getheader("ETag") or headers.getheader("Last-Modified")
+
+
+def _http_download(url, part, username, password, workers, chunk_size):
+    """downloads url to part, returns its size and version"""
+    opener = _opener(url, username, password)
+    # asking for the first byte tells whether the server accepts ranges, and the size of the file
+    request = urllib2.Request(url, headers={"Range": "bytes=0-0"})
+    response = _with_retries(opener.open, request)
+    version = _http_version(response.info())
+    if response.code != 206:
+        print "Downloading: %s (no ranges)" % (url)
+        return (_http_stream(response, part), version)
+    response.close()
+
+    size = _http_size(response)
+    if size is None:
+        raise DownloadError("no size in the Content-Range of %s" % url)
+    source = {"url": url, "size": size, "chunk_size": chunk_size, "version": version}
+    state = _load_state(part, source)
+    if state is None:
+        state = {"source": source, "done": []}
+        with open(part, "wb") as f:
+            f.truncate(size)
+        _save_state(part, state)
+
+    n_chunks = max(1, (size + chunk_size - 1) // chunk_size)
+    pending = Queue()
+    for chunk in range(n_chunks):
+        if chunk not in state["done"]:
+            pending.put(chunk)
+    print "Downloading: %s Bytes: %d, %d of %d chunks left" % (url, size, pending.qsize(), n_chunks)
+
+    lock = threading.Lock()
+    errors = []
+
+    # a chunk that keeps failing doesn't stop the others, so a rerun has less to fetch
+    def fetch_chunks():
+        while True:
+            try:
+                chunk = pending.get_nowait()
+            except Empty:
+                return
+            start = chunk * chunk_size
+            end = min(size, start + chunk_size) - 1
+            try:
+                _with_retries(_http_fetch_range, opener, url, part, start, end)
+            except Exception as e:
+                errors.append(e)
+                continue
+            with lock:
+                state["done"].append(chunk)
+                _save_state(part, state)
+                print "%s: %d of %d chunks" % (os.path.basename(part), len(state["done"]), n_chunks)
+
+    threads = [threading.Thread(target=fetch_chunks) for i in range(min(workers, n_chunks))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise DownloadError("downloading %d chunks of %s failed, rerun to resume: %s" % (len(errors), url, errors[0]))
+    return (size, version)
+
+
+def _http_fetch_range(opener, url, part, start, end):
+    request = urllib2.Request(url, headers={"Range": "bytes=%d-%d" % (start, end)})
+    response = opener.open(request)
+    if response.code != 206:
+        raise DownloadError("server ignored the range %d-%d of %s" % (start, end, url))
+    with open(part, "r+b") as f:
+        f.seek(start)
+        received = 0
+        while True:
+            block = response.read(BLOCK_SIZE)
+            if not block:
+                break
+            f.write(block[:end + 1 - start - received])
+            received += len(block)
+    if received != end + 1 - start:
+        raise DownloadError("received %d of %d bytes at %d of %s" % (received, end + 1 - start, start, url))
+
+
+def _http_stream(response, part):
+    """writes a whole response to part, returns its size if the server sent it"""
+    _remove(_state_path(part))
+    length = response.info().getheader("Content-Length")
+    with open(part, "wb") as f:
+        while True:
+            block = response.read(BLOCK_SIZE)
+            if not block:
+                break
+            f.write(block)
+    return int(length) if length is not None else None
+
+
+#######
+# FTP #
+#######
+
+
+def _ftp_download(url, part, username, password):
+    """downloads url to part, returns its size and version"""
+    return _with_retries(_ftp_attempt, url, part, username, password)
+
+
+def _ftp_connect(url, username, password):
+    """returns an FTP connection in binary mode, and the path of url"""
+    parsed = urlparse.urlparse(url)
+    ftp = ftplib.FTP()
+    ftp.connect(parsed.hostname, parsed.port or ftplib.FTP_PORT)
+    try:
+        ftp.login(username or "anonymous", password or "")
+        ftp.voidcmd("TYPE I")
+    except Exception:
+        ftp.close()
+        raise
+    return (ftp, urllib2.unquote(parsed.path))
+
+
+def _ftp_quit(ftp):
+    try:
+        ftp.quit()
+    except Exception:
+        ftp.close()
+
+
+def _ftp_source(ftp, path):
+    """returns the size and modification time of path, either None if the server doesn't tell"""
+    try:
+        size = ftp.size(path)
+    except ftplib.error_perm:
+        size = None
+    try:
+        version = ftp.sendcmd("MDTM " + path)
+    except ftplib.error_perm:
+        version = None
+    return (size, version)
+
+
+def _ftp_probe(url, username, password):
+    (ftp, path) = _ftp_connect(url, username, password)
+    try:
+        return _ftp_source(ftp, path)
+    finally:
+        _ftp_quit(ftp)
+
+
+def _ftp_attempt(url, part, username, password):
+    (ftp, path) = _ftp_connect(url, username, password)
+    try:
+        (size, version) = _ftp_source(ftp, path)
+        source = {"url": url, "size": size, "version": version}
+        offset = 0
+        if _load_state(part, source) is not None:
+            offset = os.path.getsize(part)
+        if offset == 0 or (size is not None and offset > size):
+            offset = 0
+            open(part, "wb").close()
+            _save_state(part, {"source": source})
+        print "Downloading: %s Bytes: %s, resuming at %d" % (url, size, offset)
+        with open(part, "ab") as f:
+            if size is None or offset < size:
+                ftp.retrbinary("RETR " + path, f.write, BLOCK_SIZE, offset or None)
+    finally:
+        _ftp_quit(ftp)
+    return (size, version)
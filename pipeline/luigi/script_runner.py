@@ -0,0 +1,93 @@
+"""
+Runs the pipeline's python scripts in a fork of the luigi worker instead of a
+new interpreter.
+
+Starting python and importing pyhgvs, hgvs, pygr and Bio again for each of
+the pipeline's scripts costs more than many of the scripts themselves. The
+worker imports those libraries once, and each script then runs in a forked
+child as if started with `python script.py args...`: as __main__, with
+sys.argv set and its directory first on sys.path. The child has its own copy
+of the worker's modules, so a script can't leave globals or imports behind
+for the next one, and its stdout and stderr file descriptors are redirected
+so output of C extensions is captured too.
+"""
+import os
+import runpy
+import sys
+import tempfile
+import traceback
+
+# slow to import libraries used by the scripts, loaded once before forking
+PRELOADED_MODULES = ["Bio", "hgvs", "hgvs.parser", "hgvs.dataproviders.uta", "hgvs.variantmapper",
+                     "pyhgvs", "pyhgvs.utils", "pygr.seqdb", "pandas"]
+
+_preloaded = False
+
+
+def preload():
+    """imports the PRELOADED_MODULES that are installed"""
+    global _preloaded
+    if _preloaded:
+        return
+    for module in PRELOADED_MODULES:
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+    _preloaded = True
+
+
+def run_script(script, argv):
+    """runs script as __main__ with arguments argv in this process, returns its exit status"""
+    sys.argv = [script] + list(argv)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        print >>sys.stderr, e.code
+        return 1
+    return 0
+
+
+def run_forked(script, argv, stdout=None):
+    """runs script with arguments argv in a forked child from the current
+    directory. stdout is a file for the script's standard output, which is
+    captured otherwise. returns (exit status, captured output, error output)"""
+    preload()
+    out_file = stdout if stdout is not None else tempfile.TemporaryFile()
+    err_file = tempfile.TemporaryFile()
+    # anything still buffered would be written again by the child
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.dup2(out_file.fileno(), 1)
+            os.dup2(err_file.fileno(), 2)
+            status = run_script(script, argv)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    (pid, status) = os.waitpid(pid, 0)
+    if os.WIFSIGNALED(status):
+        status = -os.WTERMSIG(status)
+    else:
+        status = os.WEXITSTATUS(status)
+    out = None
+    if stdout is None:
+        out_file.seek(0)
+        out = out_file.read()
+        out_file.close()
+    err_file.seek(0)
+    err = err_file.read()
+    err_file.close()
+    return (status, out, err)
@@ -0,0 +1,199 @@
+"""
+Runs a source's chain of extract, concatenate, liftover and sort commands as
+one streaming pipeline instead of one task per intermediate file.
+
+The sources' commands run one after the other and their VCF output is
+concatenated like vcf-concat does, keeping the header of the first only. The
+result is piped through the steps' commands in turn, and only the last one's
+output is written, to <output>.tmp, which is renamed to the output once every
+command has succeeded. Between commands data passes through OS pipes, so at
+most a pipe buffer of each intermediate is held at once.
+
+A command that only reads or writes named files gets INPUT and OUTPUT in its
+arguments. INPUT is replaced by /dev/stdin, and OUTPUT by a link to
+/dev/stdout in a temporary directory, so files the command writes next to its
+output (like CrossMap's .unmap) are moved to work_dir afterwards. With spill,
+each command's output is also written to work_dir under the command's name,
+like the files of the staged tasks, for debugging.
+"""
+import errno
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+
+INPUT = "{input}"
+OUTPUT = "{output}"
+
+BLOCK_SIZE = 64 * 1024
+
+
+class ChainError(Exception):
+    pass
+
+
+class Step(object):
+    """a command in a chain, name is the file its output would be in"""
+
+    def __init__(self, name, args, cwd=None):
+        self.name = name
+        self.args = args
+        self.cwd = cwd
+
+
+def run_chain(sources, steps, output_path, work_dir, spill=False):
+    """concatenates the VCF output of the sources' commands, pipes it through
+    the steps' commands into output_path. raises ChainError if any fails"""
+    link_dir = tempfile.mkdtemp(dir=work_dir)
+    temp_output = output_path + ".tmp"
+    processes = []
+    threads = []
+    errors = []
+    try:
+        with open(temp_output, "wb") as output:
+            for i, step in enumerate(steps):
+                last = i == len(steps) - 1
+                if i == 0 or spill:
+                    stdin = subprocess.PIPE
+                else:
+                    stdin = processes[-1][1].stdout
+                processes.append((step, _start(step, link_dir, stdin, output if last else subprocess.PIPE)))
+                if stdin is not subprocess.PIPE:
+                    # only the step reading it may hold the pipe open
+                    stdin.close()
+
+            if spill:
+                for i, (step, process) in enumerate(processes[:-1]):
+                    threads.append(_copier(process.stdout, processes[i + 1][1].stdin,
+                                           os.path.join(work_dir, step.name), errors))
+            sink = processes[0][1].stdin if processes else output
+            concatenation = threading.Thread(target=_concatenate,
+                                             args=(sources, sink, link_dir, work_dir, spill, processes, errors))
+            concatenation.start()
+            threads.append(concatenation)
+            for thread in threads:
+                thread.join()
+            for step, process in processes:
+                process.wait()
+                _check(step, process, errors)
+        if errors:
+            raise ChainError("; ".join(errors))
+        os.rename(temp_output, output_path)
+    finally:
+        for step, process in processes:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        if os.path.exists(temp_output):
+            os.remove(temp_output)
+        _collect_side_files(link_dir, work_dir, sources + steps)
+
+
+def _start(step, link_dir, stdin, stdout):
+    args = []
+    for arg in step.args:
+        if arg == INPUT:
+            arg = "/dev/stdin"
+        elif arg == OUTPUT:
+            arg = os.path.join(link_dir, step.name)
+            if not os.path.lexists(arg):
+                os.symlink("/dev/stdout", arg)
+        args.append(arg)
+    print "Running %s with the following args: %s" % (step.name, args)
+    error_file = tempfile.TemporaryFile()
+    process = subprocess.Popen(args, stdin=stdin, stdout=stdout, stderr=error_file,
+                               cwd=step.cwd, preexec_fn=_default_sigpipe)
+    process.error_file = error_file
+    return process
+
+
+def _default_sigpipe():
+    # like a shell pipeline, a command whose reader has failed stops
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+
+def _check(step, process, errors):
+    process.error_file.seek(0)
+    err = process.error_file.read()
+    process.error_file.close()
+    if err:
+        print "standard error of %s:" % (step.name)
+        print err
+    if process.returncode != 0:
+        errors.append("%s exited with %d" % (step.name, process.returncode))
+        return False
+    return True
+
+
+def _copier(source, destination, spill_path, errors):
+    """starts a thread copying source to destination and spill_path"""
+    def copy():
+        with open(spill_path, "wb") as spill_file:
+            try:
+                for block in iter(lambda: source.read(BLOCK_SIZE), ""):
+                    spill_file.write(block)
+                    destination.write(block)
+            except IOError as e:
+                if e.errno != errno.EPIPE:
+                    errors.append("copying %s: %s" % (spill_path, e))
+            finally:
+                source.close()
+                _close(destination)
+    thread = threading.Thread(target=copy)
+    thread.start()
+    return thread
+
+
+def _concatenate(sources, sink, link_dir, work_dir, spill, processes, errors):
+    try:
+        for i, source in enumerate(sources):
+            with open(os.devnull) as devnull:
+                process = _start(source, link_dir, devnull, subprocess.PIPE)
+            spill_file = open(os.path.join(work_dir, source.name), "wb") if spill else None
+            finished = False
+            try:
+                for line in process.stdout:
+                    if spill_file is not None:
+                        spill_file.write(line)
+                    if i == 0 or not line.startswith("#"):
+                        sink.write(line)
+                finished = True
+            finally:
+                process.stdout.close()
+                if spill_file is not None:
+                    spill_file.close()
+                if not finished and process.poll() is None:
+                    # the steps have stopped reading
+                    process.kill()
+                process.wait()
+            if not _check(source, process, errors):
+                break
+    except IOError as e:
+        if e.errno != errno.EPIPE:
+            errors.append("concatenating: %s" % e)
+    finally:
+        if processes:
+            _close(sink)
+
+
+def _close(f):
+    try:
+        f.close()
+    except IOError as e:
+        if e.errno != errno.EPIPE:
+            raise
+
+
+def _collect_side_files(link_dir, work_dir, steps):
+    links = set(step.name for step in steps)
+    for name in os.listdir(link_dir):
+        path = os.path.join(link_dir, name)
+        if name in links and os.path.islink(path):
+            continue
+        destination = os.path.join(work_dir, name)
+        if os.path.exists(destination):
+            os.remove(destination)
+        shutil.move(path, destination)
+    shutil.rmtree(link_dir)
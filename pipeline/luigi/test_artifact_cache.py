@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from artifact_cache import ArtifactCache
+
+
+class TestArtifactCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.dir, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_fetch_links_stored_version(self):
+        cache = ArtifactCache(self.cache_dir)
+        cache.store("ftp://host/a.vcf.gz", "213 1", 4, self.write("a.vcf.gz", "abcd"))
+        destination = os.path.join(self.dir, "run", "a.vcf.gz")
+        os.makedirs(os.path.dirname(destination))
+        self.assertTrue(cache.fetch("ftp://host/a.vcf.gz", "213 1", 4, destination))
+        self.assertEqual(self.read(destination), "abcd")
+        self.assertEqual(os.stat(destination).st_ino, os.stat(os.path.join(self.dir, "a.vcf.gz")).st_ino)
+        self.assertFalse(cache.fetch("ftp://host/a.vcf.gz", "213 2", 4, destination))
+        self.assertFalse(cache.fetch("ftp://host/b.vcf.gz", "213 1", 4, destination))
+
+    def test_same_content_is_stored_once(self):
+        cache = ArtifactCache(self.cache_dir)
+        cache.store("http://host/a", '"1"', 4, self.write("a", "abcd"))
+        cache.store("http://mirror/a", '"x"', 4, self.write("b", "abcd"))
+        self.assertEqual(len(os.listdir(os.path.join(self.cache_dir, "objects"))), 1)
+        self.assertTrue(cache.fetch("http://mirror/a", '"x"', 4, os.path.join(self.dir, "c")))
+
+    def test_evicts_least_recently_used_beyond_max_bytes(self):
+        cache = ArtifactCache(self.cache_dir, max_bytes=8)
+        cache.store("http://host/a", '"1"', 4, self.write("a", "aaaa"))
+        cache.store("http://host/b", '"1"', 4, self.write("b", "bbbb"))
+        self.assertTrue(cache.fetch("http://host/a", '"1"', 4, os.path.join(self.dir, "a2")))
+        cache.store("http://host/c", '"1"', 4, self.write("c", "cccc"))
+        self.assertFalse(cache.fetch("http://host/b", '"1"', 4, os.path.join(self.dir, "b2")))
+        self.assertTrue(cache.fetch("http://host/a", '"1"', 4, os.path.join(self.dir, "a3")))
+        self.assertTrue(cache.fetch("http://host/c", '"1"', 4, os.path.join(self.dir, "c2")))
+        # the linked copy outlives the evicted object
+        self.assertEqual(self.read(os.path.join(self.dir, "b")), "bbbb")
+
+    def test_evicts_unused_for_max_age_days(self):
+        cache = ArtifactCache(self.cache_dir, max_age_days=30)
+        cache.store("http://host/a", '"1"', 4, self.write("a", "aaaa"))
+        cache.evict(now=time.time() + 29 * 24 * 60 * 60)
+        self.assertEqual(len(os.listdir(os.path.join(self.cache_dir, "objects"))), 1)
+        cache.evict(now=time.time() + 31 * 24 * 60 * 60)
+        self.assertEqual(os.listdir(os.path.join(self.cache_dir, "objects")), [])
+        self.assertEqual(os.listdir(os.path.join(self.cache_dir, "index")), [])
+
+
+    def test_evict_keeps_objects_another_worker_is_storing(self):
+        cache = ArtifactCache(self.cache_dir)
+        staged = self.write("cache/tmp/tmpXYZ", "abcd")
+        unindexed = self.write("cache/objects/" + "0" * 64, "abcd")
+        cache.evict()
+        self.assertTrue(os.path.exists(staged))
+        self.assertTrue(os.path.exists(unindexed))
+        cache.evict(now=time.time() + 2 * 24 * 60 * 60)
+        self.assertFalse(os.path.exists(staged))
+        self.assertFalse(os.path.exists(unindexed))
+
+    def test_fetch_misses_an_object_evicted_by_another_worker(self):
+        cache = ArtifactCache(self.cache_dir)
+        cache.store("http://host/a", '"1"', 4, self.write("a", "aaaa"))
+        objects_dir = os.path.join(self.cache_dir, "objects")
+        for name in os.listdir(objects_dir):
+            os.remove(os.path.join(objects_dir, name))
+        destination = self.write("a2", "partial")
+        self.assertFalse(cache.fetch("http://host/a", '"1"', 4, destination))
+        self.assertEqual(self.read(destination), "partial")
+        self.assertEqual(os.listdir(os.path.join(self.cache_dir, "index")), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import BaseHTTPServer
+import hashlib
+import os
+import random
+import re
+import shutil
+import SocketServer
+import tempfile
+import threading
+import unittest
+
+import downloader
+from artifact_cache import ArtifactCache
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """serves server.payload, honouring ranges if server.ranges, and dropping
+    the connection halfway through ranges starting in server.fail_starts"""
+
+    def do_GET(self):
+        server = self.server
+        byte_range = self.headers.getheader("Range")
+        with server.lock:
+            server.requests.append(byte_range)
+        data = server.payload
+        if byte_range is None or not server.ranges:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        start, end = [int(i) for i in re.match(r"bytes=(\d+)-(\d+)$", byte_range).groups()]
+        end = min(end, len(data) - 1)
+        body = data[start:end + 1]
+        self.send_response(206)
+        self.send_header("Content-Range", "bytes %d-%d/%d" % (start, end, len(data)))
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", server.etag)
+        self.end_headers()
+        with server.lock:
+            fail = start in server.fail_starts
+            if start in server.fail_once:
+                server.fail_once.remove(start)
+                fail = True
+        if fail:
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = 1
+            return
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class TestDownloader(unittest.TestCase):
+
+    def setUp(self):
+        self.retries = (downloader.RETRIES, downloader.RETRY_WAIT_MS)
+        downloader.RETRIES = 2
+        downloader.RETRY_WAIT_MS = 0
+        self.dir = tempfile.mkdtemp()
+        self.server = StandInServer(("127.0.0.1", 0), StandInHandler)
+        self.server.payload = "".join(chr(random.Random(1).randint(0, 255)) for i in range(1000)) * 100
+        self.server.ranges = True
+        self.server.etag = '"1"'
+        self.server.fail_starts = set()
+        self.server.fail_once = set()
+        self.server.requests = []
+        self.server.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = "http://127.0.0.1:%d/data/source.vcf.gz" % self.server.server_address[1]
+        self.path = os.path.join(self.dir, "source.vcf.gz")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+        downloader.RETRIES, downloader.RETRY_WAIT_MS = self.retries
+
+    def download(self, **kwargs):
+        return downloader.download(self.url, self.path, chunk_size=10000, workers=3, **kwargs)
+
+    def downloaded(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def test_parallel_chunks(self):
+        self.download(md5=hashlib.md5(self.server.payload).hexdigest())
+        self.assertEqual(self.downloaded(), self.server.payload)
+        self.assertEqual(len(self.server.requests), 11)
+        self.assertEqual(os.listdir(self.dir), ["source.vcf.gz"])
+
+    def test_dropped_connection_is_retried(self):
+        self.server.fail_once = set([30000, 70000])
+        self.download()
+        self.assertEqual(self.downloaded(), self.server.payload)
+        self.assertEqual(self.server.requests.count("bytes=30000-39999"), 2)
+
+    def test_resume_after_interruption(self):
+        self.server.fail_starts = set([30000])
+        with self.assertRaises(downloader.DownloadError):
+            self.download()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertTrue(os.path.exists(self.path + ".part"))
+
+        # only the missing chunk is fetched again
+        self.server.fail_starts = set()
+        self.server.requests = []
+        self.download()
+        self.assertEqual(self.downloaded(), self.server.payload)
+        self.assertEqual(self.server.requests, ["bytes=0-0", "bytes=30000-39999"])
+
+    def test_changed_source_starts_over(self):
+        self.server.fail_starts = set([30000])
+        with self.assertRaises(downloader.DownloadError):
+            self.download()
+        self.server.fail_starts = set()
+        self.server.payload = self.server.payload[::-1]
+        self.server.etag = '"2"'
+        self.server.requests = []
+        self.download()
+        self.assertEqual(self.downloaded(), self.server.payload)
+        self.assertEqual(len(self.server.requests), 11)
+
+    def test_server_without_ranges(self):
+        self.server.ranges = False
+        self.download()
+        self.assertEqual(self.downloaded(), self.server.payload)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_checksum_mismatch(self):
+        with self.assertRaises(downloader.DownloadError):
+            self.download(md5="0" * 32)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_cached_version_is_linked(self):
+        cache = ArtifactCache(os.path.join(self.dir, "cache"))
+        self.download(cache=cache)
+        os.remove(self.path)
+        self.server.requests = []
+        self.download(cache=cache)
+        self.assertEqual(self.downloaded(), self.server.payload)
+        self.assertEqual(self.server.requests, ["bytes=0-0"])
+        self.assertEqual(os.stat(self.path).st_nlink, 2)
+
+    def test_changed_version_is_downloaded(self):
+        cache = ArtifactCache(os.path.join(self.dir, "cache"))
+        self.download(cache=cache)
+        self.server.payload = self.server.payload[::-1]
+        self.server.etag = '"2"'
+        self.server.requests = []
+        self.download(cache=cache)
+        self.assertEqual(self.downloaded(), self.server.payload)
+        self.assertEqual(len(self.server.requests), 12)
+
+    def test_unversioned_source_is_not_cached(self):
+        self.server.ranges = False
+        cache = ArtifactCache(os.path.join(self.dir, "cache"))
+        self.download(cache=cache)
+        self.download(cache=cache)
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(os.listdir(os.path.join(self.dir, "cache", "objects")), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import stream_chain
+from stream_chain import INPUT, OUTPUT, Step
+
+BRCA2 = "##fileformat=VCFv4.1\n#CHROM\tPOS\n13\t32889617\n13\t32889700\n"
+BRCA1 = "##fileformat=VCFv4.1\n#CHROM\tPOS\n17\t41196400\n17\t41196312\n"
+
+# writes its input file to its output file, and an .unmap file next to it, like CrossMap
+COPY_WITH_SIDE_FILE = ("import sys\n"
+                       "data = open(sys.argv[1]).read()\n"
+                       "open(sys.argv[2], 'w').write(data)\n"
+                       "open(sys.argv[2] + '.unmap', 'w').write('unmapped')\n")
+
+
+class TestStreamChain(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.dir, "brca12.sorted.vcf")
+        self.sources = [Step("brca2.vcf", ["printf", BRCA2.replace("%", "%%")]),
+                        Step("brca1.vcf", ["printf", BRCA1.replace("%", "%%")])]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self, name):
+        with open(os.path.join(self.dir, name)) as f:
+            return f.read()
+
+    def test_concatenates_sources(self):
+        stream_chain.run_chain(self.sources, [], self.output, self.dir)
+        self.assertEqual(self.read("brca12.sorted.vcf"), BRCA2 + "17\t41196400\n17\t41196312\n")
+        self.assertEqual(os.listdir(self.dir), ["brca12.sorted.vcf"])
+
+    def test_pipes_through_steps(self):
+        steps = [Step("brca12.hg38.vcf", [sys.executable, "-c", COPY_WITH_SIDE_FILE, INPUT, OUTPUT]),
+                 Step("brca12.sorted.vcf", ["sort"])]
+        stream_chain.run_chain(self.sources, steps, self.output, self.dir)
+        self.assertEqual(self.read("brca12.sorted.vcf"),
+                         "".join(sorted((BRCA2 + "17\t41196400\n17\t41196312\n").splitlines(True))))
+        self.assertEqual(sorted(os.listdir(self.dir)), ["brca12.hg38.vcf.unmap", "brca12.sorted.vcf"])
+        self.assertEqual(self.read("brca12.hg38.vcf.unmap"), "unmapped")
+
+    def test_spill_writes_intermediates(self):
+        steps = [Step("brca12.hg38.vcf", ["cat"]), Step("brca12.sorted.vcf", ["sort"])]
+        stream_chain.run_chain(self.sources, steps, self.output, self.dir, spill=True)
+        self.assertEqual(self.read("brca2.vcf"), BRCA2)
+        self.assertEqual(self.read("brca1.vcf"), BRCA1)
+        self.assertEqual(self.read("brca12.hg38.vcf"), BRCA2 + "17\t41196400\n17\t41196312\n")
+
+    def test_failing_step_leaves_no_output(self):
+        steps = [Step("brca12.hg38.vcf", ["false"]), Step("brca12.sorted.vcf", ["sort"])]
+        with self.assertRaises(stream_chain.ChainError):
+            stream_chain.run_chain(self.sources, steps, self.output, self.dir)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_failing_source_leaves_no_output(self):
+        self.sources[1] = Step("brca1.vcf", ["false"])
+        with self.assertRaises(stream_chain.ChainError):
+            stream_chain.run_chain(self.sources, [Step("brca12.sorted.vcf", ["sort"])], self.output, self.dir)
+        self.assertEqual(os.listdir(self.dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
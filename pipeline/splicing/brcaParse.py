@@ -7,6 +7,10 @@ import re
 import subprocess
 import argparse
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "data_merging"))
+import reference_regions
 
 #NOTE: subprocess, popen(part of subprocess) for script output capture,  
 ######################################################################
@@ -35,16 +39,13 @@ class brcaParse:
         labels = rawLabels.split("\t")
 
         #imports the sequence for BRCA1/2 into the program for use.
-        self.BRCA1hg38Seq = open("brca1_hg38.txt", "r").read()
-        self.BRCA1hg38Start = 43000000
+        (self.BRCA1, self.BRCA2) = reference_regions.brca_references(".")
 
-        self.BRCA2hg38Seq = open("brca2_hg38.txt", "r").read()
-        self.BRCA2hg38Start = 32300000
+        self.BRCA1hg38Seq = self.BRCA1["hg38"]["sequence"]
+        self.BRCA1hg38Start = self.BRCA1["hg38"]["start"]
 
-        self.BRCA1 = {"hg38": {"start": 43000000, "sequence": open("brca1_hg38.txt", "r").read()},
-                      "hg19": {"start": 41100000, "sequence": open("brca1_hg19.txt", "r").read()}}
-        self.BRCA2 = {"hg38": {"start": 32300000, "sequence": open("brca2_hg38.txt", "r").read()},
-                      "hg19": {"start": 32800000, "sequence": open("brca2_hg19.txt", "r").read()}}
+        self.BRCA2hg38Seq = self.BRCA2["hg38"]["sequence"]
+        self.BRCA2hg38Start = self.BRCA2["hg38"]["start"]
 
         #remane for better understanding!!!!
         # finds column in matrix associated with header label
@@ -7,9 +7,13 @@ and passed in as input_dir
 
 """
 
-import vcf
 import argparse
+import os
 import pdb
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "data_merging"))
+import sites_vcf
 
 SOURCE_FILES = {
                 '10KG13': 'chr13_brca2_1000g_GRCh37.vcf',
@@ -104,7 +108,7 @@ def has_n(input_to_check):
 
 def check_for_n_with_vcf_reader(args, source):
     ns = ''
-    vcf_reader = vcf.Reader(open(args.input_dir + SOURCE_FILES[source], 'r'))
+    vcf_reader = sites_vcf.Reader(open(args.input_dir + SOURCE_FILES[source], 'r'))
     for variant in vcf_reader:
         if has_n(variant.REF) or has_n(variant.ALT):
             print 'found'
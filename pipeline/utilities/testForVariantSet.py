@@ -5,9 +5,9 @@ import csv
 import os
 import re
 import sys
-# Ideally, I'd import BRCA1 and BRCA2 from variant_merging.py instead of copying it,
-# but when I tried this, somehow it messed up my argument parsing.
-#from variant_merging import BRCA1, BRCA2  
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "data_merging"))
+import reference_regions
 
 
 def variantToAllele(variant, gene, length):
@@ -72,18 +72,7 @@ def main():
                         help="determines logging")
     args = argparser.parse_args()
 
-    #
-    # This is copied verbatim from variant_merging.py.  I don't like doing this, but
-    # my more sophisticated attempts to import the data left me with messed-up
-    # argument parsing.
-    BRCA1 = {"hg38": {"start": 43000000,
-                      "sequence": open(args.reference + "brca1_hg38.txt", "r").read()},
-             "hg19": {"start": 41100000,
-                      "sequence": open(args.reference + "brca1_hg19.txt", "r").read()}}
-    BRCA2 = {"hg38": {"start": 32300000,
-                      "sequence": open(args.reference + "brca2_hg38.txt", "r").read()},
-             "hg19": {"start": 32800000,
-                      "sequence": open(args.reference + "brca2_hg19.txt", "r").read()}}
+    (BRCA1, BRCA2) = reference_regions.brca_references(args.reference)
     
     outputVariantData = allelesForOutputVariants(args.dataset, args.reference, args.length+5, 
                                                  BRCA1, BRCA2)
@@ -2,19 +2,21 @@
 
 import argparse
 import glob
-import pysam
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "pipeline", "data_merging"))
+from variant_normalization import VariantNormalizer
 
 
 """
-    improved algorithm for comparing two variants:
-    if different chromosome? different variant
-    if position of two variants is more than 300 bp apart? different variant
-    if:
-        restore the common sequence between the two variants (e.g. start with earlier variant ending with later variant)
-        compare the common sequence, if different: different variant
-    else: same variant
-
-    result:
+    two variants are the same if applying them to the reference gives the
+    same sequence. Every variant is reduced to its canonical key, the edit
+    left-aligned and trimmed against the reference, so the same variants
+    have the same key. The keys of all databases are grouped once, and the
+    overlap of every pair of databases is counted from the groups.
+
+    result, of an earlier comparison of pairs of variants at most 300 bp apart:
 unique variants in ClinVar:6062
 overlap between the ClinVar and ex_LOVD: 274
 overlap between the ClinVar and LOVD: 1766
@@ -90,112 +92,61 @@ def main():
                         default=VCF_PATH)
     args = parser.parse_args()
     chr13 = open(args.config + "/brca2.txt", "r")
-    brca2_genomic_seq = chr13.read()
+    brca2_genomic_seq = chr13.read().strip()
     chr17 = open(args.config + "/brca1.txt", "r")
-    brca1_genomic_seq = chr17.read()
-    databases = get_databases(args.vcf, brca1_genomic_seq, brca2_genomic_seq)
+    brca1_genomic_seq = chr17.read().strip()
+    normalizer = VariantNormalizer({"13": (BRCA2_START, brca2_genomic_seq),
+                                    "17": (BRCA1_START, brca1_genomic_seq)})
+    databases = get_databases(args.vcf)
+    (unique, overlap) = get_overlap_matrix(databases, normalizer)
     for key in databases.keys():
-        print_variant_size(databases[key], key)
+        print_variant_size(unique[key], key)
         for key2 in databases.keys():
             if key != key2:
-                get_overlap(key, key2, databases, brca1_genomic_seq, 
-                            brca2_genomic_seq)
+                print "overlap between the %s and %s: %d" %(key, key2, overlap[key][key2])
         print ""
 
-def get_databases(path, brca1_genomic_seq, brca2_genomic_seq):
+def get_databases(path):
     db = {}
     files = glob.glob(path + "*.vcf")
     for file in files:
         db_name = file.split(".")[0].split("/")[-1]
-        db[db_name] = get_unique_variants(file, brca1_genomic_seq,
-                                          brca2_genomic_seq)
+        db[db_name] = get_variants(file)
     return db
 
-def print_variant_size(database, database_name):
-    print "unique variants in %s:%d" %(database_name, len(database))
-
-def get_overlap(name_db1, name_db2, database, brca1_genomic_seq, 
-                brca2_genomic_seq):
-    num_overlap = 0
-    num_variant = 0
-    for variant in database[name_db1]:
-        num_variant += 1
-        if check_variant_exist(variant, database[name_db2], brca1_genomic_seq,
-                               brca2_genomic_seq) == True:
-            num_overlap += 1
-    print "overlap between the %s and %s: %d" %(name_db1, name_db2, num_overlap)
-
-
-def get_unique_variants(filename, brca1_genomic_seq, brca2_genomic_seq):
-    varFile = open(filename, "r")
+def print_variant_size(num_variants, database_name):
+    print "unique variants in %s:%d" %(database_name, num_variants)
+
+def get_overlap_matrix(databases, normalizer):
+    """returns the number of unique variants in each database, and
+    {db1: {db2: n}} where n variants of db1 are also in db2"""
+    # canonical key -> names of the databases with the variant
+    key_databases = {}
+    for name, variants in databases.iteritems():
+        for key in normalizer.group_equivalent(variants):
+            key_databases.setdefault(key, set()).add(name)
+
+    unique = dict((name, 0) for name in databases)
+    overlap = dict((name, dict((name2, 0) for name2 in databases)) for name in databases)
+    for names in key_databases.itervalues():
+        for name in names:
+            unique[name] += 1
+            for name2 in names:
+                if name2 != name:
+                    overlap[name][name2] += 1
+    return (unique, overlap)
+
+def get_variants(filename):
+    # the files are tab separated chr, pos, ref and alt columns without a
+    # header, one (chr, pos, ref, alt) per alt allele of each line
     variants = []
-    line_num = 0
-    for line in varFile:
-        line_num += 1
-        print line_num, filename
-        this_variant = line.strip().split("\t")[:4]
-        alt = this_variant[-1]
-        if "," in alt:
-            alts = alt.split(",")
-            for each_alt in alts:
-                branch_variant = this_variant[0:3] + [each_alt]
-                if not check_variant_exist(branch_variant, variants,
-                                           brca1_genomic_seq,
-                                           brca2_genomic_seq):
-                    variants.append(branch_variant)
-        else:
-            if not check_variant_exist(this_variant, variants, 
-                                       brca1_genomic_seq,
-                                       brca2_genomic_seq):
-                variants.append(this_variant)
+    for line in open(filename, "r"):
+        if not line.strip():
+            continue
+        (chr, pos, ref, alt) = line.strip().split("\t")[:4]
+        for each_alt in alt.split(","):
+            variants.append((chr, pos, ref, each_alt))
     return variants
 
-def check_variant_exist(v, variants, brca1_genomic_seq, brca2_genomic_seq):
-    for variant in variants:
-        ### only run the comparison algorithm if two variants are different
-        ### if they are the same, no need to restore the sequence ot compare
-        if v == variant:
-            return True
-        elif variant_pair_same(v, variant, brca1_genomic_seq, 
-                               brca2_genomic_seq):
-            return True
-    return False
-
-def variant_pair_same(v1, v2, brca1_genomic_seq, brca2_genomic_seq):
-    chr1, pos1, ref1, alt1 = v1
-    chr2, pos2, ref2, alt2 = v2
-    if chr1 != chr2:
-        return False
-    pos1 = int(pos1)
-    pos2 = int(pos2)
-    # make sure that v1 is upstream of v2
-    if pos1 > pos2:
-        return variant_pair_same(v2, v1, brca1_genomic_seq, brca2_genomic_seq)
-
-    # include the length of "alt" or "ref" of downstream variant in distance between two variants
-    # v1: -------AT--------------
-    # v2: ---------------CCG-----
-    # the common sequence should include the section from A to G
-    distance = max(pos2 - pos1 + max(len(ref2), len(alt2)),
-                   max(len(ref1), len(alt1)))
-    if distance > 300:
-        return False
-
-    # replace vcf ref string with alt string
-    if chr1 == "13":
-        brca_string = brca2_genomic_seq
-        brca_start = BRCA2_START
-    elif chr1 == "17":
-        brca_string = brca1_genomic_seq
-        brca_start = BRCA1_START
-
-    ref = brca_string[pos1-1-brca_start:pos1-1-brca_start+distance]
-    edited_v1 = alt1 + ref[len(ref1):]
-    try:
-        edited_v2 = ref[:(pos2-pos1)] + alt2 + ref[(pos2-pos1+len(ref2))]
-    except IndexError:
-        edited_v2 = ref[:(pos2-pos1)] + alt2
-    return edited_v1 == edited_v2
-
 if __name__ == "__main__":
     main()